@@ -1,11 +1,33 @@
 #!/usr/bin/env python3
 # Agentic 2.0 — Micro Plugin Skeleton (final single-file)
-# - Fail-closed Policy: allowlist + max_steps/sec + per-tool budgets
+# - Fail-closed Policy: allowlist + max_steps/sec + per-tool budgets + max_parallel
 # - Verifier: evidence required + min_coverage + min_sources + task-specific shape checks
-# - Audit: append-only hash chain (SHA256 or HMAC), fsync per event, key_id, close()
+# - Audit: append-only hash chain (SHA256 or HMAC), key_id, close()
+#   durability: per_event fsync (default) | group_commit (+ sync() barrier) | fdatasync (+ preallocate)
+#   writer: inline (default) | thread (achtergrond-writer met begrensde queue, drain in close())
+#   index_every: checkpoint-sidecar (.idx) voor verify_range() en resume() in O(K)
+#   merkle_every: periodieke merkle.root events, inclusion proofs, parallelle verify_merkle()
 # - Plugins: legacy_subprocess (stdin/stdout JSON), meta_http (HTTP JSON) with timeouts & trimmed errors
-# - Tools: registry + @tool sugar; plugins exposed als tools (bv. "legacy", "meta")
+#   legacy mode: oneshot (proces per call) | pooled (langlevende --serve workers, respawn/recycle)
+#   meta_http: keep-alive connectiepool per plugin (max_connections, idle_timeout),
+#   hedged requests (p95-delay) en per-endpoint circuit breaker (circuit_open, half_open),
+#   meerdere endpoints met balance round_robin | least_outstanding | ewma + health probes
+# - Tools: registry + @tool sugar (ook `async def`); plugins exposed als tools (bv. "legacy", "meta")
+# - Async: Orchestrator.arun + AsyncPlugin.arun (asyncio subprocess / HTTP streams); sync tools via executor
 # - CLI: --plan/--policy/--plugins/--hmac/--min_coverage/--min_sources/--bundle/--dry-run
+#   --batch plans.jsonl|- (+ --concurrency): veel plannen per proces, één resultaatregel per plan
+# - ResultCache (LRU/TTL, optioneel sqlite) voor cacheable tools; hits gelogd als cache.hit
+# - Singleflight (coalesce: true): gelijktijdige identieke plugin-calls delen één backend-call
+# - Adaptieve concurrency-limit per plugin (adaptive_limit: true, AIMD): wachtrij, shed, meta.queued_ms
+# - Metrics: timing per stap (tool/verify/audit) in success/abstain + histogrammen (METRICS, --metrics_out)
+# - Hooks: on_run_start/on_step_start/on_tool_return/on_verify/on_step_end/on_run_end; ProfilerHook (--profile)
+# - Spans: Chrome/Perfetto trace_<trace>.json (run/step/tool/plugin/verify/audit), --trace_spans
+# - Memory (opt-in): tracemalloc peak/net per stap, response_bytes van plugins, top-N sites bij run.end
+# - Deadline: resterende max_sec per stap; plugin-timeouts = min(timeout, resterend), lokale tools begrensd
+# - Rate limits (policy.yaml rate_limits): gedeelde token buckets per tool, wait of fail_closed, optioneel sqlite
+# - Batch-envelope {"batch": [...]} voor plugins; --batch_plugins groepeert stappen per round trip
+# - Begrensde plugin-responses: max_response_bytes tijdens het lezen (fail closed), stderr afgekapt
+# - BlobStore (--blobs): grote resultaten content-addressed in blobs/<sha256>, success draagt digest + size
 #
 # Alleen stdlib; PyYAML is optioneel voor YAML.
 # Ontworpen om compact, auditeerbaar en veilig te zijn — plug-and-play bij legacy/meta agents.
@@ -16,18 +38,35 @@ import sys
 import json
 import time
 import uuid
+import asyncio
 import hmac
+import queue
 import hashlib
 import argparse
+import threading
 import inspect
+import functools
+import copy
+import bisect
+import contextlib
+import contextvars
+import tracemalloc
+import ssl
+import select
+import socket
 import subprocess
-import urllib.request
-import urllib.error
-from typing import Dict, Any, Callable, List, Optional, Tuple
+import tempfile
+import http.client
+import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
 # ---------- Types ----------
-Step = Dict[str, Any]    # {"task": str, "args"?: {...}}
-Output = Dict[str, Any]  # {"ok": bool, "result"?: any, "evidence"?: {...}, "reasons"?: [...]}
+Step = Dict[str, Any]    # {"task": str, "args"?: {...}, "id"?: str, "depends_on"?: [str, ...]}
+Output = Dict[str, Any]  # {"ok": bool, "result"?: any, "evidence"?: {...}, "reasons"?: [...], "meta"?: {...}}
+ChainReport = Dict[str, Any]  # {"ok", "events", "break_index", "break_offset", "head", "head_offset", "head_at"}
 
 # ---------- Utilities ----------
 _MAX_LOG = 200  # truncate long strings in audit details
@@ -38,12 +77,33 @@ def _short(s: Optional[str], n: int = _MAX_LOG) -> str:
     s = str(s)
     return s if len(s) <= n else s[:n] + "…"
 
+def _ms(t0: float) -> float:
+    return (time.perf_counter() - t0) * 1000
+
 def _safe_json(obj: Any) -> str:
     try:
         return json.dumps(obj, separators=(",", ":"), sort_keys=True)
     except Exception:
         return str(obj)
 
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), sort_keys=True)
+
+def _json_prefix(obj: Any, n: int = _MAX_LOG) -> str:
+    """
+    _short(_safe_json(obj)) zonder het hele object te serialiseren: iterencode stopt na n tekens.
+    """
+    parts: List[str] = []
+    size = 0
+    try:
+        for chunk in _JSON_ENCODER.iterencode(obj):
+            parts.append(chunk)
+            size += len(chunk)
+            if size > n:
+                break
+    except Exception:
+        return _short(str(obj), n)
+    return _short("".join(parts), n)
+
 def redact_details(details: Dict[str, Any]) -> Dict[str, Any]:
     """
     Eenvoudige redaction hook: truncate strings; kan door teams worden vervangen.
@@ -56,21 +116,289 @@ def redact_details(details: Dict[str, Any]) -> Dict[str, Any]:
             out[k] = v
     return out
 
+# ---------- Metrics ----------
+# Bucket-grenzen (ms) voor latency-histogrammen; de laatste bucket is +Inf
+METRIC_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class _Histogram:
+    __slots__ = ("counts", "n", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS_MS) + 1)
+        self.n = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(METRIC_BUCKETS_MS, ms)] += 1
+        self.n += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Schatting via lineaire interpolatie binnen de bucket (zoals histogram_quantile).
+        """
+        if not self.n:
+            return None
+        rank = q * self.n
+        cum = 0
+        for i, c in enumerate(self.counts):
+            if c and cum + c >= rank:
+                lo = METRIC_BUCKETS_MS[i - 1] if i else 0.0
+                hi = min(METRIC_BUCKETS_MS[i] if i < len(METRIC_BUCKETS_MS) else self.max, self.max)
+                lo = min(lo, hi)
+                return round(lo + (hi - lo) * (rank - cum) / c, 3)
+            cum += c
+        return round(self.max, 3)
+
+def _labels(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _prom_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = ['%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Metrics:
+    """
+    In-process latency-histogrammen (ms), counters en gauges met labels; thread-safe.
+    snapshot() voor de API, prometheus()/write_prometheus() voor text-format export.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], _Histogram] = {}
+        self._count: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._gauge: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, name: str, ms: float, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = _Histogram()
+            h.observe(ms)
+
+    def inc(self, name: str, n: float = 1, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._count[key] = self._count.get(key, 0) + n
+
+    def set(self, name: str, value: float, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauge[key] = value
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self._count.clear()
+            self._gauge.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        {"histograms": [...], "counters": [...], "gauges": [...], "tasks": {task: {steps, error_rate, abstain_rate}}}
+        """
+        with self._lock:
+            hists = [{"name": name, "labels": dict(lb), "count": h.n, "sum_ms": round(h.sum, 3),
+                      "max_ms": round(h.max, 3), "p50": h.quantile(0.50), "p95": h.quantile(0.95),
+                      "p99": h.quantile(0.99)}
+                     for (name, lb), h in sorted(self._hist.items())]
+            counters = [{"name": name, "labels": dict(lb), "value": v} for (name, lb), v in sorted(self._count.items())]
+            gauges = [{"name": name, "labels": dict(lb), "value": v} for (name, lb), v in sorted(self._gauge.items())]
+        tasks: Dict[str, Dict[str, Any]] = {}
+        for c in counters:
+            if c["name"] == "agentic_steps_total":
+                t = tasks.setdefault(c["labels"].get("task", ""), {"steps": 0, "success": 0, "abstain": 0, "error": 0})
+                t["steps"] += c["value"]
+                t[c["labels"].get("outcome", "error")] = t.get(c["labels"].get("outcome", "error"), 0) + c["value"]
+        for t in tasks.values():
+            t["error_rate"] = round(t["error"] / t["steps"], 4) if t["steps"] else 0.0
+            t["abstain_rate"] = round(t["abstain"] / t["steps"], 4) if t["steps"] else 0.0
+        return {"histograms": hists, "counters": counters, "gauges": gauges, "tasks": tasks}
+
+    def prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            typed = set()
+            for (name, lb), h in sorted(self._hist.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cum = 0
+                for le, c in zip(METRIC_BUCKETS_MS + ("+Inf",), h.counts):
+                    cum += c
+                    lines.append("%s_bucket%s %d" % (name, _prom_labels(lb, 'le="%s"' % le), cum))
+                lines.append(f"{name}_sum{_prom_labels(lb)} {h.sum:.3f}")
+                lines.append(f"{name}_count{_prom_labels(lb)} {h.n}")
+            for (name, lb), v in sorted(self._count.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_prom_labels(lb)} {v:g}")
+            for (name, lb), v in sorted(self._gauge.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_prom_labels(lb)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """
+        Atomair (tmp + replace), geschikt voor de node_exporter textfile collector.
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+# Procesbrede metrics (Orchestrator, plugins, Audit)
+METRICS = Metrics()
+
+# ---------- Spans ----------
+class SpanRecorder:
+    """
+    Verzamelt geneste spans als Chrome trace-events ("ph": "X", µs) voor Perfetto /
+    chrome://tracing. Tracks: per thread, en per native async stap een eigen track,
+    zodat gelijktijdige stappen niet overlappen op één tijdlijn.
+    De actieve recorder staat in een contextvar (_SPANS); zonder recorder is _span()
+    een gedeelde nullcontext.
+    """
+    def __init__(self, trace: str):
+        self.trace = trace
+        self._t0 = time.perf_counter()
+        self._events: List[Dict[str, Any]] = []
+        self._tracks: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def _track(self, key: Any, label: str) -> int:
+        with self._lock:
+            tid = self._tracks.get(key)
+            if tid is None:
+                tid = self._tracks[key] = len(self._tracks) + 1
+                self._events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": label}})
+            return tid
+
+    def current_track(self) -> int:
+        tid = _SPAN_TRACK.get()
+        if tid is not None:
+            return tid
+        t = threading.current_thread()
+        return self._track(("thread", t.ident), t.name)
+
+    def new_track(self, label: str) -> int:
+        return self._track(("track", len(self._tracks), label), label)
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "", args: Optional[Dict[str, Any]] = None):
+        tid = self.current_track()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            t1 = time.perf_counter()
+            ev = {"ph": "X", "name": name, "cat": cat, "pid": 1, "tid": tid,
+                  "ts": round((t0 - self._t0) * 1e6, 3), "dur": round((t1 - t0) * 1e6, 3)}
+            if args:
+                ev["args"] = args
+            with self._lock:
+                self._events.append(ev)
+
+    def write(self, out_dir: str = ".") -> str:
+        path = os.path.join(out_dir, f"trace_{self.trace}.json")
+        with self._lock:
+            events = list(self._events)
+        os.makedirs(out_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace": self.trace}}, f)
+        return path
+
+_SPANS: "contextvars.ContextVar[Optional[SpanRecorder]]" = contextvars.ContextVar("agentic_spans", default=None)
+_SPAN_TRACK: "contextvars.ContextVar[Optional[int]]" = contextvars.ContextVar("agentic_span_track", default=None)
+_NO_SPAN = contextlib.nullcontext()
+
+def _span(name: str, cat: str = "", **args: Any):
+    rec = _SPANS.get()
+    return _NO_SPAN if rec is None else rec.span(name, cat, args)
+
 # ---------- Audit ----------
+DURABILITY_MODES = ("per_event", "group_commit", "fdatasync")
+AUDIT_WRITERS = ("inline", "thread")
+
+MERKLE_ROOT = "merkle.root"
+
+_SYNC = object()  # barrier-marker in de writer-queue
+
 class Audit:
     """
     Append-only audit met keten-hash:
       chain_i = HMAC(key, chain_{i-1} + canonical_i) of SHA256(... zonder key)
-    - fsync per event (best effort) => crash-safe
+    - durability bepaalt wanneer events naar stabiele opslag gaan:
+        per_event    : fsync per event (default) => crash-safe
+        group_commit : fsync zodra group_n events of group_ms ms openstaan, ook als er daarna
+                       niets meer gelogd wordt (timer resp. writer-thread); sync() is de barrier
+        fdatasync    : fdatasync per event (geen metadata-flush), bij voorkeur met preallocate
+    - preallocate (bytes) reserveert schijfruimte vooraf; close() kapt het bestand af op de data
+    - writer="thread": chain wordt synchroon berekend (volgorde blijft vast), schrijven + sync
+      gebeurt in een writer-thread via een begrensde queue (vol => log() blokkeert)
+    - index_every=K: sidecar audit_<trace>.idx met elke K events een checkpoint
+      {"n", "at", "offset", "chain"} => verify_range() en resume() kosten O(K) i.p.v. O(bestand)
+    - merkle_every=M: naast de lineaire chain een Merkle-boom (RFC 6962-hashing) over elke M
+      events; de root wordt als "merkle.root" event gelogd (met HMAC "sig" als er een key is)
+      => merkle_proof()/check_merkle_proof() in O(log M), verify_merkle() parallel
     - key_id (korte fingerprint) wordt gelogd bij elk event
     """
-    def __init__(self, path: Optional[str] = None, key_hex: Optional[str] = None):
+    def __init__(self, path: Optional[str] = None, key_hex: Optional[str] = None,
+                 durability: str = "per_event", group_n: int = 32, group_ms: float = 50.0,
+                 preallocate: int = 0, writer: str = "inline", queue_size: int = 1024,
+                 index_every: int = 0, merkle_every: int = 0):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"unknown durability mode: {durability}")
+        if writer not in AUDIT_WRITERS:
+            raise ValueError(f"unknown audit writer: {writer}")
         self.key: Optional[bytes] = bytes.fromhex(key_hex) if key_hex else None
         self.key_id: Optional[str] = (hashlib.sha256(self.key).hexdigest()[:12] if self.key else None)
         self.prev = ""
         self.trace = str(uuid.uuid4())
         self.path = path or f"audit_{self.trace}.jsonl"
-        self._fh = open(self.path, "a", encoding="utf-8", buffering=1)
+        self.durability = durability
+        self.group_n = max(1, int(group_n))
+        self.group_ms = float(group_ms)
+        self.preallocate = max(0, int(preallocate))
+        self.writer = writer
+        self.syncs = 0
+        self._pending = 0
+        self._pending_since = 0.0
+        self._werr: Optional[BaseException] = None
+        self._flush_lock = threading.Lock()  # inline group_commit: append vs. timer-flush
+        self._timer: Optional[threading.Timer] = None
+        if self.preallocate:
+            # Positioneel schrijven i.p.v. append: de gereserveerde ruimte staat achter de data
+            self._fh = open(self.path, "r+b" if os.path.exists(self.path) else "w+b", buffering=0)
+            self._off = self._fh.seek(0, os.SEEK_END)
+            self._alloc = self._off
+        else:
+            self._fh = open(self.path, "ab", buffering=0)
+            self._off = self._fh.tell()
+            self._alloc = 0
+        self._n = 0                # aantal events in het bestand
+        self._end = self._off      # logisch einde (log-kant; de writer-thread kan achterlopen)
+        self.index_every = max(0, int(index_every))
+        self.index_path: Optional[str] = None
+        self._idx = None
+        if self.index_every:
+            self.index_path = Audit.index_path_for(self.path)
+            self._idx = open(self.index_path, "ab", buffering=0)
+        self.merkle_every = max(0, int(merkle_every))
+        self._leaves: List[bytes] = []
+        self._leaf_n = 0
+        self._q: Optional["queue.Queue[Any]"] = None
+        self._thread: Optional[threading.Thread] = None
+        if writer == "thread":
+            self._q = queue.Queue(maxsize=max(1, int(queue_size)))
+            self._thread = threading.Thread(target=self._drain, name=f"audit-writer-{self.trace[:8]}", daemon=True)
+            self._thread.start()
 
     def _sign(self, s: str) -> str:
         if self.key is None:
@@ -82,6 +410,9 @@ class Audit:
         return json.dumps(ev, sort_keys=True, separators=(",", ":"))
 
     def log(self, typ: str, details: Dict[str, Any]):
+        if self._werr is not None:
+            # Vóór de chain/teller/leaf-update: een geweigerd event laat de staat ongemoeid
+            raise RuntimeError("audit writer failed") from self._werr
         safe = redact_details(details)
         ev = {
             "ts": time.time(),
@@ -92,64 +423,768 @@ class Audit:
             "key_id": self.key_id,
         }
         canonical = self._canon(ev)
+        if self.merkle_every and typ != MERKLE_ROOT:
+            self._leaves.append(_merkle_leaf(canonical))
         self.prev = self._sign(self.prev + canonical)
         ev["chain"] = self.prev
-        self._fh.write(json.dumps(ev, separators=(",", ":")) + "\n")
-        self._fh.flush()
+        data = (json.dumps(ev, separators=(",", ":")) + "\n").encode("utf-8")
+        at = self._end
+        self._end += len(data)
+        self._n += 1
+        cp = None
+        if self.index_every and self._n % self.index_every == 0:
+            cp = (json.dumps({"n": self._n, "at": at, "offset": self._end, "chain": self.prev},
+                             separators=(",", ":")) + "\n").encode("utf-8")
+        if self._q is not None:
+            with _span("audit.enqueue", "audit", type=typ):
+                self._q.put((data, cp))  # backpressure: blokkeert als de queue vol is
+        else:
+            with _span("audit.write", "audit", type=typ):
+                self._append(data, cp)
+        if len(self._leaves) >= self.merkle_every > 0:
+            self._merkle_root()
+
+    def _merkle_root(self):
+        leaves, self._leaves = self._leaves, []
+        root = _merkle_tree_hash(leaves).hex()
+        details: Dict[str, Any] = {"start": self._leaf_n, "count": len(leaves), "root": root}
+        if self.key is not None:
+            details["sig"] = hmac.new(self.key, root.encode(), hashlib.sha256).hexdigest()
+        self._leaf_n += len(leaves)
+        self.log(MERKLE_ROOT, details)
+
+    def _drain(self):
+        assert self._q is not None
+        while True:
+            wait_s = None
+            if self._pending and self.durability == "group_commit":
+                wait_s = max(0.0, self.group_ms / 1000.0 - (time.monotonic() - self._pending_since))
+            try:
+                item = self._q.get(timeout=wait_s)
+            except queue.Empty:
+                self._sync()  # group_ms verstreken zonder nieuwe events
+                continue
+            try:
+                if item is None:
+                    return
+                if self._werr is not None:
+                    continue  # na een schrijffout alleen nog leegtrekken, nooit vastlopen
+                if item is _SYNC:
+                    self._sync()
+                else:
+                    self._append(*item)
+            except BaseException as e:
+                self._werr = e
+            finally:
+                self._q.task_done()
+
+    def _append(self, data: bytes, cp: Optional[bytes] = None):
+        if self.preallocate and self._off + len(data) > self._alloc:
+            self._reserve(len(data))
+        self._fh.write(data)
+        self._off += len(data)
+        if cp is not None and self._idx is not None:
+            # Index is een hint (wordt bij gebruik gevalideerd) => geen eigen fsync
+            self._idx.write(cp)
+        if self.durability == "group_commit":
+            with self._flush_lock:
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                    if self._q is None and self.group_ms > 0:
+                        self._arm_flush()
+                self._pending += 1
+                if (self._pending >= self.group_n
+                        or (time.monotonic() - self._pending_since) * 1000.0 >= self.group_ms):
+                    self._sync()
+        else:
+            self._pending = 1
+            self._sync()
+
+    def _arm_flush(self):
+        t = threading.Timer(self.group_ms / 1000.0, self._flush_due)
+        t.daemon = True
+        self._timer = t
+        t.start()
+
+    def _flush_due(self):
+        with self._flush_lock:
+            if (self._pending and not self._fh.closed
+                    and (time.monotonic() - self._pending_since) * 1000.0 >= self.group_ms):
+                self._sync()
+
+    def _reserve(self, need: int):
+        size = max(self.preallocate, need)
+        try:
+            os.posix_fallocate(self._fh.fileno(), self._alloc, size)
+            self._alloc += size
+        except (AttributeError, OSError):
+            # Platform zonder fallocate: gewoon zonder reservering verder
+            self._alloc = self._off + need
+
+    def _sync(self):
+        if not self._pending:
+            return
+        t0 = time.perf_counter()
         try:
-            os.fsync(self._fh.fileno())
+            with _span("audit.fsync", "audit"):
+                if self.durability == "fdatasync" and hasattr(os, "fdatasync"):
+                    os.fdatasync(self._fh.fileno())
+                else:
+                    os.fsync(self._fh.fileno())
+            self.syncs += 1
+            METRICS.observe("agentic_audit_sync_ms", (time.perf_counter() - t0) * 1000, durability=self.durability)
         except Exception:
             # Best-effort — niet crashen op fsync errors
             pass
+        self._pending = 0
+
+    def sync(self):
+        """
+        Durability-barrier: alles wat gelogd is staat na sync() op stabiele opslag.
+        """
+        if self._q is not None and self._thread is not None:
+            self._q.put(_SYNC)
+            self._q.join()
+            if self._werr is not None:
+                raise RuntimeError("audit writer failed") from self._werr
+        else:
+            with self._flush_lock:
+                self._sync()
+
+    def guarantee(self) -> Dict[str, Any]:
+        """
+        Beschrijft de durability-garantie die voor deze audit gold.
+        """
+        info: Dict[str, Any] = {"mode": self.durability, "syncs": self.syncs}
+        if self.durability == "group_commit":
+            info.update({"max_unsynced_events": self.group_n, "max_unsynced_ms": self.group_ms})
+        if self.preallocate:
+            info["preallocate"] = self.preallocate
+        if self._q is not None:
+            info.update({"writer": self.writer, "queue_size": self._q.maxsize})
+        return info
 
     def close(self):
+        """
+        Trekt de writer-queue leeg, synct en sluit; gooit nooit (draait in finally-blokken).
+        Een onvolledige Merkle-batch krijgt hier nog zijn root.
+        """
+        try:
+            if self._leaves and not self._fh.closed:
+                self._merkle_root()
+        except Exception:
+            pass
         try:
-            self._fh.close()
+            if self._thread is not None:
+                t, self._thread = self._thread, None
+                if self._q is not None:
+                    self._q.put(_SYNC)
+                    self._q.put(None)
+                t.join()
+            else:
+                if self._timer is not None:
+                    self._timer.cancel()
+                with self._flush_lock:
+                    self._sync()
         except Exception:
             pass
+        finally:
+            try:
+                if self.preallocate and not self._fh.closed:
+                    self._fh.truncate(self._off)
+                self._fh.close()
+                if self._idx is not None:
+                    self._idx.close()
+            except Exception:
+                pass
 
     @staticmethod
     def validate_chain(lines: List[str], key_hex: Optional[str] = None) -> bool:
         """
         Herberekent de chain en vergelijkt met gelogde 'chain'.
         """
+        return bool(Audit.verify_chain(lines, key_hex=key_hex)["ok"])
+
+    @staticmethod
+    def verify_chain(source: Union[str, "os.PathLike[str]", Iterable[Union[str, bytes]]],
+                     key_hex: Optional[str] = None, prev: str = "", start_offset: int = 0,
+                     start_index: int = 0, max_events: Optional[int] = None) -> ChainReport:
+        """
+        Streaming chain-validatie in één lineaire pass over een pad of een willekeurige
+        line-iterator (str of bytes). Stopt bij de eerste breuk en rapporteert:
+          ok, events (aantal geverifieerd), break_index/break_offset (regel en byte-offset
+          van de eerste breuk, anders None), head (laatste goede chain) en head_offset
+          (byte-offset direct na de laatste goede regel => lengte van de geldige prefix).
+        prev/start_offset/start_index hervatten vanaf een checkpoint (paden worden dan geseekt);
+        max_events stopt na zoveel geverifieerde events.
+        """
         key = bytes.fromhex(key_hex) if key_hex else None
-        prev = ""
-        for line in lines:
-            try:
-                ev = json.loads(line)
-            except Exception:
-                return False
-            tmp = dict(ev)
-            chain = tmp.pop("chain", None)
-            canonical = json.dumps(tmp, sort_keys=True, separators=(",", ":"))
-            if key is None:
-                expected = hashlib.sha256((prev + canonical).encode()).hexdigest()
-            else:
-                expected = hmac.new(key, (prev + canonical).encode(), hashlib.sha256).hexdigest()
-            if expected != chain:
+        report: ChainReport = {"ok": True, "events": 0, "break_index": None, "break_offset": None,
+                               "head": prev, "head_offset": start_offset, "head_at": None}
+        fh = open(source, "rb") if isinstance(source, (str, os.PathLike)) else None
+        off = start_offset
+        if fh is not None and start_offset:
+            fh.seek(start_offset)
+        try:
+            for idx, raw in enumerate(fh if fh is not None else source, start=start_index):  # type: ignore[arg-type]
+                if max_events is not None and report["events"] >= max_events:
+                    break
+                if isinstance(raw, bytes):
+                    size = len(raw)
+                    line = raw.decode("utf-8", "replace")
+                else:
+                    line = raw
+                    size = len(raw.encode("utf-8")) + (0 if raw.endswith("\n") else 1)
+                line = line.rstrip("\r\n")
+                if line and not line.strip("\x00"):
+                    # Gereserveerde (gepreallocate) ruimte na een crash; geen event
+                    off += size
+                    continue
+                chain = _chain_of(line, prev, key)
+                if chain is None:
+                    report.update({"ok": False, "break_index": idx, "break_offset": off})
+                    break
+                prev = chain
+                report["head_at"] = off
+                off += size
+                report["events"] += 1
+                report["head"], report["head_offset"] = prev, off
+        finally:
+            if fh is not None:
+                fh.close()
+        return report
+
+    @staticmethod
+    def index_path_for(path: Union[str, "os.PathLike[str]"]) -> str:
+        return os.path.splitext(os.fspath(path))[0] + ".idx"
+
+    @staticmethod
+    def load_index(path: Union[str, "os.PathLike[str]"]) -> List[Dict[str, Any]]:
+        """
+        Leest de checkpoints uit de sidecar-index van een audit ([] als die ontbreekt).
+        """
+        out: List[Dict[str, Any]] = []
+        try:
+            with open(Audit.index_path_for(path), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        cp = json.loads(line)
+                        out.append({"n": int(cp["n"]), "at": int(cp["at"]),
+                                    "offset": int(cp["offset"]), "chain": str(cp["chain"])})
+                    except Exception:
+                        break  # afgebroken staart van de index
+        except OSError:
+            pass
+        return out
+
+    @staticmethod
+    def _checkpoint(path: Union[str, "os.PathLike[str]"], event_no: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Laatste checkpoint met n <= event_no (None = laatste) dat klopt met het auditbestand:
+        de regel op [at, offset) moet bestaan en dezelfde chain dragen. Anders het begin.
+        """
+        size = os.path.getsize(path)
+        cps = [cp for cp in Audit.load_index(path) if event_no is None or cp["n"] <= event_no]
+        with open(path, "rb") as f:
+            for cp in reversed(cps):
+                if cp["offset"] > size or cp["at"] >= cp["offset"]:
+                    continue
+                f.seek(cp["at"])
+                line = f.read(cp["offset"] - cp["at"])
+                try:
+                    if line.endswith(b"\n") and json.loads(line).get("chain") == cp["chain"]:
+                        return cp
+                except Exception:
+                    continue
+        return {"n": 0, "at": 0, "offset": 0, "chain": ""}
+
+    @staticmethod
+    def verify_range(path: Union[str, "os.PathLike[str]"], start: int = 0, stop: Optional[int] = None,
+                     key_hex: Optional[str] = None) -> ChainReport:
+        """
+        Verifieert events [start, stop) (stop=None => tot het einde) vanaf het dichtstbijzijnde
+        checkpoint. Kost O(K + bereik); de prefix vóór het checkpoint wordt vertrouwd op basis
+        van de index — alleen verify_chain over het hele bestand is volledig bewijs.
+        """
+        cp = Audit._checkpoint(path, start)
+        report = Audit.verify_chain(path, key_hex=key_hex, prev=cp["chain"], start_offset=cp["offset"],
+                                    start_index=cp["n"], max_events=(None if stop is None else max(0, stop - cp["n"])))
+        report["start_event"] = cp["n"]
+        return report
+
+    @classmethod
+    def resume(cls, path: Union[str, "os.PathLike[str]"], key_hex: Optional[str] = None, **kwargs: Any) -> "Audit":
+        """
+        Heropent een (gecrasht) auditbestand en zet de chain voort vanaf de staart.
+        Verifieert alleen vanaf het laatste geldige checkpoint. Een afgebroken laatste regel
+        (geen newline) of preallocate-opvulling wordt afgekapt; een echte breuk => ValueError.
+        """
+        path = os.fspath(path)
+        cp = Audit._checkpoint(path)
+        report = Audit.verify_chain(path, key_hex=key_hex, prev=cp["chain"],
+                                    start_offset=cp["offset"], start_index=cp["n"])
+        if not report["ok"]:
+            with open(path, "rb") as f:
+                f.seek(report["break_offset"])
+                tail = f.read()
+            if b"\n" in tail.rstrip(b"\x00"):
+                raise ValueError(f"audit chain broken at line {report['break_index'] + 1}: {path}")
+        if report["head_offset"] != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(report["head_offset"])
+            stale = Audit.index_path_for(path)
+            if os.path.exists(stale):
+                keep = [cp for cp in Audit.load_index(path) if cp["offset"] <= report["head_offset"]]
+                with open(stale, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(cp, separators=(",", ":")) + "\n" for cp in keep)
+        trace = None
+        if report["head_at"] is not None or cp["offset"]:
+            with open(path, "rb") as f:
+                f.seek(report["head_at"] if report["head_at"] is not None else cp["at"])
+                trace = json.loads(f.readline()).get("trace")
+        a = cls(path=path, key_hex=key_hex, **kwargs)
+        a.prev = report["head"]
+        a._n = cp["n"] + report["events"]
+        if trace:
+            a.trace = trace
+        if a.merkle_every:
+            found, a._leaf_n, a._leaves = Audit._merkle_tail(path, cp["offset"], report["head_offset"])
+            if not found and cp["offset"]:
+                # Laatste root ligt vóór het checkpoint: dan toch vanaf het begin
+                _, a._leaf_n, a._leaves = Audit._merkle_tail(path, 0, report["head_offset"])
+        return a
+
+    @staticmethod
+    def _merkle_tail(path: str, start: int, end: int) -> Tuple[bool, int, List[bytes]]:
+        """
+        Merkle-staat na de laatste merkle.root in [start, end): (root gevonden, start+count
+        van die root, leaves van de events erna die nog geen root hebben).
+        """
+        found, leaf_n, leaves = False, 0, []
+        with open(path, "rb") as f:
+            f.seek(start)
+            for raw in f:
+                if start >= end:
+                    break
+                start += len(raw)
+                line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                if not line.strip("\x00"):
+                    continue
+                root_ev = _merkle_root_event(line)
+                if root_ev is None:
+                    leaves.append(_merkle_leaf(_canon_line(line)))
+                    continue
+                det = root_ev.get("details") or {}
+                found, leaf_n, leaves = True, int(det.get("start", 0)) + int(det.get("count", 0)), []
+        return found, leaf_n, leaves
+
+    @staticmethod
+    def merkle_proof(path: Union[str, "os.PathLike[str]"], index: int) -> Dict[str, Any]:
+        """
+        Inclusion proof voor het event op regel `index` (0-based) in een merkle-audit:
+        het event, het audit-pad (O(log M) hashes) en het merkle.root event van zijn batch.
+        """
+        batch: List[str] = []
+        target: Optional[int] = None
+        with open(path, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                line = line.rstrip("\r\n")
+                if not line.strip("\x00"):
+                    continue
+                root_ev = _merkle_root_event(line)
+                if root_ev is None:
+                    if i == index:
+                        target = len(batch)
+                    batch.append(line)
+                    continue
+                if i == index:
+                    raise ValueError("merkle.root events are not leaves")
+                if target is not None:
+                    leaves = [_merkle_leaf(_canon_line(x)) for x in batch]
+                    det = root_ev.get("details") or {}
+                    return {
+                        "index": index,
+                        "event": batch[target],
+                        "leaf_index": target,
+                        "batch_start": det.get("start"),
+                        "batch_size": len(leaves),
+                        "path": [h.hex() for h in _merkle_path(leaves, target)],
+                        "root": _merkle_tree_hash(leaves).hex(),
+                        "root_event": line,
+                    }
+                batch = []
+        raise ValueError(f"no merkle root covers line {index}")
+
+    @staticmethod
+    def check_merkle_proof(proof: Dict[str, Any], key_hex: Optional[str] = None) -> bool:
+        """
+        Controleert een proof van merkle_proof() zonder de audit te lezen. Het merkle.root
+        event zelf wordt vertrouwd via de lineaire chain of (met key) via zijn HMAC "sig".
+        """
+        try:
+            leaf = _merkle_leaf(_canon_line(proof["event"]))
+            root = bytes.fromhex(proof["root"])
+            path = [bytes.fromhex(h) for h in proof["path"]]
+            det = (_merkle_root_event(proof["root_event"]) or {}).get("details") or {}
+        except Exception:
+            return False
+        if det.get("root") != proof["root"] or det.get("count") != proof["batch_size"]:
+            return False
+        if key_hex:
+            sig = hmac.new(bytes.fromhex(key_hex), det["root"].encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(sig, str(det.get("sig", ""))):
                 return False
-            prev = chain
-        return True
+        return _merkle_check(leaf, int(proof["leaf_index"]), int(proof["batch_size"]), path, root)
+
+    @staticmethod
+    def verify_merkle(path: Union[str, "os.PathLike[str]"], key_hex: Optional[str] = None,
+                      workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Herberekent alle merkle.root events; leaves worden per batch over een process pool
+        gehasht (workers<=1 => inline). Rapport: ok, batches, leaves, bad (batch-starts met
+        afwijkende root/count/sig), unrooted (leaves na de laatste root).
+        """
+        key = bytes.fromhex(key_hex) if key_hex else None
+        report: Dict[str, Any] = {"ok": True, "batches": 0, "leaves": 0, "bad": [], "unrooted": 0}
+        n_workers = workers if workers is not None else (os.cpu_count() or 1)
+        pool = ProcessPoolExecutor(n_workers) if n_workers > 1 else None
+        inflight = 2 * n_workers
+        pending: "deque[Tuple[Dict[str, Any], int, Any]]" = deque()
+
+        def settle(det: Dict[str, Any], count: int, root: Any) -> None:
+            root = root.result() if pool is not None else root
+            report["batches"] += 1
+            report["leaves"] += count
+            ok = root == det.get("root") and det.get("count") == count
+            if ok and key is not None:
+                sig = hmac.new(key, root.encode(), hashlib.sha256).hexdigest()
+                ok = hmac.compare_digest(sig, str(det.get("sig", "")))
+            if not ok:
+                report["ok"] = False
+                report["bad"].append(det.get("start"))
+
+        try:
+            batch: List[str] = []
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\r\n")
+                    if not line.strip("\x00"):
+                        continue
+                    root_ev = _merkle_root_event(line)
+                    if root_ev is None:
+                        batch.append(line)
+                        continue
+                    det = root_ev.get("details") or {}
+                    job = pool.submit(_merkle_batch_root, batch) if pool is not None else _merkle_batch_root(batch)
+                    pending.append((det, len(batch), job))
+                    batch = []
+                    while len(pending) > inflight:
+                        settle(*pending.popleft())
+            while pending:
+                settle(*pending.popleft())
+            report["unrooted"] = len(batch)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return report
+
+def _chain_of(line: str, prev: str, key: Optional[bytes]) -> Optional[str]:
+    """
+    Verifieert één audit-regel tegen prev; geeft de chain terug of None bij een breuk.
+    """
+    try:
+        ev = json.loads(line)
+    except Exception:
+        return None
+    if not isinstance(ev, dict):
+        return None
+    tmp = dict(ev)
+    chain = tmp.pop("chain", None)
+    canonical = json.dumps(tmp, sort_keys=True, separators=(",", ":"))
+    if key is None:
+        expected = hashlib.sha256((prev + canonical).encode()).hexdigest()
+    else:
+        expected = hmac.new(key, (prev + canonical).encode(), hashlib.sha256).hexdigest()
+    return chain if expected == chain else None
+
+# ---------- Merkle ----------
+def _canon_line(line: str) -> str:
+    ev = json.loads(line)
+    ev.pop("chain", None)
+    return json.dumps(ev, sort_keys=True, separators=(",", ":"))
+
+def _merkle_leaf(canonical: str) -> bytes:
+    return hashlib.sha256(b"\x00" + canonical.encode()).digest()
+
+def _merkle_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def _merkle_split(n: int) -> int:
+    # grootste macht van 2 kleiner dan n (RFC 6962)
+    return 1 << ((n - 1).bit_length() - 1)
+
+def _merkle_tree_hash(leaves: List[bytes]) -> bytes:
+    n = len(leaves)
+    if n == 0:
+        return hashlib.sha256(b"").digest()
+    if n == 1:
+        return leaves[0]
+    k = _merkle_split(n)
+    return _merkle_node(_merkle_tree_hash(leaves[:k]), _merkle_tree_hash(leaves[k:]))
+
+def _merkle_path(leaves: List[bytes], m: int) -> List[bytes]:
+    n = len(leaves)
+    if n <= 1:
+        return []
+    k = _merkle_split(n)
+    if m < k:
+        return _merkle_path(leaves[:k], m) + [_merkle_tree_hash(leaves[k:])]
+    return _merkle_path(leaves[k:], m - k) + [_merkle_tree_hash(leaves[:k])]
+
+def _merkle_check(leaf: bytes, m: int, n: int, path: List[bytes], root: bytes) -> bool:
+    # Inclusion-verificatie volgens RFC 9162 §2.1.3.2
+    if m >= n:
+        return False
+    fn, sn, r = m, n - 1, leaf
+    for p in path:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            r = _merkle_node(p, r)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            r = _merkle_node(r, p)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and r == root
+
+def _merkle_root_event(line: str) -> Optional[Dict[str, Any]]:
+    # Goedkope voorselectie; alleen kandidaten worden geparsed
+    if f'"type":"{MERKLE_ROOT}"' not in line:
+        return None
+    try:
+        ev = json.loads(line)
+    except Exception:
+        return None
+    return ev if isinstance(ev, dict) and ev.get("type") == MERKLE_ROOT else None
+
+def _merkle_batch_root(lines: List[str]) -> str:
+    try:
+        return _merkle_tree_hash([_merkle_leaf(_canon_line(x)) for x in lines]).hex()
+    except Exception:
+        return ""
+
+# ---------- Keys ----------
+KEYS_DIR = "keys"
+
+def key_id_for(key_hex: str) -> str:
+    return hashlib.sha256(bytes.fromhex(key_hex)).hexdigest()[:12]
+
+def keys_from_env() -> Dict[str, str]:
+    """
+    KEYS_JSON uit de omgeving: {"<key_id>": "<hex-key>", ...}; {} als afwezig/ongeldig.
+    """
+    raw = os.environ.get("KEYS_JSON")
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except Exception:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(k): str(v) for k, v in data.items() if isinstance(k, str) and isinstance(v, str)}
+
+def resolve_key(key_id: Optional[str], base: str = KEYS_DIR) -> Optional[str]:
+    """
+    Zoekt de hex-key voor key_id in KEYS_JSON, daarna in <base>/<key_id>.key.
+    Alleen een key waarvan de fingerprint echt key_id is wordt teruggegeven.
+    """
+    if not key_id:
+        return None
+    candidates = [keys_from_env().get(key_id)]
+    p = os.path.join(base, f"{key_id}.key")
+    if os.path.isfile(p):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                candidates.append(f.read().strip())
+        except OSError:
+            pass
+    for key_hex in candidates:
+        try:
+            if key_hex and key_id_for(key_hex) == key_id:
+                return key_hex
+        except ValueError:
+            continue
+    return None
+
+def audit_key_id(path: Union[str, "os.PathLike[str]"]) -> Optional[str]:
+    """
+    key_id van een auditbestand (alle events dragen dezelfde); leest alleen de eerste regel.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            ev = json.loads(f.readline())
+        return ev.get("key_id") if isinstance(ev, dict) else None
+    except Exception:
+        return None
 
 # ---------- Policy ----------
+class DeadlineExceeded(TimeoutError):
+    """
+    De run-deadline (Policy.max_sec) verliep terwijl de stap nog liep.
+    """
+
+# Absolute run-deadline (time.monotonic) van de lopende stap; None = geen deadline
+_DEADLINE: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("agentic_deadline", default=None)
+
+def _deadline_timeout(configured: float) -> Tuple[float, bool]:
+    """
+    (min(configured, resterend), True als de run-deadline de begrenzende factor is).
+    """
+    dl = _DEADLINE.get()
+    if dl is None:
+        return configured, False
+    left = dl - time.monotonic()
+    if left < configured:
+        return max(0.0, left), True
+    return configured, False
+
+def _timeout_reason(bounded: bool, default: str = "timeout") -> str:
+    return "deadline_exceeded" if bounded else default
+
+RATE_ON_LIMIT = ("wait", "fail_closed")
+
+class TokenBucket:
+    """
+    Token bucket (rate tokens/s, burst), thread-safe. take() reserveert een token en geeft
+    de wachttijd terug (tokens mogen negatief worden = reserveringen), of None als die
+    wachttijd groter is dan max_wait (dan wordt niets gereserveerd).
+    """
+    def __init__(self, rate: float, burst: float):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _reserve(tokens: float, ts: float, now: float, rate: float, burst: float,
+                 max_wait: float) -> Tuple[float, Optional[float]]:
+        tokens = min(burst, tokens + (now - ts) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        if wait > max_wait:
+            return tokens, None
+        return tokens - 1, wait
+
+    def take(self, max_wait: float = float("inf")) -> Optional[float]:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens, wait = self._reserve(self._tokens, self._ts, now, self.rate, self.burst, max_wait)
+            self._ts = now
+            return wait
+
+class SqliteTokenBucket(TokenBucket):
+    """
+    Token bucket in een sqlite-bestand: gedeeld door alle processen op de host die
+    hetzelfde pad en dezelfde key gebruiken (BEGIN IMMEDIATE serialiseert, wall clock).
+    """
+    def __init__(self, path: str, key: str, rate: float, burst: float):
+        super().__init__(rate, burst)
+        import sqlite3
+        self.key = key
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL, ts REAL)")
+
+    def take(self, max_wait: float = float("inf")) -> Optional[float]:
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = db.execute("SELECT tokens, ts FROM rate_buckets WHERE key=?", (self.key,)).fetchone()
+                tokens, ts = row if row is not None else (self.burst, now)
+                tokens, wait = self._reserve(tokens, ts, now, self.rate, self.burst, max_wait)
+                db.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, ts) VALUES (?, ?, ?)", (self.key, tokens, now))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return wait
+
+# Procesbrede buckets: orchestrators (en Policy.copy()) met dezelfde limiet delen één bucket
+_RATE_BUCKETS: Dict[Tuple[str, float, float, Optional[str]], TokenBucket] = {}
+_RATE_LOCK = threading.Lock()
+
+def _rate_bucket(task: str, rate: float, burst: float, db: Optional[str]) -> TokenBucket:
+    key = (task, rate, burst, db)
+    with _RATE_LOCK:
+        b = _RATE_BUCKETS.get(key)
+        if b is None:
+            b = _RATE_BUCKETS[key] = SqliteTokenBucket(db, task, rate, burst) if db else TokenBucket(rate, burst)
+        return b
+
 class Policy:
-    def __init__(self, allowlist: List[str], max_steps: int = 10, max_sec: float = 10.0, budgets: Optional[Dict[str, int]] = None):
+    """
+    rate_limits: {tool: {rate, burst?, on_limit?: wait|fail_closed, max_wait?}} — token buckets
+    die procesbreed gedeeld worden; met rate_limit_db (sqlite-pad) host-breed.
+    """
+    def __init__(self, allowlist: List[str], max_steps: int = 10, max_sec: float = 10.0, budgets: Optional[Dict[str, int]] = None,
+                 max_parallel: int = 1, rate_limits: Optional[Dict[str, Dict[str, Any]]] = None,
+                 rate_limit_db: Optional[str] = None):
         self.allow = set(allowlist)
         self.max_steps = int(max_steps)
         self.max_sec = float(max_sec)
         self.budgets = dict(budgets) if budgets else {}
+        self.max_parallel = max(1, int(max_parallel))
+        self.rate_limits = {k: dict(v) for k, v in (rate_limits or {}).items()}
+        self.rate_limit_db = rate_limit_db
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        for task, spec in self.rate_limits.items():
+            rate = float(spec.get("rate", 0))
+            if rate <= 0:
+                raise ValueError(f"rate_limits.{task}: rate must be > 0")
+            if spec.get("on_limit", "wait") not in RATE_ON_LIMIT:
+                raise ValueError(f"rate_limits.{task}: on_limit must be one of {RATE_ON_LIMIT}")
+            self._buckets[task] = _rate_bucket(task, rate, float(spec.get("burst", max(1.0, rate))), rate_limit_db)
+
+    def copy(self) -> "Policy":
+        """
+        Zelfde regels met verse budgets (bv. per plan in batch-modus); rate-buckets blijven gedeeld.
+        """
+        return Policy(list(self.allow), self.max_steps, self.max_sec, self.budgets, self.max_parallel,
+                      self.rate_limits, self.rate_limit_db)
 
     def allowed(self, task: str) -> bool:
         return task in self.allow
 
     def enforce_budget(self, task: str) -> bool:
-        if task not in self.budgets:
+        with self._lock:
+            if task not in self.budgets:
+                return True
+            if self.budgets[task] <= 0:
+                return False
+            self.budgets[task] -= 1
             return True
-        if self.budgets[task] <= 0:
-            return False
-        self.budgets[task] -= 1
-        return True
+
+    def take_rate(self, task: str) -> Optional[float]:
+        """
+        Token voor `task`: 0.0 = direct, > 0 = seconden wachten (token al gereserveerd),
+        None = fail closed (on_limit: fail_closed, of wachten past niet in max_wait/deadline).
+        """
+        bucket = self._buckets.get(task)
+        if bucket is None:
+            return 0.0
+        spec = self.rate_limits[task]
+        max_wait = 0.0 if spec.get("on_limit", "wait") == "fail_closed" else float(spec.get("max_wait", float("inf")))
+        dl = _DEADLINE.get()
+        if dl is not None:
+            max_wait = min(max_wait, max(0.0, dl - time.monotonic()))
+        return bucket.take(max_wait)
 
 # ---------- Verifier ----------
 class Verifier:
@@ -192,143 +1227,1826 @@ class Verifier:
 
         return out
 
-# ---------- Tools registry ----------
-TOOLS: Dict[str, Callable[[Dict[str, Any]], Output]] = {}
+# ---------- Result cache ----------
+class ResultCache:
+    """
+    Cache voor resultaten van idempotente tools: in-memory LRU met TTL en
+    max_entries, optioneel een sqlite-tier (path) die processen delen.
+    Waarden worden als JSON bewaard; een hit is dus altijd een verse kopie.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, path: Optional[str] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.path = path
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
 
-def register_tool(name: str, fn: Callable[[Dict[str, Any]], Output]):
-    TOOLS[name] = fn
+    @staticmethod
+    def key(task: str, args: Dict[str, Any], policy_sha256: Optional[str]) -> str:
+        return hashlib.sha256(_safe_json({"task": task, "args": args, "policy": policy_sha256}).encode()).hexdigest()
 
-def tool(name: str):
-    def deco(fn: Callable[[Dict[str, Any]], Output]):
-        register_tool(name, fn)
-        return fn
-    return deco
+    def get(self, key: str) -> Optional[Tuple[Output, str]]:
+        """
+        (output, tier) met tier "memory" of "disk"; None bij een miss of verlopen entry.
+        """
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if hit[0] > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(hit[1]), "memory"
+                del self._mem[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT expires, value FROM results WHERE key=?", (key,)).fetchone()
+                if row is not None and row[0] > now:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return json.loads(row[1]), "disk"
+            self.misses += 1
+            return None
 
-# Interne demo-tools
-@tool("echo")
-def t_echo(args: Dict[str, Any]) -> Output:
-    msg = str(args.get("msg", ""))
-    ok = bool(msg)
-    return {
-        "ok": ok,
-        "result": msg if ok else None,
-        "evidence": ({"coverage": 0.80, "sources": ["echo","caller"]} if ok else None),
-        "reasons": ([] if ok else ["empty msg"])
-    }
+    def put(self, key: str, out: Output, ttl: Optional[float] = None):
+        try:
+            value = json.dumps(out, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return  # niet-JSON resultaten worden niet gecachet
+        expires = time.time() + (self.ttl if ttl is None else float(ttl))
+        with self._lock:
+            self._remember(key, expires, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results (key, expires, value) VALUES (?, ?, ?)", (key, expires, value))
 
-@tool("summarize")
-def t_summarize(args: Dict[str, Any]) -> Output:
-    text = str(args.get("text", ""))
-    if not text:
-        return {"ok": False, "reasons": ["missing text"]}
-    summary = (text[:160] + "…") if len(text) > 160 else text
-    # Evidence compliant met strikte defaults (>=0.75 coverage en >=2 sources)
-    evidence = {"coverage": 0.85, "sources": ["legacy", "meta"]}
-    return {"ok": True, "result": {"summary": summary}, "evidence": evidence}
+    def _remember(self, key: str, expires: float, value: str):
+        self._mem[key] = (expires, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
 
-# ---------- Plugins (adapters) ----------
-class Plugin:
+    def purge(self) -> int:
+        """
+        Verwijdert verlopen entries (ook uit sqlite); geeft het aantal in-memory verwijderingen.
+        """
+        now = time.time()
+        with self._lock:
+            stale = [k for k, (exp, _) in self._mem.items() if exp <= now]
+            for k in stale:
+                del self._mem[k]
+            if self._db is not None:
+                self._db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+        return len(stale)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+# ---------- Blob store ----------
+class BlobStore:
+    """
+    Content-addressed opslag voor grote stapresultaten: <root>/<sha256>, gedeeld tussen runs.
+    Het resultaat wordt één keer (iterencode, zelfde vorm als _safe_json) geserialiseerd en
+    tijdens het schrijven gehasht; een bestaande blob wordt niet opnieuw geschreven.
+    Resultaten tot en met `threshold` bytes blijven inline in de audit.
+    fsync=True (default): blob en directory worden gesynct vóór de rename, zodat een
+    gesyncte success-regel nooit naar een ontbrekende of halve blob wijst.
+    """
+    def __init__(self, root: str = "blobs", threshold: int = 4096, fsync: bool = True):
+        self.root = root
+        self.threshold = max(0, int(threshold))
+        self.fsync = bool(fsync)
+        self.stored = 0
+        self.deduped = 0
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest)
+
+    def put(self, obj: Any) -> Tuple[Optional[str], int, str]:
+        """
+        (digest, size, "") als het resultaat als blob is opgeslagen, anders (None, size, tekst).
+        Niet-JSON objecten worden net als in _safe_json als str(obj) opgeslagen, maar dan als
+        JSON-string zodat get() ze terug kan lezen.
+        """
+        try:
+            return self._put(_JSON_ENCODER.iterencode(obj))
+        except (TypeError, ValueError):
+            return self._put(_JSON_ENCODER.iterencode(str(obj)))
+
+    def _put(self, chunks: Iterator[str]) -> Tuple[Optional[str], int, str]:
+        h = hashlib.sha256()
+        head: List[bytes] = []
+        size = 0
+        f = None
+        tmp = ""
+        try:
+            for chunk in chunks:
+                data = chunk.encode()
+                h.update(data)
+                size += len(data)
+                if f is None:
+                    head.append(data)
+                    if size <= self.threshold:
+                        continue
+                    fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+                    f = os.fdopen(fd, "wb")
+                    f.writelines(head)
+                    head = []
+                else:
+                    f.write(data)
+            if f is None:
+                return None, size, b"".join(head).decode()
+            digest = h.hexdigest()
+            if os.path.exists(self.path(digest)):
+                self.deduped += 1
+                return digest, size, ""
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+            f.close()
+            f = None
+            os.replace(tmp, self.path(digest))
+            tmp = ""
+            if self.fsync:
+                self._sync_dir()
+            self.stored += 1
+            return digest, size, ""
+        finally:
+            if f is not None:
+                f.close()
+            if tmp:
+                os.unlink(tmp)
+
+    def _sync_dir(self):
+        try:
+            fd = os.open(self.root, os.O_RDONLY)
+        except OSError:
+            return  # bv. Windows: directories zijn niet te openen
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def get(self, digest: str) -> Any:
+        """
+        Leest een blob terug en controleert de hash; ValueError bij een mismatch.
+        """
+        with open(self.path(digest), "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"blob {digest} does not match its digest")
+        return json.loads(data)
+
+# ---------- Tools registry ----------
+TOOLS: Dict[str, Callable[[Dict[str, Any]], Output]] = {}
+# Native async tools (voor Orchestrator.arun); sync tools draaien daar in een executor
+ATOOLS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Output]]] = {}
+# Idempotente tools waarvan de Orchestrator resultaten mag cachen: naam -> ttl (None = cache-default)
+CACHEABLE: Dict[str, Optional[float]] = {}
+# Plugin-tools met een batch-variant: lijst args -> lijst Outputs in één round trip
+BATCH_TOOLS: Dict[str, Callable[[List[Dict[str, Any]]], List[Output]]] = {}
+ABATCH_TOOLS: Dict[str, Callable[[List[Dict[str, Any]]], Awaitable[List[Output]]]] = {}
+
+def _sync_shim(fn: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Sync-variant van een async tool. Binnen een draaiende event loop kan asyncio.run niet;
+    dan draait de coroutine in een eigen loop op een hulpthread (contextvars gaan mee).
+    """
+    def run(args: Dict[str, Any]) -> Any:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(fn(args))
+        ctx = contextvars.copy_context()
+        with ThreadPoolExecutor(1, thread_name_prefix="agentic-shim") as ex:
+            return ex.submit(ctx.run, lambda: asyncio.run(fn(args))).result()
+    return run
+
+def register_tool(name: str, fn: Callable[[Dict[str, Any]], Any], cacheable: bool = False,
+                  cache_ttl: Optional[float] = None):
+    """
+    Registreert een tool; een `async def` tool krijgt ook een sync shim voor run().
+    cacheable=True: resultaten mogen uit de ResultCache van de Orchestrator komen.
+    """
+    if inspect.iscoroutinefunction(fn):
+        ATOOLS[name] = fn
+        TOOLS[name] = _sync_shim(fn)
+    else:
+        TOOLS[name] = fn
+        ATOOLS.pop(name, None)
+    if cacheable:
+        CACHEABLE[name] = None if cache_ttl is None else float(cache_ttl)
+    else:
+        CACHEABLE.pop(name, None)
+
+def tool(name: str, cacheable: bool = False, cache_ttl: Optional[float] = None):
+    def deco(fn: Callable[[Dict[str, Any]], Any]):
+        register_tool(name, fn, cacheable, cache_ttl)
+        return fn
+    return deco
+
+# Interne demo-tools
+@tool("echo")
+def t_echo(args: Dict[str, Any]) -> Output:
+    msg = str(args.get("msg", ""))
+    ok = bool(msg)
+    return {
+        "ok": ok,
+        "result": msg if ok else None,
+        "evidence": ({"coverage": 0.80, "sources": ["echo","caller"]} if ok else None),
+        "reasons": ([] if ok else ["empty msg"])
+    }
+
+@tool("summarize")
+def t_summarize(args: Dict[str, Any]) -> Output:
+    text = str(args.get("text", ""))
+    if not text:
+        return {"ok": False, "reasons": ["missing text"]}
+    summary = (text[:160] + "…") if len(text) > 160 else text
+    # Evidence compliant met strikte defaults (>=0.75 coverage en >=2 sources)
+    evidence = {"coverage": 0.85, "sources": ["legacy", "meta"]}
+    return {"ok": True, "result": {"summary": summary}, "evidence": evidence}
+
+# ---------- Plugins (adapters) ----------
+class Plugin:
     def __init__(self, name: str):
         self.name = name
     def run(self, op: str, params: Dict[str, Any]) -> Output:
         raise NotImplementedError
+    def run_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Output]:
+        """
+        Meerdere ops, één Output per call in dezelfde volgorde. Adapters met een
+        batch-envelope ({"batch": [...]}) doen dit in één round trip.
+        """
+        return [self.run(op, params) for op, params in calls]
+    def close(self):
+        pass
+
+    @staticmethod
+    def _batch_payload(calls: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        return {"batch": [{"op": op, "params": params} for op, params in calls]}
+
+    def _decode(self, out: Any, nbytes: int, batch: bool = False) -> Output:
+        """
+        Gedecodeerde response -> Output; bij een batch-envelope {"ok", "batch": [Output, ...]}.
+        """
+        if not isinstance(out, dict):
+            return {"ok": False, "reasons": ["bad_json:not_object"]}
+        if batch:
+            items = out.get("batch")
+            if not isinstance(items, list):
+                # backend zonder batch-support antwoordt met één fout voor de hele envelope
+                return {"ok": False, "reasons": list(out.get("reasons") or ["bad_batch"])}
+            res: Output = {"ok": True, "batch": [
+                self._normalize(o) if isinstance(o, dict) else {"ok": False, "reasons": ["bad_json:not_object"]}
+                for o in items
+            ]}
+        else:
+            res = self._normalize(out)
+        res["meta"] = {"response_bytes": nbytes}
+        return res
+
+    @staticmethod
+    def _unbatch(out: Output, n: int) -> List[Output]:
+        """
+        Envelope-Output -> n Outputs; een fout van de hele round trip geldt voor elke call.
+        """
+        items = out.get("batch")
+        if not out.get("ok") or not isinstance(items, list) or len(items) != n:
+            reasons = out.get("reasons") or [f"bad_batch:size:{len(items) if isinstance(items, list) else 0}"]
+            return [{"ok": False, "reasons": list(reasons)} for _ in range(n)]
+        meta = out.get("meta") or {}
+        shared = {k: v for k, v in meta.items() if k != "response_bytes"}
+        for o in items:
+            o["meta"] = {**shared, "batched": n, "batch_response_bytes": meta.get("response_bytes")}
+        return items
+
+    def _normalize(self, out: Dict[str, Any]) -> Output:
+        ev = out.get("evidence") or {}
+        ev.setdefault("coverage", 0.80)
+        srcs = ev.get("sources") or []
+        if not srcs:
+            ev["sources"] = [self.name]
+        return {
+            "ok": bool(out.get("ok")),
+            "result": out.get("result"),
+            "evidence": ev,
+            "reasons": out.get("reasons", [])
+        }
+
+# ---------- Begrensde plugin-responses ----------
+MAX_RESPONSE_BYTES = 16 * 1024 * 1024
+MAX_STDERR_BYTES = 64 * 1024
+_READ_CHUNK = 64 * 1024
+
+class ResponseTooLarge(Exception):
+    """
+    Plugin-response groter dan max_response_bytes; de stap faalt closed met "response_too_large".
+    """
+
+def _too_large() -> Output:
+    return {"ok": False, "reasons": ["response_too_large"]}
+
+def _preview(data: bytes) -> str:
+    """
+    Korte tekst van (het begin van) een response voor reasons; decodeert niet de hele body.
+    """
+    return _short(bytes(data[:_MAX_LOG * 4]).decode("utf-8", "replace"))
+
+class _CappedReader(threading.Thread):
+    """
+    Leest een pipe tot EOF in chunks en bewaart hoogstens `limit` bytes.
+    - hard=True : bij overschrijding `over` zetten, on_over() (kill) en stoppen
+    - hard=False: alleen het begin bewaren, de rest weggooien (stderr: proces blokkeert niet)
+    """
+    def __init__(self, stream, limit: int, hard: bool, on_over: Optional[Callable[[], None]] = None):
+        super().__init__(name="capped-reader", daemon=True)
+        self.stream = stream
+        self.limit = limit
+        self.hard = hard
+        self.on_over = on_over
+        self.buf = bytearray()
+        self.over = False
+        self.start()
+
+    def run(self):
+        read = getattr(self.stream, "read1", self.stream.read)
+        try:
+            while True:
+                chunk = read(_READ_CHUNK)
+                if not chunk:
+                    return
+                room = self.limit - len(self.buf)
+                if len(chunk) <= room:
+                    self.buf += chunk
+                    continue
+                self.buf += chunk[:max(0, room)]
+                self.over = True
+                if self.hard:
+                    if self.on_over is not None:
+                        self.on_over()
+                    return
+        except (OSError, ValueError):
+            pass
+
+def _run_capped(cmd: List[str], data: bytes, timeout: float, max_out: int, max_err: int) -> Tuple[int, bytearray, bytearray]:
+    """
+    subprocess.run(capture_output) met begrensde buffers: stdout boven max_out => kill +
+    ResponseTooLarge, stderr wordt na max_err bytes afgekapt. TimeoutExpired zoals subprocess.run.
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + timeout
+    try:
+        out = _CappedReader(proc.stdout, max_out, True, proc.kill)
+        err = _CappedReader(proc.stderr, max_err, False)
+
+        def feed():
+            try:
+                proc.stdin.write(data)
+                proc.stdin.close()
+            except (BrokenPipeError, OSError, ValueError):
+                pass
+        threading.Thread(target=feed, name="capped-writer", daemon=True).start()
+
+        rc = proc.wait(timeout=timeout)
+        for r in (out, err):
+            # kleinkinderen kunnen de pipe openhouden: ook het lezen valt onder de timeout
+            r.join(max(0.0, deadline - time.monotonic()))
+            if r.is_alive() and not out.over:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+        if out.over:
+            raise ResponseTooLarge(max_out)
+        return rc, out.buf, err.buf
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        for f in (proc.stdin, proc.stdout, proc.stderr):
+            try:
+                f.close()
+            except Exception:
+                pass
+
+async def _aread_capped(stream: asyncio.StreamReader, limit: int, hard: bool,
+                        on_over: Optional[Callable[[], None]] = None) -> Tuple[bytearray, bool]:
+    """
+    asyncio-variant van _CappedReader; geeft (buffer, over) terug.
+    """
+    buf = bytearray()
+    over = False
+    while True:
+        chunk = await stream.read(_READ_CHUNK)
+        if not chunk:
+            return buf, over
+        room = limit - len(buf)
+        if len(chunk) <= room:
+            buf += chunk
+            continue
+        buf += chunk[:max(0, room)]
+        over = True
+        if hard:
+            if on_over is not None:
+                on_over()
+            return buf, over
+
+LEGACY_MODES = ("oneshot", "pooled")
+
+class _LegacyWorker:
+    """
+    Eén langlevend `cmd --serve` proces: newline-delimited JSON over stdin/stdout.
+    Een reader-thread zet stdout-regels in een queue zodat requests een timeout hebben.
+    Regels langer dan max_line bytes worden niet gebufferd: de reader meldt TOO_LARGE en stopt.
+    """
+    TOO_LARGE = b""  # sentinel (een echte regel eindigt altijd op b"\n")
+
+    def __init__(self, cmd: List[str], max_line: int = MAX_RESPONSE_BYTES):
+        self.proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.max_line = max_line
+        self.requests = 0
+        self._lines: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        threading.Thread(target=self._read, name="legacy-worker-reader", daemon=True).start()
+
+    def _read(self):
+        assert self.proc.stdout is not None
+        try:
+            while True:
+                line = self.proc.stdout.readline(self.max_line + 1)
+                if not line:
+                    break
+                if not line.endswith(b"\n") and len(line) > self.max_line:
+                    self._lines.put(self.TOO_LARGE)
+                    return  # worker is uit sync; de caller killt hem
+                self._lines.put(line)
+        except Exception:
+            pass
+        self._lines.put(None)  # EOF => worker is weg
+
+    def request(self, line: bytes, timeout: float) -> Optional[bytes]:
+        """
+        Stuurt één request; None bij een gecrashte worker, TOO_LARGE bij een te grote
+        response, queue.Empty bij timeout.
+        """
+        assert self.proc.stdin is not None
+        self.requests += 1
+        try:
+            self.proc.stdin.write(line + b"\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            return None
+        return self._lines.get(timeout=timeout)
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        for f in (self.proc.stdin, self.proc.stdout):
+            try:
+                if f is not None:
+                    f.close()
+            except Exception:
+                pass
 
 class LegacySubprocess(Plugin):
     """
     Roept een bestaand script/binary aan. Verwacht JSON op stdin, JSON op stdout.
+    - mode="oneshot": één proces per call (default)
+    - mode="pooled" : pool_size langlevende `cmd --serve` workers; timeout per request,
+      kill + respawn bij timeout/crash, recycle na max_requests requests
+    - max_response_bytes: stdout wordt tijdens het lezen begrensd; daarboven kill en
+      "response_too_large". max_stderr_bytes: alleen het begin van stderr wordt bewaard.
     """
-    def __init__(self, name: str, cmd: List[str], timeout: float = 8.0):
+    def __init__(self, name: str, cmd: List[str], timeout: float = 8.0, mode: str = "oneshot",
+                 pool_size: int = 2, max_requests: int = 1000,
+                 max_response_bytes: int = MAX_RESPONSE_BYTES, max_stderr_bytes: int = MAX_STDERR_BYTES):
         super().__init__(name)
+        if mode not in LEGACY_MODES:
+            raise ValueError(f"unknown legacy mode: {mode}")
         self.cmd = cmd
         self.timeout = float(timeout)
+        self.mode = mode
+        self.pool_size = max(1, int(pool_size))
+        self.max_requests = max(1, int(max_requests))
+        self.max_response_bytes = max(1, int(max_response_bytes))
+        self.max_stderr_bytes = max(0, int(max_stderr_bytes))
+        self.spawned = 0
+        self._closed = False
+        # Slots: een idle worker of None (nog niet/opnieuw te spawnen)
+        self._slots: "queue.LifoQueue[Optional[_LegacyWorker]]" = queue.LifoQueue()
+        for _ in range(self.pool_size):
+            self._slots.put(None)
+
+    def run(self, op: str, params: Dict[str, Any]) -> Output:
+        return self._request({"op": op, "params": params}, op)
+
+    def run_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Output]:
+        if len(calls) < 2:
+            return super().run_batch(calls)
+        return self._unbatch(self._request(self._batch_payload(calls), f"batch[{len(calls)}]"), len(calls))
+
+    def _request(self, payload: Dict[str, Any], op: str) -> Output:
+        if self.mode == "pooled":
+            return self._run_pooled(payload, op)
+        timeout, bounded = _deadline_timeout(self.timeout)
+        if timeout <= 0:
+            return {"ok": False, "reasons": ["deadline_exceeded"]}
+        try:
+            with _span("subprocess.run", "plugin", plugin=self.name, op=op):
+                rc, stdout, stderr = _run_capped(
+                    self.cmd, json.dumps(payload).encode(), timeout,
+                    self.max_response_bytes, self.max_stderr_bytes,
+                )
+        except subprocess.TimeoutExpired:
+            return {"ok": False, "reasons": [_timeout_reason(bounded)]}
+        except ResponseTooLarge:
+            return _too_large()
+        except Exception as e:
+            return {"ok": False, "reasons": [f"subprocess_error:{type(e).__name__}"]}
+
+        return self._parse(rc, stdout, stderr, "batch" in payload)
+
+    def _parse(self, returncode: Optional[int], stdout: bytes, stderr: bytes, batch: bool = False) -> Output:
+        if returncode != 0:
+            return {"ok": False, "reasons": [f"nonzero_exit:{returncode}", _preview(stderr)]}
+
+        try:
+            out = json.loads(stdout)  # direct uit de bytes: geen tweede, gedecodeerde kopie
+        except Exception as e:
+            return {"ok": False, "reasons": [f"bad_json:{type(e).__name__}", _preview(stdout)]}
+
+        return self._decode(out, len(stdout), batch)
+
+    def _run_pooled(self, payload: Dict[str, Any], op: str) -> Output:
+        timeout, bounded = _deadline_timeout(self.timeout)
+        if timeout <= 0:
+            return {"ok": False, "reasons": ["deadline_exceeded"]}
+        deadline = time.monotonic() + timeout
+        try:
+            w = self._slots.get(timeout=timeout)
+        except queue.Empty:
+            return {"ok": False, "reasons": [_timeout_reason(bounded)]}
+        keep = False
+        try:
+            if w is None:
+                try:
+                    with _span("subprocess.spawn", "plugin", plugin=self.name):
+                        w = _LegacyWorker(self.cmd + ["--serve"], self.max_response_bytes)
+                    self.spawned += 1
+                except Exception as e:
+                    return {"ok": False, "reasons": [f"subprocess_error:{type(e).__name__}"]}
+            try:
+                with _span("worker.request", "plugin", plugin=self.name, op=op):
+                    raw = w.request(json.dumps(payload).encode(), max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return {"ok": False, "reasons": [_timeout_reason(bounded)]}
+            if raw is None:
+                try:
+                    rc: Optional[int] = w.proc.wait(timeout=1.0)
+                except subprocess.TimeoutExpired:
+                    rc = None
+                return {"ok": False, "reasons": [f"worker_exit:{rc}" if rc is not None else "worker_crashed"]}
+            if raw is _LegacyWorker.TOO_LARGE:
+                return _too_large()  # keep=False: worker wordt gekild
+            try:
+                out = json.loads(raw)
+            except Exception as e:
+                return {"ok": False, "reasons": [f"bad_json:{type(e).__name__}", _preview(raw)]}
+            if not isinstance(out, dict):
+                return {"ok": False, "reasons": ["bad_json:not_object", _preview(raw)]}
+            # pas na een geldige response: een worker met rommel op stdout is uit sync
+            keep = w.requests < self.max_requests
+            return self._decode(out, len(raw), "batch" in payload)  # JSON-regel van de worker (ASCII)
+        finally:
+            if keep and not self._closed:
+                self._slots.put(w)
+            else:
+                if w is not None:
+                    w.kill()
+                self._slots.put(None)
+
+    def close(self):
+        """
+        Stopt alle pooled workers (idle slots); busy workers worden bij teruggave gestopt.
+        """
+        self._closed = True
+        for _ in range(self.pool_size):
+            try:
+                w = self._slots.get_nowait()
+            except queue.Empty:
+                break
+            if w is not None:
+                w.kill()
+            self._slots.put(None)
+
+class _HTTPPool:
+    """
+    Keep-alive HTTP/1.1 connecties (http.client) naar één endpoint.
+    - max_conns: maximaal aantal gelijktijdige connecties; wachten telt mee in de timeout
+    - idle_timeout: idle connecties ouder dan dit worden gesloten i.p.v. hergebruikt
+    - health: een idle socket die leesbaar is (peer sloot of stuurde rommel) wordt verwijderd;
+      faalt een hergebruikte connectie vóór er een response is, dan één retry op een verse
+    - max_response_bytes: Content-Length vooraf gecontroleerd, body in chunks gelezen en
+      begrensd; daarboven ResponseTooLarge en wordt de connectie niet hergebruikt
+    """
+    def __init__(self, endpoint: str, max_conns: int = 4, idle_timeout: float = 30.0,
+                 max_response_bytes: int = MAX_RESPONSE_BYTES):
+        u = urllib.parse.urlsplit(endpoint)
+        if u.scheme not in ("http", "https") or not u.hostname:
+            raise ValueError(f"unsupported endpoint: {endpoint}")
+        self.https = u.scheme == "https"
+        self.host = u.hostname
+        self.port = u.port
+        self.path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        self.max_conns = max(1, int(max_conns))
+        self.idle_timeout = float(idle_timeout)
+        self.max_response_bytes = max(1, int(max_response_bytes))
+        self.created = 0
+        self._idle: List[Tuple[http.client.HTTPConnection, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_conns)
+
+    @staticmethod
+    def _alive(conn: http.client.HTTPConnection) -> bool:
+        sock = conn.sock
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def _acquire(self, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        if not self._slots.acquire(timeout=max(0.0, timeout)):
+            raise TimeoutError("connection pool exhausted")
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, since = self._idle.pop()
+                if now - since <= self.idle_timeout and self._alive(conn):
+                    return conn, True
+                conn.close()
+        if self.https:
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=timeout,
+                                               context=ssl.create_default_context())
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        self.created += 1
+        return conn, False
+
+    def _release(self, conn: http.client.HTTPConnection, reuse: bool):
+        if reuse:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        else:
+            conn.close()
+        self._slots.release()
+
+    def post(self, body: bytes, headers: Dict[str, str], timeout: float) -> Tuple[int, bytes]:
+        with _span("http.request", "plugin", host=self.host, port=self.port):
+            return self._post(body, headers, timeout)
+
+    def _post(self, body: bytes, headers: Dict[str, str], timeout: float) -> Tuple[int, bytes]:
+        for attempt in (0, 1):
+            conn, reused = self._acquire(timeout)
+            reuse = False
+            try:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request("POST", self.path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = self._read_body(resp)
+                reuse = not resp.will_close
+                return resp.status, data
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if reused and attempt == 0:
+                    continue  # verlopen keep-alive connectie: opnieuw op een verse
+                raise
+            finally:
+                self._release(conn, reuse)
+        raise http.client.RemoteDisconnected("unreachable")
+
+    def _read_body(self, resp: http.client.HTTPResponse) -> bytearray:
+        length = resp.getheader("Content-Length")
+        if length is not None and length.strip().isdigit() and int(length) > self.max_response_bytes:
+            raise ResponseTooLarge(int(length))
+        buf = bytearray()
+        while True:
+            chunk = resp.read(_READ_CHUNK)  # ook bij chunked/EOF-afgebakende bodies; sluit de response af
+            if not chunk:
+                return buf
+            if len(buf) + len(chunk) > self.max_response_bytes:
+                raise ResponseTooLarge(len(buf) + len(chunk))
+            buf += chunk
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+class _LatencyWindow:
+    """
+    Laatste `size` latencies (ms) van geslaagde requests; quantile() voor de hedge-delay.
+    """
+    def __init__(self, size: int = 256):
+        self._lat: "deque[float]" = deque(maxlen=max(1, int(size)))
+        self._lock = threading.Lock()
+
+    def add(self, ms: float):
+        with self._lock:
+            self._lat.append(ms)
+
+    def __len__(self) -> int:
+        return len(self._lat)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            lat = sorted(self._lat)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(q * len(lat)))]
+
+CIRCUIT_STATES = ("closed", "open", "half_open")
+
+class _CircuitBreaker:
+    """
+    Per endpoint: na `threshold` opeenvolgende fouten open (fail fast), na `cooldown`
+    seconden half_open met één probe-request; slaagt die dan closed, anders weer open.
+    """
+    def __init__(self, endpoint: str, threshold: int = 5, cooldown: float = 30.0):
+        self.endpoint = endpoint
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set(self, state: str):
+        if state != self.state:
+            self.state = state
+            METRICS.inc("agentic_circuit_transitions_total", endpoint=self.endpoint, state=state)
+
+    def available(self) -> bool:
+        """
+        Zou allow() nu doorlaten? Zonder toestandswijziging (voor de balancer).
+        """
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self._opened_at >= self.cooldown
+            return not (self.state == "half_open" and self._probing)
+
+    def allow(self) -> Optional[str]:
+        """
+        None als de call niet mag (open); anders de toestand waarin hij doorgaat.
+        """
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return None
+                self._set("half_open")
+            if self.state == "half_open":
+                if self._probing:
+                    return None
+                self._probing = True
+            return self.state
+
+    def release(self):
+        """
+        Probe afgelopen zonder oordeel (eigen deadline, cancel): half_open laat weer één probe toe.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.failures = 0
+                self._set("closed")
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._set("open")
+
+# Procesbrede breakers per endpoint (gedeeld door plugins naar hetzelfde endpoint)
+_BREAKERS: Dict[str, _CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def _breaker_for(endpoint: str, threshold: int, cooldown: float) -> _CircuitBreaker:
+    with _BREAKERS_LOCK:
+        b = _BREAKERS.get(endpoint)
+        if b is None:
+            b = _BREAKERS[endpoint] = _CircuitBreaker(endpoint, threshold, cooldown)
+        return b
+
+LB_STRATEGIES = ("round_robin", "least_outstanding", "ewma")
+
+class _Endpoint:
+    """
+    Eén backend van een MetaHTTP-plugin: eigen keep-alive pool, breaker (passieve ejectie),
+    aantal lopende requests en EWMA-latency voor de balancer.
+    """
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, url: str, max_conns: int, idle_timeout: float, breaker: Optional[_CircuitBreaker],
+                 max_response_bytes: int = MAX_RESPONSE_BYTES):
+        self.url = url
+        self.pool = _HTTPPool(url, max_conns=max_conns, idle_timeout=idle_timeout,
+                              max_response_bytes=max_response_bytes)
+        self.breaker = breaker
+        self.outstanding = 0
+        self.ewma_ms = 0.0  # 0 = nog geen metingen: nieuwe endpoints krijgen eerst verkeer
+        # asyncio-pool (AsyncMetaHTTP), gebonden aan één event loop
+        self.aidle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = []
+        self.aslots: Optional[asyncio.Semaphore] = None
+
+    def available(self) -> bool:
+        return self.breaker is None or self.breaker.available()
+
+    def observe(self, ms: float):
+        self.ewma_ms = ms if not self.ewma_ms else self.EWMA_ALPHA * ms + (1 - self.EWMA_ALPHA) * self.ewma_ms
+
+class MetaHTTP(Plugin):
+    """
+    Eenvoudige HTTP JSON bridge naar externe/“meta” agenten.
+    POST body: {"op": "...", "params": {...}}
+    Persistente HTTP/1.1 connecties per endpoint (max_connections, idle_timeout).
+    - endpoint: één URL of een lijst replica's; balance kiest per request:
+      round_robin | least_outstanding | ewma (latency x lopende requests).
+      Het gekozen endpoint staat in evidence.endpoint van de output.
+    - hedge: na de geleerde hedge_quantile-latency (min. hedge_min_samples metingen,
+      niet onder hedge_min_ms) een tweede request, bij voorkeur naar een ander endpoint;
+      het eerste goede antwoord wint. meta: hedged, hedge_delay_ms, hedge_won
+    - circuit_threshold > 0: per-endpoint circuit breaker; open => endpoint uitgesloten
+      (passieve ejectie), alle endpoints open => "circuit_open" zonder request;
+      half_open na circuit_cooldown seconden (één probe). Default 0 bij één endpoint,
+      3 bij meerdere.
+    - health_interval > 0: achtergrondthread stuurt elke N seconden op "health" naar
+      elk endpoint; de uitkomst gaat naar de breaker (een geslaagde probe sluit hem).
+    - max_response_bytes: grotere bodies worden tijdens het lezen afgebroken =>
+      "response_too_large" (telt als endpoint-fout voor de breaker).
+    """
+    def __init__(self, name: str, endpoint: Union[str, List[str]], timeout: float = 8.0, headers: Optional[Dict[str,str]] = None, auth_token: Optional[str] = None,
+                 max_connections: int = 4, idle_timeout: float = 30.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_min_ms: float = 5.0,
+                 hedge_min_samples: int = 20, circuit_threshold: Optional[int] = None, circuit_cooldown: float = 30.0,
+                 balance: str = "round_robin", health_interval: float = 0.0,
+                 max_response_bytes: int = MAX_RESPONSE_BYTES):
+        super().__init__(name)
+        urls = [endpoint] if isinstance(endpoint, str) else list(endpoint)
+        if not urls:
+            raise ValueError(f"meta_http plugin {name!r} has no endpoint")
+        if balance not in LB_STRATEGIES:
+            raise ValueError(f"unknown balance strategy: {balance}")
+        if circuit_threshold is None:
+            circuit_threshold = 3 if len(urls) > 1 else 0
+        self.timeout = float(timeout)
+        self.headers = headers or {}
+        self.auth_token = auth_token
+        self.endpoints = [
+            _Endpoint(u, max_connections, idle_timeout,
+                      _breaker_for(u, circuit_threshold, circuit_cooldown) if circuit_threshold > 0 else None,
+                      max_response_bytes)
+            for u in urls
+        ]
+        # Eerste endpoint als "primair": compatibel met enkelvoudige configuraties
+        self.endpoint = urls[0]
+        self.pool = self.endpoints[0].pool
+        self.breaker = self.endpoints[0].breaker
+        self.balance = balance
+        self._rr = 0
+        self._lb_lock = threading.Lock()
+        self.hedge = bool(hedge)
+        self.hedge_quantile = float(hedge_quantile)
+        self.hedge_min_ms = float(hedge_min_ms)
+        self.hedge_min_samples = max(1, int(hedge_min_samples))
+        self.latency = _LatencyWindow()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self.health_interval = float(health_interval)
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        if self.health_interval > 0:
+            self._prober = threading.Thread(target=self._probe_loop, name=f"health-{name}", daemon=True)
+            self._prober.start()
+
+    # ---- balancing ----
+    def _pick(self, exclude: Optional[_Endpoint] = None) -> Optional[Tuple[_Endpoint, str]]:
+        """
+        Kies een endpoint volgens `balance`; None als alle (niet-uitgesloten) endpoints open zijn.
+        """
+        with self._lb_lock:
+            n = len(self.endpoints)
+            start, self._rr = self._rr, self._rr + 1
+            # roteren zodat gelijke scores over de replica's verdeeld worden
+            order = [self.endpoints[(start + k) % n] for k in range(n)]
+            order = [e for e in order if e is not exclude and e.available()]
+            if self.balance == "least_outstanding":
+                order.sort(key=lambda e: e.outstanding)
+            elif self.balance == "ewma":
+                order.sort(key=lambda e: e.ewma_ms * (e.outstanding + 1))
+        for ep in order:
+            state = ep.breaker.allow() if ep.breaker is not None else "closed"
+            if state is not None:
+                return ep, state
+        return None
+
+    def _probe_loop(self):
+        body, hdrs = self._body("health", {})
+        while not self._stop.wait(self.health_interval):
+            for ep in self.endpoints:
+                try:
+                    status, data = ep.pool.post(body, hdrs, self.timeout)
+                    ok = status < 400 and bool(json.loads(data).get("ok"))
+                except Exception:
+                    ok = False
+                METRICS.inc("agentic_http_health_probes_total", plugin=self.name, endpoint=ep.url, ok=str(ok).lower())
+                if ep.breaker is not None:
+                    ep.breaker.record(ok)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        q = self.latency.quantile(self.hedge_quantile)
+        return None if q is None else max(self.hedge_min_ms, q)
+
+    def _started(self, ep: _Endpoint):
+        with self._lb_lock:
+            ep.outstanding += 1
+
+    def _done(self, ep: _Endpoint, ok: Optional[bool], ms: Optional[float] = None):
+        with self._lb_lock:
+            ep.outstanding -= 1
+            if ms is not None:
+                ep.observe(ms)
+        if ms is not None:
+            self.latency.add(ms)
+        if ep.breaker is not None:
+            if ok is None:
+                ep.breaker.release()
+            else:
+                ep.breaker.record(ok)
+
+    def _timed_post(self, ep: _Endpoint, body: bytes, hdrs: Dict[str, str], timeout: float, bounded: bool) -> Tuple[int, bytes]:
+        t0 = time.perf_counter()
+        self._started(ep)
+        try:
+            status, data = ep.pool.post(body, hdrs, timeout)
+        except (TimeoutError, socket.timeout):
+            self._done(ep, None if bounded else False)  # eigen deadline is geen endpoint-fout
+            raise
+        except Exception:
+            self._done(ep, False)
+            raise
+        self._done(ep, status < 500, _ms(t0) if status < 400 else None)
+        return status, data
+
+    def _backup(self, ep: _Endpoint) -> _Endpoint:
+        picked = self._pick(exclude=ep) if len(self.endpoints) > 1 else None
+        return picked[0] if picked is not None else ep
+
+    def _send(self, ep: _Endpoint, body: bytes, hdrs: Dict[str, str], timeout: float, bounded: bool,
+              meta: Dict[str, Any]) -> Tuple[int, bytes]:
+        delay = self._hedge_delay() if meta.get("circuit") != "half_open" else None
+        if delay is None or delay / 1000 >= timeout:
+            return self._timed_post(ep, body, hdrs, timeout, bounded)
+        with self._lb_lock:  # lazy, maar één executor ook bij gelijktijdige eerste hedges
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.pool.max_conns, thread_name_prefix=f"hedge-{self.name}")
+            hp = self._hedge_pool
+        start = time.monotonic()
+        primary = hp.submit(contextvars.copy_context().run, self._timed_post, ep, body, hdrs, timeout, bounded)
+        if wait([primary], timeout=delay / 1000).done:
+            return primary.result()
+        meta.update({"hedged": True, "hedge_delay_ms": round(delay, 3)})
+        bep = self._backup(ep)
+        backup = hp.submit(contextvars.copy_context().run, self._timed_post, bep, body, hdrs,
+                           max(0.0, timeout - (time.monotonic() - start)), bounded)
+        pending = {primary, backup}
+        last = primary
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, timeout - (time.monotonic() - start)),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError("hedged request timed out")
+            for f in done:
+                last = f
+                if f.exception() is None and f.result()[0] < 500:
+                    meta["hedge_won"] = f is backup
+                    if f is backup:
+                        meta["endpoint"] = bep.url
+                    METRICS.inc("agentic_http_hedges_total", plugin=self.name, won=str(f is backup).lower())
+                    return f.result()
+        return last.result()  # beide faalden: de laatste fout
+
+    def _route(self) -> Union[Tuple[_Endpoint, Dict[str, Any]], Output]:
+        picked = self._pick()
+        if picked is None:
+            return {"ok": False, "reasons": ["circuit_open"]}
+        ep, state = picked
+        meta: Dict[str, Any] = {"endpoint": ep.url}
+        if state != "closed":
+            meta["circuit"] = state
+        return ep, meta
+
+    def run(self, op: str, params: Dict[str, Any]) -> Output:
+        return self._request({"op": op, "params": params})
+
+    def run_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Output]:
+        if len(calls) < 2:
+            return super().run_batch(calls)
+        return self._unbatch(self._request(self._batch_payload(calls)), len(calls))
+
+    def _request(self, payload: Dict[str, Any]) -> Output:
+        body, hdrs = self._encode(payload)
+        timeout, bounded = _deadline_timeout(self.timeout)
+        if timeout <= 0:
+            return {"ok": False, "reasons": ["deadline_exceeded"]}
+        route = self._route()
+        if isinstance(route, dict):
+            return route
+        ep, meta = route
+        try:
+            status, data = self._send(ep, body, hdrs, timeout, bounded, meta)
+        except (TimeoutError, socket.timeout):
+            return {"ok": False, "reasons": [_timeout_reason(bounded, "network_error")]}
+        except ResponseTooLarge:
+            return _too_large()
+        except OSError:
+            return {"ok": False, "reasons": ["network_error"]}
+        except Exception as e:
+            return {"ok": False, "reasons": [f"http_error:{type(e).__name__}"]}
+        return self._with_meta(self._parse(status, data, "batch" in payload), meta)
+
+    @staticmethod
+    def _with_meta(out: Output, meta: Dict[str, Any]) -> Output:
+        if out.get("ok"):
+            endpoint = meta.pop("endpoint")
+            for o in out["batch"] if "batch" in out else [out]:
+                if o.get("ok"):
+                    o["evidence"]["endpoint"] = endpoint
+            if meta:
+                out["meta"] = {**(out.get("meta") or {}), **meta}
+        return out
+
+    def _body(self, op: str, params: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        return self._encode({"op": op, "params": params})
+
+    def _encode(self, payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        body = json.dumps(payload).encode()
+        hdrs = {"Content-Type": "application/json", **self.headers}
+        if self.auth_token:
+            hdrs["Authorization"] = f"Bearer {self.auth_token}"
+        return body, hdrs
+
+    def _parse(self, status: int, data: bytes, batch: bool = False) -> Output:
+        if 400 <= status < 500 and status != 429:
+            return {"ok": False, "reasons": [f"http_4xx:{status}"]}  # client-fout, geen overbelasting
+        if status >= 400:
+            return {"ok": False, "reasons": ["network_error"]}
+
+        try:
+            out = json.loads(data)
+        except Exception as e:
+            return {"ok": False, "reasons": [f"bad_json:{type(e).__name__}", _preview(data)]}
+
+        return self._decode(out, len(data), batch)
+
+    def close(self):
+        self._stop.set()
+        for ep in self.endpoints:
+            ep.pool.close()
+        with self._lb_lock:
+            hp, self._hedge_pool = self._hedge_pool, None
+        if hp is not None:
+            hp.shutdown(wait=False)
+
+class AsyncPlugin(Plugin):
+    """
+    Plugin met een native asyncio-variant van run(); gebruikt door Orchestrator.arun.
+    """
+    async def arun(self, op: str, params: Dict[str, Any]) -> Output:
+        raise NotImplementedError
+    async def arun_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Output]:
+        return list(await asyncio.gather(*(self.arun(op, params) for op, params in calls)))
+    async def aclose(self):
+        pass
+
+class AsyncLegacySubprocess(LegacySubprocess, AsyncPlugin):
+    """
+    LegacySubprocess met arun() via asyncio-subprocessen (oneshot). De pooled workers zijn
+    blocking pipes en draaien in de default executor.
+    """
+    async def arun(self, op: str, params: Dict[str, Any]) -> Output:
+        return await self._arequest({"op": op, "params": params}, op)
+
+    async def arun_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Output]:
+        if len(calls) < 2:
+            return await super().arun_batch(calls)
+        return self._unbatch(await self._arequest(self._batch_payload(calls), f"batch[{len(calls)}]"), len(calls))
+
+    async def _arequest(self, payload: Dict[str, Any], op: str) -> Output:
+        if self.mode == "pooled":
+            ctx = contextvars.copy_context()  # spans/deadline van de stap ook in de executor-thread
+            return await asyncio.get_running_loop().run_in_executor(None, ctx.run, self._request, payload, op)
+        timeout, bounded = _deadline_timeout(self.timeout)
+        if timeout <= 0:
+            return {"ok": False, "reasons": ["deadline_exceeded"]}
+        try:
+            with _span("subprocess.spawn", "plugin", plugin=self.name):
+                proc = await asyncio.create_subprocess_exec(
+                    *self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e:
+            return {"ok": False, "reasons": [f"subprocess_error:{type(e).__name__}"]}
+        def kill():
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+
+        async def feed(data: bytes):
+            assert proc.stdin is not None
+            try:
+                proc.stdin.write(data)
+                await proc.stdin.drain()
+                proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        try:
+            with _span("subprocess.exchange", "plugin", plugin=self.name, op=op):
+                _, (stdout, too_large), (stderr, _), _ = await asyncio.wait_for(asyncio.gather(
+                    feed(json.dumps(payload).encode()),
+                    _aread_capped(proc.stdout, self.max_response_bytes, True, kill),
+                    _aread_capped(proc.stderr, self.max_stderr_bytes, False),
+                    proc.wait(),
+                ), timeout)
+            if too_large:
+                return _too_large()
+        except asyncio.TimeoutError:
+            return {"ok": False, "reasons": [_timeout_reason(bounded)]}
+        except Exception as e:
+            return {"ok": False, "reasons": [f"subprocess_error:{type(e).__name__}"]}
+        finally:
+            if proc.returncode is None:
+                # timeout of cancel: proces niet laten hangen
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+        return self._parse(proc.returncode, stdout, stderr, "batch" in payload)
+
+class AsyncMetaHTTP(MetaHTTP, AsyncPlugin):
+    """
+    MetaHTTP met arun(): minimale HTTP/1.1 client op asyncio streams, met een eigen
+    keep-alive pool (zelfde max_connections/idle_timeout) per endpoint en event loop.
+    """
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._aloop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _abind(self):
+        loop = asyncio.get_running_loop()
+        if self._aloop is not loop:
+            # Streams horen bij één loop; oude idle connecties zijn hier onbruikbaar
+            for ep in self.endpoints:
+                for _, w, _ in ep.aidle:
+                    w.transport.abort()
+                ep.aidle = []
+                ep.aslots = asyncio.Semaphore(ep.pool.max_conns)
+            self._aloop = loop
+
+    async def _aopen(self, ep: _Endpoint) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        pool = ep.pool
+        now = time.monotonic()
+        while ep.aidle:
+            r, w, since = ep.aidle.pop()
+            if now - since <= pool.idle_timeout and not r.at_eof() and not w.is_closing():
+                return r, w, True
+            w.close()
+        ctx = ssl.create_default_context() if pool.https else None
+        port = pool.port or (443 if pool.https else 80)
+        r, w = await asyncio.open_connection(pool.host, port, ssl=ctx)
+        pool.created += 1
+        return r, w, False
+
+    async def _aexchange(self, pool: _HTTPPool, r: asyncio.StreamReader, w: asyncio.StreamWriter,
+                         body: bytes, hdrs: Dict[str, str]) -> Tuple[int, bytes, bool]:
+        host = pool.host + (f":{pool.port}" if pool.port else "")
+        head = [f"POST {pool.path} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in hdrs.items()]
+        w.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await w.drain()
+
+        status_line = await r.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before response")
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise http.client.BadStatusLine(status_line.decode("latin-1", "replace"))
+        version, status = parts[0], int(parts[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await r.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+
+        cap = pool.max_response_bytes
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            buf = bytearray()
+            while True:
+                size = int((await r.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await r.readline()
+                    break
+                if len(buf) + size > cap:
+                    raise ResponseTooLarge(len(buf) + size)
+                buf += await r.readexactly(size)
+                await r.readline()
+            data = bytes(buf)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length > cap:
+                raise ResponseTooLarge(length)
+            data = await r.readexactly(length)
+        else:
+            data, over = await _aread_capped(r, cap, True)
+            if over:
+                raise ResponseTooLarge(len(data))
+            return status, bytes(data), False
+        keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        return status, data, keep
+
+    async def _apost(self, ep: _Endpoint, body: bytes, hdrs: Dict[str, str]) -> Tuple[int, bytes]:
+        self._abind()
+        assert ep.aslots is not None
+        async with ep.aslots:
+            for attempt in (0, 1):
+                r, w, reused = await self._aopen(ep)
+                keep = False
+                try:
+                    status, data, keep = await self._aexchange(ep.pool, r, w, body, hdrs)
+                    return status, data
+                except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+                    if reused and attempt == 0:
+                        continue  # verlopen keep-alive connectie: opnieuw op een verse
+                    raise
+                finally:
+                    if keep:
+                        ep.aidle.append((r, w, time.monotonic()))
+                    else:
+                        w.close()
+        raise ConnectionResetError("unreachable")
+
+    async def _atimed(self, ep: _Endpoint, body: bytes, hdrs: Dict[str, str], timeout: float, bounded: bool) -> Tuple[int, bytes]:
+        t0 = time.perf_counter()
+        self._started(ep)
+        try:
+            with _span("http.request", "plugin", host=ep.pool.host, port=ep.pool.port):
+                status, data = await asyncio.wait_for(self._apost(ep, body, hdrs), timeout)
+        except asyncio.TimeoutError:
+            self._done(ep, None if bounded else False)
+            raise
+        except asyncio.CancelledError:
+            self._done(ep, None)  # verliezende hedge: geen endpoint-fout
+            raise
+        except Exception:
+            self._done(ep, False)
+            raise
+        self._done(ep, status < 500, _ms(t0) if status < 400 else None)
+        return status, data
+
+    async def _asend(self, ep: _Endpoint, body: bytes, hdrs: Dict[str, str], timeout: float, bounded: bool,
+                     meta: Dict[str, Any]) -> Tuple[int, bytes]:
+        delay = self._hedge_delay() if meta.get("circuit") != "half_open" else None
+        if delay is None or delay / 1000 >= timeout:
+            return await self._atimed(ep, body, hdrs, timeout, bounded)
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._atimed(ep, body, hdrs, timeout, bounded))
+        done, _ = await asyncio.wait({primary}, timeout=delay / 1000)
+        if done:
+            return primary.result()
+        meta.update({"hedged": True, "hedge_delay_ms": round(delay, 3)})
+        bep = self._backup(ep)
+        backup = asyncio.ensure_future(self._atimed(bep, body, hdrs, max(0.0, timeout - (time.monotonic() - start)), bounded))
+        pending = {primary, backup}
+        last = primary
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, timeout - (time.monotonic() - start)),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for f in done:
+                    last = f
+                    if f.exception() is None and f.result()[0] < 500:
+                        meta["hedge_won"] = f is backup
+                        if f is backup:
+                            meta["endpoint"] = bep.url
+                        METRICS.inc("agentic_http_hedges_total", plugin=self.name, won=str(f is backup).lower())
+                        return f.result()
+            return last.result()
+        finally:
+            for f in pending:
+                f.cancel()  # verliezer annuleren: zijn connectie wordt gesloten
+
+    async def arun(self, op: str, params: Dict[str, Any]) -> Output:
+        return await self._arequest({"op": op, "params": params})
+
+    async def arun_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Output]:
+        if len(calls) < 2:
+            return await super().arun_batch(calls)
+        return self._unbatch(await self._arequest(self._batch_payload(calls)), len(calls))
+
+    async def _arequest(self, payload: Dict[str, Any]) -> Output:
+        body, hdrs = self._encode(payload)
+        timeout, bounded = _deadline_timeout(self.timeout)
+        if timeout <= 0:
+            return {"ok": False, "reasons": ["deadline_exceeded"]}
+        route = self._route()
+        if isinstance(route, dict):
+            return route
+        ep, meta = route
+        try:
+            status, data = await self._asend(ep, body, hdrs, timeout, bounded, meta)
+        except asyncio.TimeoutError:
+            return {"ok": False, "reasons": [_timeout_reason(bounded, "network_error")]}
+        except ResponseTooLarge:
+            return _too_large()
+        except (OSError, asyncio.IncompleteReadError):
+            return {"ok": False, "reasons": ["network_error"]}
+        except Exception as e:
+            return {"ok": False, "reasons": [f"http_error:{type(e).__name__}"]}
+        return self._with_meta(self._parse(status, data, "batch" in payload), meta)
+
+    async def aclose(self):
+        for ep in self.endpoints:
+            idle, ep.aidle = ep.aidle, []
+            for _, w, _ in idle:
+                w.close()
+                try:
+                    await w.wait_closed()
+                except Exception:
+                    pass
+
+PLUGINS: Dict[str, Plugin] = {}
+
+def _plugin_call(args: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    op = str(args.get("op") or args.get("operation") or "")
+    params = args.get("params")
+    if params is None:
+        params = {k: v for k, v in args.items() if k not in ("op", "operation")}
+    return op, params
+
+class _SingleFlight:
+    """
+    Coalescing van gelijktijdige identieke plugin-calls: de eerste caller (leader)
+    doet de backend-call, gelijktijdige callers met dezelfde sleutel wachten op dat
+    resultaat en krijgen een kopie met meta.coalesced. Geen cache: na afloop van de
+    call gaat de volgende caller weer naar de backend.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "Future[Output]"] = {}
+        self._acalls: Dict[Tuple[int, str], "asyncio.Future[Output]"] = {}
+        self.shared = 0
+
+    @staticmethod
+    def key(pname: str, op: str, params: Dict[str, Any]) -> str:
+        return hashlib.sha256(_safe_json([pname, op, params]).encode()).hexdigest()
+
+    @staticmethod
+    def _follower(out: Output) -> Output:
+        out = copy.deepcopy(out)
+        meta = out.get("meta")
+        out["meta"] = {**(meta if isinstance(meta, dict) else {}), "coalesced": True}
+        return out
+
+    @staticmethod
+    def _expired(out: Output) -> bool:
+        """
+        Door de deadline van de leader afgebroken: niet delen met followers uit een andere run.
+        """
+        return not out.get("ok") and "deadline_exceeded" in (out.get("reasons") or [])
+
+    def do(self, key: str, fn: Callable[[], Output]) -> Output:
+        while True:
+            with self._lock:
+                fut = self._calls.get(key)
+                leader = fut is None or fut.done()
+                if leader:
+                    fut = self._calls[key] = Future()
+                else:
+                    self.shared += 1
+            if leader:
+                break
+            dl = _DEADLINE.get()
+            try:
+                out = fut.result(timeout=None if dl is None else max(0.0, dl - time.monotonic()))
+            except FutureTimeoutError:
+                return {"ok": False, "reasons": ["deadline_exceeded"]}
+            if not self._expired(out):
+                return self._follower(out)
+            # leader liep tegen zijn eigen deadline aan: opnieuw, nu als leader onder de eigen deadline
+        try:
+            out = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(out)
+            return out
+        finally:
+            with self._lock:
+                if self._calls.get(key) is fut:
+                    del self._calls[key]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Output]]) -> Output:
+        loop = asyncio.get_running_loop()
+        akey = (id(loop), key)
+        while True:
+            with self._lock:
+                fut = self._acalls.get(akey)
+                leader = fut is None or fut.done()
+                if leader:
+                    fut = self._acalls[akey] = loop.create_future()
+                else:
+                    self.shared += 1
+            if leader:
+                break
+            # asyncio.wait: een geannuleerde follower annuleert de gedeelde call niet, en een
+            # geannuleerde leader annuleert de follower niet
+            dl = _DEADLINE.get()
+            done, _ = await asyncio.wait({fut}, timeout=None if dl is None else max(0.0, dl - time.monotonic()))
+            if not done:
+                return {"ok": False, "reasons": ["deadline_exceeded"]}
+            if fut.cancelled():
+                continue  # leader geannuleerd: opnieuw, nu als leader
+            out = fut.result()
+            if not self._expired(out):
+                return self._follower(out)
+        try:
+            out = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # geen "exception was never retrieved" zonder followers
+            raise
+        else:
+            fut.set_result(out)
+            return out
+        finally:
+            with self._lock:
+                if self._acalls.get(akey) is fut:
+                    del self._acalls[akey]
+
+SINGLEFLIGHT = _SingleFlight()
+
+# Redenen die wijzen op overbelasting van de backend (limiter gaat omlaag)
+_OVERLOAD_REASONS = ("timeout", "network_error")
+# Redenen zonder backend-call: geen latency-sample
+_NO_SAMPLE_REASONS = ("deadline_exceeded", "circuit_open", "shed")
+
+class _LimitWaiter:
+    __slots__ = ("granted", "event", "fut", "loop")
+
+    def __init__(self, event: Optional[threading.Event] = None, fut: "Optional[asyncio.Future[None]]" = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.event = event
+        self.fut = fut
+        self.loop = loop
+
+class _AdaptiveLimiter:
+    """
+    Adaptieve concurrency-limit per plugin (AIMD, gradient-stijl):
+    - baseline: laagste recente latency (drift langzaam mee omhoog), sample: EWMA van de calls
+    - EWMA <= tolerance x baseline en de limit wordt benut: limit += 1/limit (≈ +1 per venster)
+    - EWMA > tolerance x baseline, timeout of netwerkfout: limit *= backoff, hoogstens
+      één keer per venster (EWMA-latency): een burst gelijktijdige timeouts telt als één signaal
+    Calls boven de limit wachten FIFO (max_queue, queue_timeout, begrensd door de deadline);
+    volle wachtrij of te lang gewacht => shed. Zelfde limiter voor threads en asyncio.
+    """
+    def __init__(self, name: str, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 max_queue: int = 32, queue_timeout: float = 5.0, tolerance: float = 2.0, backoff: float = 0.9):
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(self.max_limit, max(self.min_limit, int(initial))))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+        self.tolerance = float(tolerance)
+        self.backoff = float(backoff)
+        self.inflight = 0
+        self.rejected = 0
+        self.baseline: Optional[float] = None
+        self.ewma: Optional[float] = None
+        self._decreased_at = float("-inf")
+        self._waiters: "deque[_LimitWaiter]" = deque()
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        METRICS.set("agentic_plugin_concurrency_limit", int(self.limit), plugin=self.name)
+        METRICS.set("agentic_plugin_inflight", self.inflight, plugin=self.name)
+        METRICS.set("agentic_plugin_queue_depth", len(self._waiters), plugin=self.name)
+
+    def _wait_budget(self) -> float:
+        dl = _DEADLINE.get()
+        return self.queue_timeout if dl is None else max(0.0, min(self.queue_timeout, dl - time.monotonic()))
+
+    def _try(self) -> Optional[_LimitWaiter]:
+        """
+        Onder de lock: direct een slot (None), anders een nieuwe waiter in de rij.
+        Raises _Shed als de rij vol is.
+        """
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self._publish()
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self._shed()
+        w = _LimitWaiter()
+        self._waiters.append(w)
+        self._publish()
+        return w
+
+    def _shed(self):
+        self.rejected += 1
+        METRICS.inc("agentic_plugin_shed_total", plugin=self.name)
+        raise _Shed(int(self.limit), len(self._waiters))
+
+    def _abandon(self, w: _LimitWaiter):
+        """
+        Onder de lock, na het wachten: niet toegekend => uit de rij en shed.
+        """
+        if not w.granted:
+            self._waiters.remove(w)
+            self._publish()
+            self._shed()
+
+    def acquire(self) -> float:
+        """
+        Blokkeert tot er een slot is; geeft de wachttijd (ms) terug. Raises _Shed.
+        """
+        t0 = time.perf_counter()
+        with self._lock:
+            w = self._try()
+            if w is None:
+                return 0.0
+            w.event = threading.Event()
+        w.event.wait(self._wait_budget())
+        with self._lock:
+            self._abandon(w)
+        return _ms(t0)
+
+    async def aacquire(self) -> float:
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            w = self._try()
+            if w is None:
+                return 0.0
+            w.loop, w.fut = loop, loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(w.fut), self._wait_budget())
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = w.granted
+                if not granted:
+                    self._waiters.remove(w)
+                    self._publish()
+            if granted:
+                self.release(None, None)
+            raise
+        with self._lock:
+            self._abandon(w)
+        return _ms(t0)
+
+    @staticmethod
+    def _wake(w: _LimitWaiter) -> bool:
+        if w.event is not None:
+            w.event.set()
+        elif w.loop is not None and w.fut is not None:
+            fut = w.fut
+            try:
+                w.loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+            except RuntimeError:
+                return False  # loop al gesloten: slot niet weggeven
+        return True
+
+    def _decrease(self, ms: float):
+        now = time.monotonic()
+        window = self.ewma if self.ewma is not None else ms  # nog geen EWMA: duur van deze call
+        if (now - self._decreased_at) * 1000 < window:
+            return
+        self._decreased_at = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def _update(self, ms: float, ok: bool):
+        if not ok:
+            self._decrease(ms)
+            return
+        self.ewma = ms if self.ewma is None else 0.2 * ms + 0.8 * self.ewma
+        if self.baseline is None or ms < self.baseline:
+            self.baseline = ms
+        else:
+            self.baseline += (ms - self.baseline) * 0.01  # blijvend tragere backend wordt de nieuwe norm
+        if self.ewma > self.tolerance * max(self.baseline, 1.0):
+            self._decrease(ms)
+        elif self.inflight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
 
-    def run(self, op: str, params: Dict[str, Any]) -> Output:
-        try:
-            p = subprocess.run(
-                self.cmd,
-                input=json.dumps({"op": op, "params": params}),
-                text=True, capture_output=True, timeout=self.timeout
-            )
-        except subprocess.TimeoutExpired:
-            return {"ok": False, "reasons": ["timeout"]}
-        except Exception as e:
-            return {"ok": False, "reasons": [f"subprocess_error:{type(e).__name__}"]}
+    def release(self, ms: Optional[float], ok: Optional[bool]):
+        """
+        Geef het slot vrij; ms/ok (None = geen sample) sturen de limit bij.
+        """
+        with self._lock:
+            if ms is not None and ok is not None:
+                self._update(ms, ok)
+            self.inflight -= 1
+            while self._waiters and self.inflight < int(self.limit):
+                w = self._waiters.popleft()
+                w.granted = True
+                self.inflight += 1
+                if not self._wake(w):
+                    self.inflight -= 1
+            self._publish()
 
-        if p.returncode != 0:
-            return {"ok": False, "reasons": [f"nonzero_exit:{p.returncode}", _short(p.stderr)]}
+    @staticmethod
+    def signal(out: Union[Output, List[Output], None]) -> Optional[bool]:
+        """
+        Uitkomst van een call als limiter-signaal: False bij overbelasting, None zonder sample.
+        Een batch telt als één sample: overbelast als één van de calls dat aangeeft.
+        """
+        if isinstance(out, list):
+            sigs = [_AdaptiveLimiter.signal(o) for o in out]
+            return None if all(s is None for s in sigs) else False not in sigs
+        if out is None:
+            return False
+        reasons = out.get("reasons") or []
+        if out.get("ok") or not reasons:
+            return True
+        head = str(reasons[0])
+        if head in _NO_SAMPLE_REASONS:
+            return None
+        return head not in _OVERLOAD_REASONS
 
-        try:
-            out = json.loads(p.stdout)
-        except Exception as e:
-            return {"ok": False, "reasons": [f"bad_json:{type(e).__name__}", _short(p.stdout)]}
+class _Shed(Exception):
+    def __init__(self, limit: int, queued: int):
+        super().__init__(f"limit={limit} queued={queued}")
 
-        ev = out.get("evidence") or {}
-        ev.setdefault("coverage", 0.80)
-        srcs = ev.get("sources") or []
-        if not srcs:
-            ev["sources"] = [self.name]
-        return {
-            "ok": bool(out.get("ok")),
-            "result": out.get("result"),
-            "evidence": ev,
-            "reasons": out.get("reasons", [])
-        }
+    def output(self) -> Output:
+        return {"ok": False, "reasons": ["shed", str(self)]}
 
-class MetaHTTP(Plugin):
+# Adaptieve limiters per plugin (plugins.yaml: adaptive_limit: true)
+LIMITERS: Dict[str, _AdaptiveLimiter] = {}
+
+def _with_queued(pname: str, out: Any, queued_ms: float) -> Any:
+    if queued_ms > 0:
+        for o in out if isinstance(out, list) else [out]:
+            meta = o.get("meta")
+            o["meta"] = {**(meta if isinstance(meta, dict) else {}), "queued_ms": round(queued_ms, 3)}
+        METRICS.observe("agentic_plugin_queue_ms", queued_ms, plugin=pname)
+    return out
+
+def _limited(pname: str, fn: Callable[[], Any]) -> Any:
     """
-    Eenvoudige HTTP JSON bridge naar externe/“meta” agenten.
-    POST body: {"op": "...", "params": {...}}
+    fn() onder de limiter van de plugin (één slot, ook voor een batch); shed => Output.
     """
-    def __init__(self, name: str, endpoint: str, timeout: float = 8.0, headers: Optional[Dict[str,str]] = None, auth_token: Optional[str] = None):
-        super().__init__(name)
-        self.endpoint = endpoint
-        self.timeout = float(timeout)
-        self.headers = headers or {}
-        self.auth_token = auth_token
+    lim = LIMITERS.get(pname)
+    if lim is None:
+        return fn()
+    try:
+        queued = lim.acquire()
+    except _Shed as e:
+        return e.output()
+    t0, out = time.perf_counter(), None
+    try:
+        out = fn()
+    finally:
+        lim.release(_ms(t0), lim.signal(out))
+    return _with_queued(pname, out, queued)
 
-    def run(self, op: str, params: Dict[str, Any]) -> Output:
-        body = json.dumps({"op": op, "params": params}).encode()
-        hdrs = {"Content-Type": "application/json", **self.headers}
-        if self.auth_token:
-            hdrs["Authorization"] = f"Bearer {self.auth_token}"
-        req = urllib.request.Request(self.endpoint, data=body, headers=hdrs)
-        try:
-            with urllib.request.urlopen(req, timeout=self.timeout) as r:
-                raw = r.read().decode()
-        except urllib.error.URLError:
-            return {"ok": False, "reasons": ["network_error"]}
-        except Exception as e:
-            return {"ok": False, "reasons": [f"http_error:{type(e).__name__}"]}
+async def _alimited(pname: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    lim = LIMITERS.get(pname)
+    if lim is None:
+        return await fn()
+    try:
+        queued = await lim.aacquire()
+    except _Shed as e:
+        return e.output()
+    t0, out = time.perf_counter(), None
+    try:
+        out = await fn()
+    except asyncio.CancelledError:
+        lim.release(None, None)
+        raise
+    except BaseException:
+        lim.release(_ms(t0), False)
+        raise
+    lim.release(_ms(t0), lim.signal(out))
+    return _with_queued(pname, out, queued)
 
+def _register_plugin_tool(pname: str, cacheable: bool = False, cache_ttl: Optional[float] = None,
+                          coalesce: bool = False):
+    def _tool(args: Dict[str, Any]) -> Output:
+        op, params = _plugin_call(args)
+        if not op:
+            return {"ok": False, "reasons": ["missing op"]}
+        t0 = time.perf_counter()
         try:
-            out = json.loads(raw)
-        except Exception as e:
-            return {"ok": False, "reasons": [f"bad_json:{type(e).__name__}", _short(raw)]}
+            call = lambda: _limited(pname, lambda: PLUGINS[pname].run(op, params))
+            if coalesce:
+                return SINGLEFLIGHT.do(_SingleFlight.key(pname, op, params), call)
+            return call()
+        finally:
+            METRICS.observe("agentic_plugin_call_ms", _ms(t0), plugin=pname, op=op)
+    register_tool(pname, _tool, cacheable, cache_ttl)
 
-        ev = out.get("evidence") or {}
-        ev.setdefault("coverage", 0.80)
-        srcs = ev.get("sources") or []
-        if not srcs:
-            ev["sources"] = [self.name]
-        return {
-            "ok": bool(out.get("ok")),
-            "result": out.get("result"),
-            "evidence": ev,
-            "reasons": out.get("reasons", [])
-        }
+    if isinstance(PLUGINS[pname], AsyncPlugin):
+        async def _atool(args: Dict[str, Any]) -> Output:
+            op, params = _plugin_call(args)
+            if not op:
+                return {"ok": False, "reasons": ["missing op"]}
+            plugin = PLUGINS[pname]
+            assert isinstance(plugin, AsyncPlugin)
+            t0 = time.perf_counter()
+            try:
+                call = lambda: _alimited(pname, lambda: plugin.arun(op, params))
+                if coalesce:
+                    return await SINGLEFLIGHT.ado(_SingleFlight.key(pname, op, params), call)
+                return await call()
+            finally:
+                METRICS.observe("agentic_plugin_call_ms", _ms(t0), plugin=pname, op=op)
+        ATOOLS[pname] = _atool
 
-PLUGINS: Dict[str, Plugin] = {}
+    def _split(args_list: List[Dict[str, Any]]) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[Optional[Output]], List[int]]:
+        calls = [_plugin_call(a) for a in args_list]
+        outs: List[Optional[Output]] = [None if op else {"ok": False, "reasons": ["missing op"]} for op, _ in calls]
+        return calls, outs, [k for k, (op, _) in enumerate(calls) if op]
 
-def _register_plugin_tool(pname: str):
-    def _tool(args: Dict[str, Any]) -> Output:
-        op = str(args.get("op") or args.get("operation") or "")
-        params = args.get("params")
-        if params is None:
-            params = {k: v for k, v in args.items() if k not in ("op", "operation")}
-        if not op:
-            return {"ok": False, "reasons": ["missing op"]}
-        return PLUGINS[pname].run(op, params)
-    register_tool(pname, _tool)
+    def _merge(outs: List[Optional[Output]], todo: List[int], res: Any) -> List[Output]:
+        if isinstance(res, dict):  # shed: geldt voor de hele batch
+            res = [copy.deepcopy(res) for _ in todo]
+        for k, o in zip(todo, res):
+            outs[k] = o
+        METRICS.inc("agentic_plugin_batched_calls_total", len(todo), plugin=pname)
+        return [o if o is not None else {"ok": False, "reasons": ["bad_batch"]} for o in outs]
+
+    def _btool(args_list: List[Dict[str, Any]]) -> List[Output]:
+        calls, outs, todo = _split(args_list)
+        if not todo:
+            return _merge(outs, todo, [])
+        t0 = time.perf_counter()
+        try:
+            res = _limited(pname, lambda: PLUGINS[pname].run_batch([calls[k] for k in todo]))
+        finally:
+            METRICS.observe("agentic_plugin_call_ms", _ms(t0), plugin=pname, op="batch")
+        return _merge(outs, todo, res)
+    BATCH_TOOLS[pname] = _btool
+
+    if isinstance(PLUGINS[pname], AsyncPlugin):
+        async def _abtool(args_list: List[Dict[str, Any]]) -> List[Output]:
+            calls, outs, todo = _split(args_list)
+            if not todo:
+                return _merge(outs, todo, [])
+            plugin = PLUGINS[pname]
+            assert isinstance(plugin, AsyncPlugin)
+            t0 = time.perf_counter()
+            try:
+                res = await _alimited(pname, lambda: plugin.arun_batch([calls[k] for k in todo]))
+            finally:
+                METRICS.observe("agentic_plugin_call_ms", _ms(t0), plugin=pname, op="batch")
+            return _merge(outs, todo, res)
+        ABATCH_TOOLS[pname] = _abtool
 
 def load_plugins(manifest_path: Optional[str]) -> List[str]:
     if not manifest_path:
@@ -339,33 +3057,325 @@ def load_plugins(manifest_path: Optional[str]) -> List[str]:
         kind = item.get("kind"); name = item.get("name")
         if not kind or not name:
             raise ValueError("plugin entry requires 'kind' and 'name'")
+        if name in PLUGINS:
+            PLUGINS[name].close()
         if kind == "legacy_subprocess":
-            PLUGINS[name] = LegacySubprocess(
+            PLUGINS[name] = AsyncLegacySubprocess(
                 name=name,
                 cmd=item.get("cmd", ["python3", "legacy_agentic.py"]),
                 timeout=float(item.get("timeout", 8.0)),
+                mode=item.get("mode", "oneshot"),
+                pool_size=int(item.get("pool_size", 2)),
+                max_requests=int(item.get("max_requests", 1000)),
+                max_response_bytes=int(item.get("max_response_bytes", MAX_RESPONSE_BYTES)),
+                max_stderr_bytes=int(item.get("max_stderr_bytes", MAX_STDERR_BYTES)),
             )
         elif kind == "meta_http":
-            PLUGINS[name] = MetaHTTP(
+            PLUGINS[name] = AsyncMetaHTTP(
                 name=name,
-                endpoint=item["endpoint"],
+                endpoint=item.get("endpoints") or item["endpoint"],
                 timeout=float(item.get("timeout", 8.0)),
                 headers=item.get("headers") or {},
                 auth_token=item.get("auth_token"),
+                max_connections=int(item.get("max_connections", 4)),
+                idle_timeout=float(item.get("idle_timeout", 30.0)),
+                hedge=bool(item.get("hedge", False)),
+                hedge_quantile=float(item.get("hedge_quantile", 0.95)),
+                hedge_min_ms=float(item.get("hedge_min_ms", 5.0)),
+                hedge_min_samples=int(item.get("hedge_min_samples", 20)),
+                circuit_threshold=(int(item["circuit_threshold"]) if item.get("circuit_threshold") is not None else None),
+                circuit_cooldown=float(item.get("circuit_cooldown", 30.0)),
+                balance=str(item.get("balance", "round_robin")),
+                health_interval=float(item.get("health_interval", 0.0)),
+                max_response_bytes=int(item.get("max_response_bytes", MAX_RESPONSE_BYTES)),
             )
         else:
             raise ValueError(f"unknown plugin kind: {kind}")
-        _register_plugin_tool(name)
+        LIMITERS.pop(name, None)
+        if item.get("adaptive_limit"):
+            LIMITERS[name] = _AdaptiveLimiter(
+                name,
+                initial=int(item.get("limit_initial", 4)),
+                min_limit=int(item.get("limit_min", 1)),
+                max_limit=int(item.get("limit_max", 64)),
+                max_queue=int(item.get("limit_queue", 32)),
+                queue_timeout=float(item.get("limit_queue_timeout", 5.0)),
+            )
+        _register_plugin_tool(name, bool(item.get("cache", False)), item.get("cache_ttl"), bool(item.get("coalesce", False)))
         loaded.append(name)
     return loaded
 
+def close_plugins():
+    for p in PLUGINS.values():
+        try:
+            p.close()
+        except Exception:
+            pass
+
+async def aclose_plugins():
+    for p in PLUGINS.values():
+        if isinstance(p, AsyncPlugin):
+            try:
+                await p.aclose()
+            except Exception:
+                pass
+    close_plugins()
+
+# ---------- Memory ----------
+# tracemalloc is procesbreed: runs met memory=True delen één tracing-sessie (refcount),
+# en stappen tellen procesbreed mee voor reset_peak/overlap.
+_TM_LOCK = threading.Lock()
+_TM_STATE = {"users": 0, "owned": False, "inflight": 0, "entries": 0}
+
+def _tracemalloc_acquire():
+    with _TM_LOCK:
+        if _TM_STATE["users"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            _TM_STATE["owned"] = True
+        _TM_STATE["users"] += 1
+
+def _tracemalloc_release():
+    with _TM_LOCK:
+        _TM_STATE["users"] -= 1
+        if _TM_STATE["users"] == 0 and _TM_STATE["owned"]:
+            tracemalloc.stop()
+            _TM_STATE["owned"] = False
+
+# ---------- Hooks ----------
+class Hook:
+    """
+    Basis voor Orchestrator-hooks; overschrijf alleen wat nodig is.
+    on_step_start/on_tool_return/on_verify draaien in de thread die de tool uitvoert
+    (worker-thread in DAG-modus, de event loop voor native async tools); de overige
+    hooks in de orchestrator-thread. on_run_end mag het resultaat aanvullen.
+    """
+    def on_run_start(self, orch: "Orchestrator", plan: List[Step]):
+        pass
+    def on_step_start(self, orch: "Orchestrator", st: Step):
+        pass
+    def on_tool_return(self, orch: "Orchestrator", st: Step, out: Optional[Output], err: Optional[Exception]):
+        pass
+    def on_verify(self, orch: "Orchestrator", st: Step, out: Output):
+        pass
+    def on_step_end(self, orch: "Orchestrator", st: Step, outcome: str):
+        pass
+    def on_run_end(self, orch: "Orchestrator", result: Dict[str, Any]):
+        pass
+
+class ProfilerHook(Hook):
+    """
+    cProfile rond de tool-uitvoering van gekozen tasks; per stap een
+    profile_<trace>_<nnn>_<task>.pstats in out_dir. cProfile kan niet twee stappen
+    tegelijk profileren: een stap die start terwijl een andere geprofileerd wordt,
+    wordt overgeslagen. on_run_end zet de bestanden onder result["profiles"].
+    Kwam on_tool_return niet (opgegeven stap), dan ruimen on_step_end/on_run_end het
+    profiel op zodat de klasse-lock en cProfile niet blijven hangen.
+    """
+    _active = threading.Lock()
+
+    def __init__(self, tasks: Iterable[str], out_dir: str = "."):
+        self.tasks = set(tasks)
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._profiles: Dict[int, Tuple[Any, str]] = {}  # id(step) -> (profiel, trace)
+        self._files: Dict[str, List[str]] = {}
+        self._seq = 0
+
+    def on_step_start(self, orch: "Orchestrator", st: Step):
+        if st["task"] not in self.tasks or not ProfilerHook._active.acquire(blocking=False):
+            return
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:  # ander profiler/monitoring-tool actief
+            ProfilerHook._active.release()
+            return
+        with self._lock:
+            self._profiles[id(st)] = (prof, orch.audit.trace)
+
+    def _stop(self, key: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._profiles.pop(key, None)
+        if entry is None:
+            return None
+        entry[0].disable()
+        ProfilerHook._active.release()
+        return entry[0]
+
+    def on_tool_return(self, orch: "Orchestrator", st: Step, out: Optional[Output], err: Optional[Exception]):
+        prof = self._stop(id(st))
+        if prof is None:
+            return
+        trace = orch.audit.trace
+        with self._lock:
+            self._seq += 1
+            name = f"profile_{trace}_{self._seq:03d}_{st['task']}.pstats"
+            self._files.setdefault(trace, []).append(name)
+        os.makedirs(self.out_dir, exist_ok=True)
+        prof.dump_stats(os.path.join(self.out_dir, name))
+
+    def on_step_end(self, orch: "Orchestrator", st: Step, outcome: str):
+        self._stop(id(st))
+
+    def on_run_end(self, orch: "Orchestrator", result: Dict[str, Any]):
+        with self._lock:
+            left = [k for k, (_, trace) in self._profiles.items() if trace == orch.audit.trace]
+        for k in left:
+            self._stop(k)
+        with self._lock:
+            files = self._files.pop(orch.audit.trace, [])
+        if files:
+            result["profiles"] = [os.path.join(self.out_dir, f) for f in files]
+
 # ---------- Orchestrator ----------
+class _DaemonPool:
+    """
+    Begrensde pool van daemon-threads voor lokale tools onder een run-deadline. Threads
+    worden hergebruikt en pas gestart als er geen idle worker is; anders dan bij een
+    ThreadPoolExecutor houdt een hangende tool het proces bij exit niet in leven.
+    """
+    def __init__(self, max_workers: int = 32, name: str = "tool"):
+        self.max_workers = max(1, int(max_workers))
+        self.name = name
+        self.threads = 0
+        self._idle = 0
+        self._jobs: "deque[Tuple[Future, Callable[..., Any], Tuple[Any, ...]]]" = deque()
+        self._cv = threading.Condition()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        fut: Future = Future()
+        with self._cv:
+            self._jobs.append((fut, fn, args))
+            if len(self._jobs) > self._idle and self.threads < self.max_workers:
+                self.threads += 1
+                threading.Thread(target=self._work, name=f"{self.name}-{self.threads}", daemon=True).start()
+            self._cv.notify()
+        return fut
+
+    def _work(self):
+        while True:
+            with self._cv:
+                self._idle += 1
+                while not self._jobs:
+                    self._cv.wait()
+                self._idle -= 1
+                fut, fn, args = self._jobs.popleft()
+            if not fut.set_running_or_notify_cancel():
+                continue  # al opgegeven door de aanroeper (deadline)
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:  # bv. KeyboardInterrupt: in de aanroeper opnieuw raisen
+                fut.set_exception(e)
+
+TOOL_WORKERS = 32
+_TOOL_POOL = _DaemonPool(TOOL_WORKERS, "tool")
+
 class Orchestrator:
-    def __init__(self, policy: Policy, verifier: Verifier, audit: Audit, run_meta: Optional[Dict[str, Any]] = None):
+    """
+    Voert een plan uit onder Policy + Verifier en logt alles in de Audit.
+
+    Sequentieel (default): stappen in planvolgorde. Met policy.max_parallel > 1 of
+    "depends_on" in het plan: DAG-modus. Stappen mogen dan "id" (default: de index
+    als str) en "depends_on" (lijst van ids) hebben; een stap start zodra al zijn
+    dependencies geslaagd zijn, hoogstens max_parallel tegelijk op een thread pool.
+
+    Eventvolgorde in DAG-modus (deterministisch gedefinieerd, alle logging in de
+    aanroepende thread):
+      1. run.start, daarna invalid.step voor ongeldige stappen/ids (planvolgorde)
+      2. per dispatch-ronde: step.start (+ blocked/fail_closed/unknown) voor de nieuw
+         startbare stappen in planvolgorde; policy-checks gebeuren hier, dus atomair
+      3. uitkomsten (success + step.end / abstain / error) in voltooiingsvolgorde;
+         gelijktijdig voltooide stappen in planvolgorde
+      4. skipped voor stappen waarvan een dependency niet slaagde
+      5. fail_closed (time budget) stopt het dispatchen; lopende stappen worden nog afgerond
+    Alle step-events dragen "id"; validate_chain werkt ongewijzigd.
+
+    Met een ResultCache worden CACHEABLE tools eerst in de cache opgezocht (sleutel:
+    task, canonieke args, policy_sha256 uit run_meta). Een hit logt cache.hit na
+    step.start en doorloopt daarna gewoon Verifier.check, success en step.end.
+    Alleen geverifieerde resultaten worden in de cache gezet.
+
+    Met een BlobStore draagt success voor resultaten boven blobs.threshold bytes
+    "result_sha256" en "result_bytes" i.p.v. een afgekapte "result"; het volledige
+    resultaat staat in <root>/<sha256>.
+
+    Timing: success/abstain dragen "timing" {tool_ms, verify_ms, audit_ms, step_ms};
+    audit_ms telt de audit-writes van de stap vóór dat event. Alle fasen gaan ook naar
+    `metrics` (default METRICS); het run-resultaat bevat de totalen.
+
+    hooks: lijst van Hook-instanties (zie Hook voor de threads waarin ze draaien);
+    zonder hooks kost dit één truthiness-check per aanroeppunt.
+
+    span_dir: SpanRecorder voor deze run; spans (run, step, tool, plugin, subprocess,
+    HTTP, verify, audit write/fsync) gaan naar <span_dir>/trace_<trace>.json
+    (result["trace_file"]). Spans van de audit writer-thread worden niet vastgelegd.
+
+    memory=True: tracemalloc (1 frame) tijdens de run. Per stap "memory" {peak_bytes,
+    net_bytes, response_bytes?} in success/abstain; tracemalloc telt procesbreed, dus
+    bij gelijktijdige stappen staat "overlap": true en is peak een bovengrens.
+    run.end en het resultaat krijgen een samenvatting met de memory_top grootste
+    allocatie-sites (0 = geen snapshot).
+
+    Deadline: de resterende run-tijd (Policy.max_sec) gaat via een contextvar naar
+    elke stap. Plugins gebruiken min(timeout, resterend) en breken subprocess/HTTP af;
+    lokale tools draaien in een daemon-thread waarvan het resultaat na de deadline
+    wordt verlaten (Python-threads zijn niet te stoppen), native async tools worden
+    geannuleerd. Zo'n stap logt fail_closed {"reason": "time budget", "in_flight": true}.
+
+    batch_plugins=True: opeenvolgende stappen (sequentieel) of in dezelfde dispatch-ronde
+    startbare stappen (DAG) naar dezelfde plugin gaan samen, hoogstens max_batch, als één
+    batch-envelope in één round trip (BATCH_TOOLS). step.start, verify, success/abstain en
+    step.end blijven per stap; tool_ms is die van de hele round trip, meta.batched de grootte.
+    In DAG-modus telt een batch als één van de max_parallel slots.
+    """
+    def __init__(self, policy: Policy, verifier: Verifier, audit: Audit, run_meta: Optional[Dict[str, Any]] = None,
+                 cache: Optional[ResultCache] = None, metrics: Optional[Metrics] = None,
+                 hooks: Optional[List[Hook]] = None, span_dir: Optional[str] = None,
+                 memory: bool = False, memory_top: int = 10, batch_plugins: bool = False, max_batch: int = 32,
+                 blobs: Optional[BlobStore] = None):
         self.policy = policy
         self.verifier = verifier
         self.audit = audit
         self.run_meta = run_meta or {}
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else METRICS
+        self._totals: Dict[str, float] = {}
+        self._t_run = 0.0
+        self._hooks: List[Hook] = list(hooks or [])
+        self.span_dir = span_dir
+        self._rec: Optional[SpanRecorder] = None
+        self.memory = bool(memory)
+        self.memory_top = max(0, int(memory_top))
+        self._mem_run: Dict[str, Any] = {}
+        self._deadline: Optional[float] = None
+        self._deadline_tok: Optional[contextvars.Token] = None
+        self._expired = False
+        self.batch_plugins = bool(batch_plugins)
+        self.max_batch = max(1, int(max_batch))
+        self.blobs = blobs
+
+    @contextlib.contextmanager
+    def _recording(self, n_steps: int):
+        if self.span_dir is None:
+            yield None
+            return
+        rec = self._rec = SpanRecorder(self.audit.trace)
+        tok = _SPANS.set(rec)
+        try:
+            with rec.span("run", "orchestrator", {"trace": self.audit.trace, "steps": n_steps}):
+                yield rec
+        finally:
+            _SPANS.reset(tok)
+            self._rec = None
+
+    def _emit(self, name: str, *args: Any):
+        for h in self._hooks:
+            try:
+                getattr(h, name)(self, *args)
+            except Exception as e:
+                # Best-effort — een falende hook breekt de run niet
+                sys.stderr.write(f"hook {type(h).__name__}.{name} failed: {e!r}\n")
 
     @staticmethod
     def _norm_step(raw: Step) -> Step:
@@ -376,63 +3386,708 @@ class Orchestrator:
             raise ValueError("task must be non-empty str")
         if not isinstance(a, dict):
             raise ValueError("args must be dict")
-        return {"task": t.strip(), "args": a}
+        st: Step = {"task": t.strip(), "args": a}
+        if raw.get("id") is not None:
+            if not isinstance(raw["id"], (str, int)) or isinstance(raw["id"], bool):
+                raise ValueError("id must be str or int")
+            st["id"] = str(raw["id"])
+        deps = raw.get("depends_on")
+        if deps is not None:
+            if isinstance(deps, (str, int)):
+                deps = [deps]
+            if not isinstance(deps, list) or not all(isinstance(d, (str, int)) for d in deps):
+                raise ValueError("depends_on must be a list of step ids")
+            st["depends_on"] = [str(d) for d in deps]
+        return st
+
+    def _admit(self, i: int, st: Step, ids: bool = False) -> Optional[Callable[[Dict[str, Any]], Output]]:
+        """
+        step.start + policy-checks; geeft de tool terug of None (gelogd waarom niet).
+        """
+        task, args = st["task"], st["args"]
+        start: Dict[str, Any] = {"i": i, "task": task, "args": _short(_safe_json(args))}
+        if ids or "id" in st:
+            start["id"] = st.get("id", str(i))
+        t0 = time.perf_counter()
+        self.audit.log("step.start", start)
+        st["timing"] = {"t0": t0, "audit_ms": _ms(t0)}
+
+        if not self.policy.allowed(task):
+            self.audit.log("blocked", {"task": task})
+            return None
+        if not self.policy.enforce_budget(task):
+            self.audit.log("fail_closed", {"reason": "budget exceeded", "task": task})
+            self.audit.sync()
+            return None
+        fn = TOOLS.get(task)
+        if not fn:
+            self.audit.log("unknown", {"task": task})
+            return None
+        if self.cache is not None and task in CACHEABLE:
+            key = ResultCache.key(task, args, self.run_meta.get("policy_sha256"))
+            hit = self.cache.get(key)
+            if hit is not None:
+                t0 = time.perf_counter()
+                self.audit.log("cache.hit", {"task": task, "key": key, "tier": hit[1]})
+                st["timing"]["audit_ms"] += _ms(t0)
+                return lambda _args, out=hit[0]: out
+            st["cache_key"] = key
+        # na de cache: een hit bereikt de backend niet en kost dus geen rate-token
+        wait = self.policy.take_rate(task)
+        if wait is None:
+            METRICS.inc("agentic_rate_limited_total", task=task, outcome="fail_closed")
+            self.audit.log("fail_closed", {"reason": "rate limit", "task": task})
+            self.audit.sync()
+            return None
+        if wait > 0:
+            # token gereserveerd; het wachten zelf gebeurt bij de uitvoering (_invoke/_ainvoke)
+            METRICS.inc("agentic_rate_limited_total", task=task, outcome="wait")
+            st["rate_wait"] = wait
+        return fn
+
+    def _call(self, fn: Callable[[Dict[str, Any]], Output], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        if self._deadline is not None and st["task"] not in PLUGINS:
+            return self._call_bounded(fn, st)
+        return self._call_here(fn, st)
+
+    def _call_bounded(self, fn: Callable[[Dict[str, Any]], Output], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        """
+        Lokale tool op _TOOL_POOL; verloopt de run-deadline eerst, dan wordt de stap
+        "abandoned" (zie _late) en is de uitkomst DeadlineExceeded.
+        """
+        assert self._deadline is not None
+        fut = _TOOL_POOL.submit(self._call_here, fn, st)
+        try:
+            return fut.result(timeout=max(0.0, self._deadline - time.monotonic()))
+        except FutureTimeoutError:
+            st["abandoned"] = True
+            fut.cancel()
+            return None, DeadlineExceeded(f"{st['task']}: run deadline exceeded")
+
+    def _late(self, st: Step, m0: Optional[Tuple[int, int, bool]]) -> Tuple[Optional[Output], Optional[Exception]]:
+        """
+        Tool kwam terug nadat de stap is opgegeven: geen hooks, verify of memory-meting meer
+        (de run kan al afgelopen zijn); alleen de tracemalloc-teller rechtzetten.
+        """
+        if m0 is not None:
+            with _TM_LOCK:
+                _TM_STATE["inflight"] -= 1
+        return None, DeadlineExceeded(f"{st['task']}: run deadline exceeded")
+
+    def _call_here(self, fn: Callable[[Dict[str, Any]], Output], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        if st.get("abandoned"):
+            return self._late(st, None)  # stond nog in de wachtrij van _TOOL_POOL
+        # Worker-threads erven de contextvars niet: deadline en recorder hier (opnieuw) zetten
+        tok_dl = _DEADLINE.set(self._deadline)
+        try:
+            rec = self._rec
+            if rec is None:
+                return self._invoke(fn, st)
+            tok = _SPANS.set(rec)
+            try:
+                with rec.span(f"step {st['task']}", "step", {"id": st.get("id")}):
+                    return self._invoke(fn, st)
+            finally:
+                _SPANS.reset(tok)
+        finally:
+            _DEADLINE.reset(tok_dl)
+
+    def _invoke(self, fn: Callable[[Dict[str, Any]], Output], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        tm = st.setdefault("timing", {})
+        if st.get("rate_wait"):
+            with _span("rate.wait", "policy"):
+                time.sleep(st["rate_wait"])
+            tm["rate_wait_ms"] = st["rate_wait"] * 1000
+        if self._hooks:
+            self._emit("on_step_start", st)
+        m0 = self._mem_enter() if self.memory else None
+        t0 = time.perf_counter()
+        try:
+            with _span(f"tool {st['task']}", "tool"):
+                out = fn(st["args"])
+        except Exception as e:
+            if st.get("abandoned"):
+                return self._late(st, m0)
+            tm["tool_ms"] = _ms(t0)
+            if m0 is not None:
+                tm["memory"] = self._mem_exit(m0, None)
+            if self._hooks:
+                self._emit("on_tool_return", st, None, e)
+            return None, e
+        except BaseException as e:  # bv. KeyboardInterrupt: hooks (profiler) afsluiten, dan doorgooien
+            if self._hooks and not st.get("abandoned"):
+                self._emit("on_tool_return", st, None, e)
+            raise
+        if st.get("abandoned"):
+            return self._late(st, m0)
+        tm["tool_ms"] = _ms(t0)
+        if m0 is not None:
+            tm["memory"] = self._mem_exit(m0, out)
+        if self._hooks:
+            self._emit("on_tool_return", st, out, None)
+        return self._verify(st, out), None
+
+    def _batchable(self, st: Step, fn: Callable[[Dict[str, Any]], Output]) -> bool:
+        return self.batch_plugins and st["task"] in BATCH_TOOLS and fn is TOOLS.get(st["task"])
+
+    def _call_job(self, job: List[Tuple[Any, Callable[[Dict[str, Any]], Output], Step]]) -> List[Tuple[Optional[Output], Optional[Exception]]]:
+        if len(job) == 1:
+            _, fn, st = job[0]
+            return [self._call(fn, st)]
+        return self._call_batch([st for _, _, st in job])
+
+    def _call_batch(self, sts: List[Step]) -> List[Tuple[Optional[Output], Optional[Exception]]]:
+        tok_dl = _DEADLINE.set(self._deadline)
+        try:
+            rec = self._rec
+            if rec is None:
+                return self._invoke_batch(sts)
+            tok = _SPANS.set(rec)
+            try:
+                with rec.span(f"batch {sts[0]['task']}", "step", {"ids": [st.get("id") for st in sts]}):
+                    return self._invoke_batch(sts)
+            finally:
+                _SPANS.reset(tok)
+        finally:
+            _DEADLINE.reset(tok_dl)
+
+    def _batch_wait(self, sts: List[Step]) -> float:
+        # gereserveerde rate-tokens: de batch wacht op de laatste
+        wait_s = max(st.get("rate_wait") or 0.0 for st in sts)
+        for st in sts:
+            tm = st.setdefault("timing", {})
+            if st.get("rate_wait"):
+                tm["rate_wait_ms"] = wait_s * 1000
+        return wait_s
+
+    def _batch_begin(self, sts: List[Step]) -> Optional[Tuple[int, int, bool]]:
+        if self._hooks:
+            for st in sts:
+                self._emit("on_step_start", st)
+        return self._mem_enter() if self.memory else None
+
+    def _batch_done(self, sts: List[Step], t0: float, m0: Optional[Tuple[int, int, bool]],
+                    outs: Optional[List[Output]], err: Optional[Exception]) -> List[Tuple[Optional[Output], Optional[Exception]]]:
+        ms = _ms(t0)
+        mem = self._mem_exit(m0, None) if m0 is not None else None
+        if outs is not None and len(outs) != len(sts):
+            outs, err = None, RuntimeError(f"batch returned {len(outs)} outputs for {len(sts)} steps")
+        res: List[Tuple[Optional[Output], Optional[Exception]]] = []
+        for k, st in enumerate(sts):
+            tm = st["timing"]
+            tm["tool_ms"] = ms
+            if mem is not None:
+                tm["memory"] = {**mem, "overlap": True}  # één meting voor de hele batch
+            out = outs[k] if outs is not None else None
+            if self._hooks:
+                self._emit("on_tool_return", st, out, err)
+            res.append((None, err) if out is None else (self._verify(st, out), None))
+        return res
+
+    def _invoke_batch(self, sts: List[Step]) -> List[Tuple[Optional[Output], Optional[Exception]]]:
+        wait_s = self._batch_wait(sts)
+        if wait_s:
+            with _span("rate.wait", "policy"):
+                time.sleep(wait_s)
+        m0 = self._batch_begin(sts)
+        t0 = time.perf_counter()
+        try:
+            with _span(f"tool {sts[0]['task']}", "tool", batched=len(sts)):
+                outs = BATCH_TOOLS[sts[0]["task"]]([st["args"] for st in sts])
+        except Exception as e:
+            return self._batch_done(sts, t0, m0, None, e)
+        return self._batch_done(sts, t0, m0, outs, None)
+
+    def _mem_enter(self) -> Tuple[int, int, bool]:
+        with _TM_LOCK:
+            alone = _TM_STATE["inflight"] == 0
+            _TM_STATE["inflight"] += 1
+            _TM_STATE["entries"] += 1
+            if alone:
+                tracemalloc.reset_peak()
+            cur, _ = tracemalloc.get_traced_memory()
+            return cur, _TM_STATE["entries"], alone
+
+    def _mem_exit(self, m0: Tuple[int, int, bool], out: Any) -> Dict[str, Any]:
+        cur0, entries0, alone = m0
+        with _TM_LOCK:
+            _TM_STATE["inflight"] -= 1
+            cur, peak = tracemalloc.get_traced_memory()
+            overlap = not alone or _TM_STATE["entries"] != entries0 or _TM_STATE["inflight"] > 0
+        mem: Dict[str, Any] = {"peak_bytes": max(0, peak - cur0), "net_bytes": cur - cur0}
+        if overlap:
+            mem["overlap"] = True
+        meta = out.get("meta") if isinstance(out, dict) else None
+        if isinstance(meta, dict) and isinstance(meta.get("response_bytes"), int):
+            mem["response_bytes"] = meta["response_bytes"]
+        return mem
+
+    def _mem_summary(self) -> Dict[str, Any]:
+        """
+        Run-samenvatting: grootste stap-piek, netto groei, payload-bytes en top-N sites.
+        """
+        cur, _ = tracemalloc.get_traced_memory()
+        summary = {"max_step_peak_bytes": self._mem_run["max_peak"], "net_bytes": cur - self._mem_run["base"],
+                   "response_bytes": self._mem_run["response_bytes"]}
+        if self.memory_top:
+            snap = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ))
+            summary["top"] = [
+                {"site": f"{st.traceback[0].filename}:{st.traceback[0].lineno}", "size_bytes": st.size, "count": st.count}
+                for st in snap.statistics("lineno")[: self.memory_top]
+            ]
+        return summary
+
+    def _verify(self, st: Step, out: Output) -> Output:
+        t0 = time.perf_counter()
+        with _span("verify", "verify"):
+            out = self.verifier.check(st, out)
+        st["timing"]["verify_ms"] = _ms(t0)
+        if self._hooks:
+            self._emit("on_verify", st, out)
+        return out
+
+    def _settle(self, i: int, st: Step, out: Optional[Output], err: Optional[Exception]) -> bool:
+        task = st["task"]
+        tm = st.get("timing") or {}
+        timing = {k: round(tm.get(k, 0.0), 3) for k in ("tool_ms", "verify_ms", "audit_ms")}
+        if "rate_wait_ms" in tm:
+            timing["rate_wait_ms"] = round(tm["rate_wait_ms"], 3)
+        if "t0" in tm:
+            timing["step_ms"] = round(_ms(tm["t0"]), 3)
+        mem = tm.get("memory")
+        if mem is not None:
+            self._mem_run["max_peak"] = max(self._mem_run["max_peak"], mem["peak_bytes"])
+            self._mem_run["response_bytes"] += mem.get("response_bytes", 0)
+        t_audit = time.perf_counter()
+        if isinstance(err, DeadlineExceeded) or (
+                out is not None and not out.get("ok") and "deadline_exceeded" in (out.get("reasons") or [])):
+            self.audit.log("fail_closed", {"reason": "time budget", "task": task, "in_flight": True})
+            self.audit.sync()
+            self._expired = True
+            outcome = "deadline"
+        elif err is not None or out is None:
+            self.audit.log("error", {"task": task, "err": repr(err)})
+            outcome = "error"
+        elif not out.get("ok"):
+            abstain: Dict[str, Any] = {"task": task, "reasons": out.get("reasons"), "timing": timing}
+            if mem is not None:
+                abstain["memory"] = mem
+            if isinstance(out.get("meta"), dict):
+                abstain["meta"] = out["meta"]
+            self.audit.log("abstain", abstain)
+            outcome = "abstain"
+        else:
+            if self.cache is not None and "cache_key" in st:
+                self.cache.put(st["cache_key"], {k: v for k, v in out.items() if k != "meta"}, CACHEABLE.get(task))
+            success: Dict[str, Any] = {"task": task}
+            if self.blobs is None:
+                success["result"] = _json_prefix(out.get("result"))
+            else:
+                digest, size, text = self.blobs.put(out.get("result"))
+                if digest is None:
+                    success["result"] = _short(text)
+                else:
+                    success["result_sha256"] = digest
+                    success["result_bytes"] = size
+            success["evidence"] = out.get("evidence")
+            success["timing"] = timing
+            if mem is not None:
+                success["memory"] = mem
+            if isinstance(out.get("meta"), dict):
+                success["meta"] = out["meta"]
+            self.audit.log("success", success)
+            end: Dict[str, Any] = {"i": i}
+            if "id" in st:
+                end["id"] = st["id"]
+            self.audit.log("step.end", end)
+            outcome = "success"
+        self._observe(task, outcome, timing, _ms(t_audit))
+        if self._hooks:
+            self._emit("on_step_end", st, outcome)
+        return outcome == "success"
+
+    def _observe(self, task: str, outcome: str, timing: Dict[str, float], settle_audit_ms: float):
+        """
+        Aggregeert de stap-timing in de run-totalen en in self.metrics.
+        """
+        timing = {**timing, "audit_ms": timing["audit_ms"] + settle_audit_ms}
+        for k in ("tool_ms", "verify_ms", "audit_ms"):
+            self._totals[k] += timing[k]
+        m = self.metrics
+        m.inc("agentic_steps_total", task=task, outcome=outcome)
+        m.observe("agentic_step_phase_ms", timing["tool_ms"], task=task, phase="tool")
+        m.observe("agentic_step_phase_ms", timing["verify_ms"], task=task, phase="verify")
+        m.observe("agentic_step_phase_ms", timing["audit_ms"], task=task, phase="audit")
+        if "step_ms" in timing:
+            m.observe("agentic_step_ms", timing["step_ms"] + settle_audit_ms, task=task)
+
+    def _is_dag(self, steps: List[Step]) -> bool:
+        return self.policy.max_parallel > 1 or any(isinstance(r, dict) and "depends_on" in r for r in steps)
+
+    def _end(self, done: int) -> Dict[str, Any]:
+        status = "OK" if done else "NOOP"
+        memory = None
+        if self._mem_run.get("held"):
+            memory = self._mem_summary()
+        self.audit.log("run.end", {"done": done, "status": status, **({"memory": memory} if memory else {})})
+        self.audit.sync()
+        run_ms = _ms(self._t_run)
+        self.metrics.observe("agentic_run_ms", run_ms, status=status)
+        timing = {"run_ms": round(run_ms, 3), **{k: round(v, 3) for k, v in self._totals.items()}}
+        result = {"done": done, "status": status, "trace": self.audit.trace, "audit_file": self.audit.path,
+                  "durability": self.audit.guarantee(), "timing": timing}
+        if memory is not None:
+            result["memory"] = memory
+        if self._hooks:
+            self._emit("on_run_end", result)
+        return result
+
+    def _begin(self, plan: List[Step]):
+        self._t_run = time.perf_counter()
+        self._totals = {"tool_ms": 0.0, "verify_ms": 0.0, "audit_ms": 0.0}
+        self._expired = False
+        self._deadline = time.monotonic() + self.policy.max_sec
+        self._deadline_tok = _DEADLINE.set(self._deadline)
+        if self.memory:
+            _tracemalloc_acquire()
+            self._mem_run = {"held": True, "base": tracemalloc.get_traced_memory()[0], "max_peak": 0, "response_bytes": 0}
+        self.audit.log("run.start", {"n": len(plan), **self.run_meta})
+        if self._hooks:
+            self._emit("on_run_start", plan)
+
+    def _finish(self):
+        if self._deadline_tok is not None:
+            _DEADLINE.reset(self._deadline_tok)
+            self._deadline_tok = None
+        self._deadline = None
+        self.audit.close()
+        if self._mem_run.pop("held", False):
+            _tracemalloc_release()
 
     def run(self, plan: List[Step]) -> Dict[str, Any]:
         t0 = time.time()
-        done = 0
-        self.audit.log("run.start", {"n": len(plan), **self.run_meta})
+        steps = plan[: self.policy.max_steps]
+        with self._recording(len(steps)) as rec:
+            self._begin(plan)
+            try:
+                done = self._run_dag(steps, t0) if self._is_dag(steps) else self._run_seq(steps, t0)
+                res = self._end(done)
+            finally:
+                self._finish()
+        if rec is not None:
+            res["trace_file"] = rec.write(self.span_dir or ".")
+        return res
+
+    async def arun(self, plan: List[Step]) -> Dict[str, Any]:
+        """
+        asyncio-variant van run() met dezelfde policy, events en eventvolgorde.
+        Async tools (ATOOLS, AsyncPlugin) worden ge-await; sync tools draaien in de
+        default executor. Audit.log blijft synchroon: gebruik writer="thread" om
+        schijf-I/O buiten de event loop te houden.
+        """
+        t0 = time.time()
+        steps = plan[: self.policy.max_steps]
+        with self._recording(len(steps)) as rec:
+            self._begin(plan)
+            try:
+                done = await (self._arun_dag(steps, t0) if self._is_dag(steps) else self._arun_seq(steps, t0))
+                res = self._end(done)
+            finally:
+                self._finish()
+        if rec is not None:
+            res["trace_file"] = rec.write(self.span_dir or ".")
+        return res
+
+    async def _acall(self, fn: Callable[[Dict[str, Any]], Output], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        # Native async variant alleen als _admit de geregistreerde tool teruggaf (geen cache-hit);
+        # anders de hele _call (hooks, timing, verify) in de executor
+        afn = ATOOLS.get(st["task"]) if fn is TOOLS.get(st["task"]) else None
+        if afn is None:
+            if self._deadline is not None and st["task"] not in PLUGINS:
+                return await self._acall_bounded(fn, st)
+            return await asyncio.get_running_loop().run_in_executor(None, self._call_here, fn, st)
+        rec = self._rec
+        if rec is None:
+            return await self._ainvoke(afn, st)
+        # Gelijktijdige async stappen delen de loop-thread: elk een eigen track
+        tok = _SPAN_TRACK.set(rec.new_track(f"step {st.get('id', st['task'])}"))
         try:
-            for i, raw in enumerate(plan[: self.policy.max_steps]):
-                if time.time() - t0 > self.policy.max_sec:
-                    self.audit.log("fail_closed", {"reason": "time budget"})
-                    break
+            with rec.span(f"step {st['task']}", "step", {"id": st.get("id")}):
+                return await self._ainvoke(afn, st)
+        finally:
+            _SPAN_TRACK.reset(tok)
 
-                try:
-                    st = self._norm_step(raw)
-                except Exception as e:
-                    self.audit.log("invalid.step", {"i": i, "err": repr(e)})
-                    continue
+    async def _acall_bounded(self, fn: Callable[[Dict[str, Any]], Output], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        """
+        _call_bounded voor arun: de tool draait op _TOOL_POOL (geen tweede executor-thread).
+        """
+        assert self._deadline is not None
+        fut = _TOOL_POOL.submit(self._call_here, fn, st)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(fut), max(0.0, self._deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            st["abandoned"] = True
+            return None, DeadlineExceeded(f"{st['task']}: run deadline exceeded")
+        except asyncio.CancelledError:
+            st["abandoned"] = True
+            raise
+
+    async def _ainvoke(self, afn: Callable[[Dict[str, Any]], Awaitable[Output]], st: Step) -> Tuple[Optional[Output], Optional[Exception]]:
+        tm = st.setdefault("timing", {})
+        if st.get("rate_wait"):
+            with _span("rate.wait", "policy"):
+                await asyncio.sleep(st["rate_wait"])
+            tm["rate_wait_ms"] = st["rate_wait"] * 1000
+        if self._hooks:
+            self._emit("on_step_start", st)
+        m0 = self._mem_enter() if self.memory else None
+        t0 = time.perf_counter()
+        try:
+            with _span(f"tool {st['task']}", "tool"):
+                if self._deadline is None:
+                    out = await afn(st["args"])
+                else:
+                    try:
+                        out = await asyncio.wait_for(afn(st["args"]), max(0.0, self._deadline - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        if self._deadline - time.monotonic() > 0:
+                            raise
+                        raise DeadlineExceeded(f"{st['task']}: run deadline exceeded") from None
+        except Exception as e:
+            tm["tool_ms"] = _ms(t0)
+            if m0 is not None:
+                tm["memory"] = self._mem_exit(m0, None)
+            if self._hooks:
+                self._emit("on_tool_return", st, None, e)
+            return None, e
+        tm["tool_ms"] = _ms(t0)
+        if m0 is not None:
+            tm["memory"] = self._mem_exit(m0, out)
+        if self._hooks:
+            self._emit("on_tool_return", st, out, None)
+        return self._verify(st, out), None
 
-                task, args = st["task"], st["args"]
-                self.audit.log("step.start", {"i": i, "task": task, "args": _short(_safe_json(args))})
+    async def _acall_job(self, job: List[Tuple[Any, Callable[[Dict[str, Any]], Output], Step]]) -> List[Tuple[Optional[Output], Optional[Exception]]]:
+        if len(job) == 1:
+            _, fn, st = job[0]
+            return [await self._acall(fn, st)]
+        sts = [st for _, _, st in job]
+        abfn = ABATCH_TOOLS.get(sts[0]["task"])
+        if abfn is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self._call_batch, sts)
+        rec = self._rec
+        if rec is None:
+            return await self._ainvoke_batch(abfn, sts)
+        tok = _SPAN_TRACK.set(rec.new_track(f"batch {sts[0].get('id', sts[0]['task'])}"))
+        try:
+            with rec.span(f"batch {sts[0]['task']}", "step", {"ids": [st.get("id") for st in sts]}):
+                return await self._ainvoke_batch(abfn, sts)
+        finally:
+            _SPAN_TRACK.reset(tok)
 
-                if not self.policy.allowed(task):
-                    self.audit.log("blocked", {"task": task})
-                    continue
-                if not self.policy.enforce_budget(task):
-                    self.audit.log("fail_closed", {"reason": "budget exceeded", "task": task})
-                    continue
+    async def _ainvoke_batch(self, abfn: Callable[[List[Dict[str, Any]]], Awaitable[List[Output]]],
+                             sts: List[Step]) -> List[Tuple[Optional[Output], Optional[Exception]]]:
+        wait_s = self._batch_wait(sts)
+        if wait_s:
+            with _span("rate.wait", "policy"):
+                await asyncio.sleep(wait_s)
+        m0 = self._batch_begin(sts)
+        t0 = time.perf_counter()
+        try:
+            with _span(f"tool {sts[0]['task']}", "tool", batched=len(sts)):
+                coro = abfn([st["args"] for st in sts])
+                if self._deadline is None:
+                    outs = await coro
+                else:
+                    try:
+                        outs = await asyncio.wait_for(coro, max(0.0, self._deadline - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        if self._deadline - time.monotonic() > 0:
+                            raise
+                        raise DeadlineExceeded(f"{sts[0]['task']}: run deadline exceeded") from None
+        except Exception as e:
+            return self._batch_done(sts, t0, m0, None, e)
+        return self._batch_done(sts, t0, m0, outs, None)
 
-                fn = TOOLS.get(task)
-                if not fn:
-                    self.audit.log("unknown", {"task": task})
-                    continue
+    def _time_up(self, t0: float) -> bool:
+        if self._expired:
+            return True  # fail_closed is al gelogd door de afgebroken stap
+        if time.time() - t0 > self.policy.max_sec:
+            self.audit.log("fail_closed", {"reason": "time budget"})
+            self.audit.sync()
+            return True
+        return False
 
-                try:
-                    out = fn(args)
-                except Exception as e:
-                    self.audit.log("error", {"task": task, "err": repr(e)})
-                    continue
+    def _seq_jobs(self, steps: List[Step], t0: float) -> Iterator[List[Tuple[int, Callable[[Dict[str, Any]], Output], Step]]]:
+        """
+        Sequentiële stappen als jobs (lui: een job is afgerond vóór de volgende stap wordt
+        toegelaten). Met batch_plugins vormen opeenvolgende stappen naar dezelfde plugin één job.
+        """
+        group: List[Tuple[int, Callable[[Dict[str, Any]], Output], Step]] = []
+        for i, raw in enumerate(steps):
+            if group and not (isinstance(raw, dict) and raw.get("task") == group[0][2]["task"]
+                              and len(group) < self.max_batch):
+                yield group
+                group = []
+            if self._time_up(t0):
+                break
 
-                out = self.verifier.check(st, out)
-                if not out.get("ok"):
-                    self.audit.log("abstain", {"task": task, "reasons": out.get("reasons")})
-                    continue
+            try:
+                st = self._norm_step(raw)
+            except Exception as e:
+                self.audit.log("invalid.step", {"i": i, "err": repr(e)})
+                continue
 
-                self.audit.log("success", {
-                    "task": task,
-                    "result": _short(_safe_json(out.get("result"))),
-                    "evidence": out.get("evidence")
-                })
-                done += 1
-                self.audit.log("step.end", {"i": i})
-
-            status = "OK" if done else "NOOP"
-            self.audit.log("run.end", {"done": done, "status": status})
-            return {"done": done, "status": status, "trace": self.audit.trace, "audit_file": self.audit.path}
-        finally:
-            self.audit.close()
+            fn = self._admit(i, st)
+            if fn is None:
+                continue
+            if self._batchable(st, fn):
+                group.append((i, fn, st))
+                continue
+            if group:
+                yield group
+                group = []
+            yield [(i, fn, st)]
+        if group:
+            yield group
+
+    def _run_seq(self, steps: List[Step], t0: float) -> int:
+        done = 0
+        for job in self._seq_jobs(steps, t0):
+            for (i, _, st), (out, err) in zip(job, self._call_job(job)):
+                if self._settle(i, st, out, err):
+                    done += 1
+        return done
+
+    async def _arun_seq(self, steps: List[Step], t0: float) -> int:
+        done = 0
+        for job in self._seq_jobs(steps, t0):
+            for (i, _, st), (out, err) in zip(job, await self._acall_job(job)):
+                if self._settle(i, st, out, err):
+                    done += 1
+        return done
+
+    def _run_dag(self, steps: List[Step], t0: float) -> int:
+        dag = _Dag(self, steps)
+        running: Dict["Future[List[Tuple[Optional[Output], Optional[Exception]]]]", List[str]] = {}
+        with ThreadPoolExecutor(max_workers=self.policy.max_parallel, thread_name_prefix="step") as pool:
+            while True:
+                for job in dag.dispatch(len(running), t0):
+                    running[pool.submit(self._call_job, job)] = [sid for sid, _, _ in job]
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in dag.in_plan_order(finished, running):
+                    for sid, res in zip(running.pop(fut), fut.result()):
+                        dag.settle(sid, *res)
+        return dag.finish()
+
+    async def _arun_dag(self, steps: List[Step], t0: float) -> int:
+        dag = _Dag(self, steps)
+        running: Dict["asyncio.Task[List[Tuple[Optional[Output], Optional[Exception]]]]", List[str]] = {}
+        while True:
+            for job in dag.dispatch(len(running), t0):
+                running[asyncio.ensure_future(self._acall_job(job))] = [sid for sid, _, _ in job]
+            if not running:
+                break
+            finished, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for fut in dag.in_plan_order(finished, running):
+                for sid, res in zip(running.pop(fut), fut.result()):
+                    dag.settle(sid, *res)
+        return dag.finish()
+
+class _Dag:
+    """
+    Scheduler-toestand voor de DAG-modus van Orchestrator (gedeeld door run en arun);
+    de eventvolgorde staat beschreven bij Orchestrator.
+    """
+    def __init__(self, orch: Orchestrator, steps: List[Step]):
+        self.orch = orch
+        self.audit = orch.audit
+        self.nodes: Dict[str, Tuple[int, Step]] = {}
+        self.order: List[str] = []
+        self.state: Dict[str, str] = {}  # id -> running | ok | failed (afwezig = pending)
+        self.timed_out = False
+        self.done = 0
+        for i, raw in enumerate(steps):
+            try:
+                st = orch._norm_step(raw)
+            except Exception as e:
+                self.audit.log("invalid.step", {"i": i, "err": repr(e)})
+                continue
+            sid = st.setdefault("id", str(i))
+            if sid in self.nodes:
+                self.audit.log("invalid.step", {"i": i, "id": sid, "err": "duplicate id"})
+                continue
+            self.nodes[sid] = (i, st)
+            self.order.append(sid)
+        for sid in self.order:
+            i, st = self.nodes[sid]
+            missing = [d for d in st.get("depends_on", []) if d not in self.nodes]
+            if missing:
+                self.audit.log("invalid.step", {"i": i, "id": sid, "err": f"unknown depends_on: {missing}"})
+                self.state[sid] = "failed"
+
+    def dispatch(self, n_running: int, t0: float) -> List[List[Tuple[str, Callable[[Dict[str, Any]], Output], Step]]]:
+        """
+        Logt skipped/step.start/policy-events en geeft de nu te starten jobs terug: één
+        stap, of met batch_plugins een groep stappen naar dezelfde plugin (één slot).
+        """
+        out: List[List[Tuple[str, Callable[[Dict[str, Any]], Output], Step]]] = []
+        groups: Dict[str, List[Tuple[str, Callable[[Dict[str, Any]], Output], Step]]] = {}
+        for sid in self.order:
+            if sid in self.state:
+                continue
+            i, st = self.nodes[sid]
+            deps = [self.state.get(d) for d in st.get("depends_on", [])]
+            if "failed" in deps:
+                self.audit.log("skipped", {"i": i, "id": sid, "task": st["task"], "reason": "dependency failed"})
+                self.state[sid] = "failed"
+                continue
+            group = groups.get(st["task"])
+            joins = group is not None and len(group) < self.orch.max_batch
+            if self.timed_out or (not joins and n_running + len(out) >= self.orch.policy.max_parallel) \
+                    or any(d != "ok" for d in deps):
+                continue
+            if self.orch._time_up(t0):
+                self.timed_out = True
+                continue
+            fn = self.orch._admit(i, st, ids=True)
+            if fn is None:
+                self.state[sid] = "failed"
+                continue
+            self.state[sid] = "running"
+            batchable = self.orch._batchable(st, fn)
+            if joins and batchable:
+                assert group is not None
+                group.append((sid, fn, st))
+                continue
+            job = [(sid, fn, st)]
+            out.append(job)
+            if batchable:
+                groups[st["task"]] = job  # volle groep: deze stap begint een nieuwe
+        return out
+
+    def in_plan_order(self, finished: Iterable[Any], running: Dict[Any, List[str]]) -> List[Any]:
+        return sorted(finished, key=lambda f: self.nodes[running[f][0]][0])
+
+    def settle(self, sid: str, out: Optional[Output], err: Optional[Exception]):
+        i, st = self.nodes[sid]
+        ok = self.orch._settle(i, st, out, err)
+        self.state[sid] = "ok" if ok else "failed"
+        self.done += ok
+
+    def finish(self) -> int:
+        if not self.timed_out:
+            for sid in self.order:
+                if sid not in self.state:
+                    i, _ = self.nodes[sid]
+                    self.audit.log("invalid.step", {"i": i, "id": sid, "err": "dependency cycle"})
+        return self.done
 
 # ---------- Loaders & CLI ----------
 def _load_any(path: str):
@@ -453,7 +4108,8 @@ def _load_policy(path: Optional[str]) -> Tuple[Policy, Dict[str, Any]]:
         return Policy(pol["allowlist"], pol["max_steps"], pol["max_sec"], pol["budgets"]), {"policy_path": None, "policy_sha256": sha}
     data = _load_any(path) or {}
     sha = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
-    return Policy(data.get("allowlist", []), data.get("max_steps", 10), data.get("max_sec", 10.0), data.get("budgets", {})), {"policy_path": path, "policy_sha256": sha}
+    return Policy(data.get("allowlist", []), data.get("max_steps", 10), data.get("max_sec", 10.0), data.get("budgets", {}),
+                  data.get("max_parallel", 1), data.get("rate_limits"), data.get("rate_limit_db")), {"policy_path": path, "policy_sha256": sha}
 
 def _load_plan(path: Optional[str]) -> List[Step]:
     if not path:
@@ -467,9 +4123,13 @@ def _load_plan(path: Optional[str]) -> List[Step]:
         raise ValueError("plan must be a list")
     return data
 
+@functools.lru_cache(maxsize=1)
+def _code_sha() -> str:
+    return hashlib.sha256(inspect.getsource(Orchestrator).encode()).hexdigest()
+
 def _write_bundle(trace: str, plan: List[Step], policy_meta: Dict[str, Any]) -> Optional[str]:
     try:
-        code_sha = hashlib.sha256(inspect.getsource(Orchestrator).encode()).hexdigest()
+        code_sha = _code_sha()
         bundle = {"trace": trace, "plan": plan, **policy_meta, "code_sha256": code_sha}
         path = f"bundle_{trace}.json"
         with open(path, "w", encoding="utf-8") as f:
@@ -478,6 +4138,100 @@ def _write_bundle(trace: str, plan: List[Step], policy_meta: Dict[str, Any]) ->
     except Exception:
         return None
 
+def _batch_plan(line: str) -> Tuple[Any, List[Step]]:
+    data = json.loads(line)
+    if isinstance(data, dict):
+        plan_id, data = data.get("id"), data.get("plan")
+    else:
+        plan_id = None
+    if not isinstance(data, list):
+        raise ValueError("plan must be a list")
+    return plan_id, data
+
+def _dry_run(audit: Audit, plan: List[Step], policy: Policy) -> Dict[str, Any]:
+    """
+    --dry-run: alleen het plan vastleggen (dry_run.validate + run.end NOOP), niets uitvoeren.
+    """
+    audit.log("dry_run.validate", {"plan_len": len(plan), "policy_allowlist": sorted(list(policy.allow))})
+    audit.log("run.end", {"done": 0, "status": "NOOP"})
+    audit.close()
+    return {"done": 0, "status": "NOOP", "trace": audit.trace, "audit_file": audit.path,
+            "durability": audit.guarantee()}
+
+def run_batch(lines: Iterable[str], policy: Policy, verifier: Verifier, new_audit: Callable[[], Audit],
+              run_meta: Optional[Dict[str, Any]] = None, concurrency: int = 1,
+              out: Any = None, bundle_meta: Optional[Dict[str, Any]] = None,
+              cache: Optional[ResultCache] = None, hooks: Optional[List[Hook]] = None,
+              span_dir: Optional[str] = None, memory: bool = False, memory_top: int = 10,
+              batch_plugins: bool = False, max_batch: int = 32, blobs: Optional[BlobStore] = None,
+              dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Voert een JSONL-stroom van plannen uit in één proces. Per regel een plan (lijst) of
+    {"id": ..., "plan": [...]}. Policy, plugins en verifier worden hergebruikt; elk plan
+    krijgt een verse Audit (new_audit) en een kopie van de policy-budgets. Hoogstens
+    `concurrency` plannen tegelijk; per plan één JSON-regel naar `out` in voltooiingsvolgorde
+    ("n" = regelnummer, 0-based). Een ResultCache en BlobStore worden door alle plannen gedeeld.
+    dry_run=True: elk plan wordt alleen geparsed en als NOOP geaudit (zie _dry_run).
+    Geeft een samenvatting terug.
+    """
+    out = out or sys.stdout
+    lock = threading.Lock()
+    stats = {"plans": 0, "ok": 0, "noop": 0, "errors": 0}
+    t0 = time.perf_counter()
+
+    def one(n: int, line: str) -> Dict[str, Any]:
+        try:
+            plan_id, plan = _batch_plan(line)
+        except Exception as e:
+            return {"n": n, "status": "ERROR", "error": repr(e)}
+        if dry_run:
+            return {"n": n, "id": plan_id, **_dry_run(new_audit(), plan, policy)}
+        try:
+            res = Orchestrator(policy.copy(), verifier, new_audit(), run_meta=run_meta, cache=cache,
+                               hooks=hooks, span_dir=span_dir, memory=memory, memory_top=memory_top,
+                               batch_plugins=batch_plugins, max_batch=max_batch, blobs=blobs).run(plan)
+        except Exception as e:
+            return {"n": n, "id": plan_id, "status": "ERROR", "error": repr(e)}
+        if bundle_meta is not None:
+            bundle_path = _write_bundle(res["trace"], plan, bundle_meta)
+            if bundle_path:
+                res["bundle_file"] = bundle_path
+        return {"n": n, "id": plan_id, **res}
+
+    def emit(res: Dict[str, Any]):
+        key = {"OK": "ok", "NOOP": "noop"}.get(res.get("status", ""), "errors")
+        with lock:
+            stats["plans"] += 1
+            stats[key] += 1
+            out.write(json.dumps(res, separators=(",", ":")) + "\n")
+            out.flush()
+
+    numbered = ((n, line) for n, line in enumerate(lines) if line.strip())
+    if concurrency <= 1:
+        for n, line in numbered:
+            emit(one(n, line))
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="plan") as pool:
+            inflight: set = set()
+            for n, line in numbered:
+                # Begrensd aantal plannen in de lucht: invoer wordt niet volledig ingelezen
+                if len(inflight) >= 2 * concurrency:
+                    finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        emit(fut.result())
+                inflight.add(pool.submit(one, n, line))
+            for fut in inflight:
+                emit(fut.result())
+
+    secs = time.perf_counter() - t0
+    return {**stats, "seconds": round(secs, 3), "plans_per_sec": round(stats["plans"] / secs, 1) if secs > 0 else None}
+
+async def _arun_main(orch: Orchestrator, plan: List[Step]) -> Dict[str, Any]:
+    try:
+        return await orch.arun(plan)
+    finally:
+        await aclose_plugins()
+
 def main(argv: Optional[List[str]] = None):
     ap = argparse.ArgumentParser("Agentic 2.0 — micro plugin")
     ap.add_argument("--plan", default=None)
@@ -488,10 +4242,37 @@ def main(argv: Optional[List[str]] = None):
     ap.add_argument("--min_sources", type=int, default=2)
     ap.add_argument("--bundle", action="store_true", help="emit bundle_<trace>.json with plan/policy SHA/code SHA")
     ap.add_argument("--dry-run", action="store_true", help="validate plan/policy and exit without executing tools")
+    ap.add_argument("--aio", action="store_true", help="run the plan with the asyncio orchestrator (Orchestrator.arun)")
+    ap.add_argument("--batch", default=None, help="run many plans: JSONL file (or '-' for stdin), one plan per line")
+    ap.add_argument("--concurrency", type=int, default=1, help="batch: plans run concurrently")
+    ap.add_argument("--cache", action="store_true", help="cache results of cacheable tools (in-memory LRU/TTL)")
+    ap.add_argument("--cache_size", type=int, default=1024, help="cache: max in-memory entries")
+    ap.add_argument("--cache_ttl", type=float, default=300.0, help="cache: default TTL in seconds")
+    ap.add_argument("--cache_db", default=None, help="cache: sqlite file shared across processes (implies --cache)")
+    ap.add_argument("--durability", choices=DURABILITY_MODES, default="per_event", help="when audit events are synced to disk")
+    ap.add_argument("--group_n", type=int, default=32, help="group_commit: sync after this many events")
+    ap.add_argument("--group_ms", type=float, default=50.0, help="group_commit: sync after this many milliseconds")
+    ap.add_argument("--preallocate", type=int, default=0, help="preallocate the audit file in chunks of this many bytes")
+    ap.add_argument("--audit_writer", choices=AUDIT_WRITERS, default="inline", help="write audit lines inline or from a background thread")
+    ap.add_argument("--audit_queue", type=int, default=1024, help="thread writer: max queued audit lines before log() blocks")
+    ap.add_argument("--audit_index", type=int, default=0, help="write a checkpoint to audit_<trace>.idx every N events (0 = off)")
+    ap.add_argument("--merkle", type=int, default=0, help="log a merkle.root event over every N audit events (0 = off)")
+    ap.add_argument("--metrics_out", default=None, help="write latency histograms/counters in Prometheus text format to this file")
+    ap.add_argument("--profile", default=None, help="comma-separated tasks to run under cProfile (one .pstats per step)")
+    ap.add_argument("--profile_dir", default=".", help="directory for profile_<trace>_<n>_<task>.pstats files")
+    ap.add_argument("--trace_spans", nargs="?", const=".", default=None, metavar="DIR",
+                    help="write a Chrome/Perfetto trace_<trace>.json with run/step/plugin/audit spans (default dir: .)")
+    ap.add_argument("--memory", action="store_true", help="per-step tracemalloc peak/net bytes and top allocation sites")
+    ap.add_argument("--memory_top", type=int, default=10, help="memory: allocation sites reported at run.end (0 = none)")
+    ap.add_argument("--batch_plugins", action="store_true", help="send consecutive/ready steps for the same plugin as one batch round trip")
+    ap.add_argument("--max_batch", type=int, default=32, help="batch_plugins: max steps per round trip")
+    ap.add_argument("--blobs", nargs="?", const="blobs", default=None, metavar="DIR",
+                    help="store large step results in DIR/<sha256>; success events carry the digest (default dir: blobs)")
+    ap.add_argument("--blob_threshold", type=int, default=4096, help="blobs: results above this many bytes go to the store")
     args = ap.parse_args(argv)
 
     policy, pol_meta = _load_policy(args.policy)
-    plan = _load_plan(args.plan)
+    plan = _load_plan(args.plan) if not args.batch else []
     loaded = load_plugins(args.plugins)
     run_meta = {
         "policy_path": pol_meta.get("policy_path"),
@@ -501,18 +4282,63 @@ def main(argv: Optional[List[str]] = None):
         "min_src": args.min_sources,
     }
 
-    audit = Audit(path=None, key_hex=args.hmac)
+    def new_audit() -> Audit:
+        return Audit(path=None, key_hex=args.hmac, durability=args.durability,
+                     group_n=args.group_n, group_ms=args.group_ms, preallocate=args.preallocate,
+                     writer=args.audit_writer, queue_size=args.audit_queue, index_every=args.audit_index,
+                     merkle_every=args.merkle)
+
     verifier = Verifier(True, args.min_coverage, args.min_sources)
-    orch = Orchestrator(policy, verifier, audit, run_meta=run_meta)
+    cache = (ResultCache(args.cache_size, args.cache_ttl, args.cache_db)
+             if (args.cache or args.cache_db) and not args.dry_run else None)
+    blobs = BlobStore(args.blobs, args.blob_threshold) if args.blobs and not args.dry_run else None
+    hooks: List[Hook] = []
+    if args.profile:
+        hooks.append(ProfilerHook([t.strip() for t in args.profile.split(",") if t.strip()], args.profile_dir))
+
+    if args.batch:
+        src = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+        try:
+            summary = run_batch(src, policy, verifier, new_audit, run_meta=run_meta,
+                                concurrency=args.concurrency, bundle_meta=(pol_meta if args.bundle else None),
+                                cache=cache, hooks=hooks, span_dir=args.trace_spans, memory=args.memory,
+                                memory_top=args.memory_top, batch_plugins=args.batch_plugins, max_batch=args.max_batch, blobs=blobs,
+                                dry_run=args.dry_run)
+        finally:
+            close_plugins()
+            if cache is not None:
+                cache.close()
+            if src is not sys.stdin:
+                src.close()
+        if cache is not None:
+            summary["cache"] = {"hits": cache.hits, "misses": cache.misses}
+        if blobs is not None:
+            summary["blobs"] = {"stored": blobs.stored, "deduped": blobs.deduped}
+        if args.metrics_out:
+            METRICS.write_prometheus(args.metrics_out)
+        sys.stderr.write(json.dumps(summary) + "\n")
+        return
+
+    audit = new_audit()
+    orch = Orchestrator(policy, verifier, audit, run_meta=run_meta, cache=cache, hooks=hooks,
+                        span_dir=args.trace_spans, memory=args.memory, memory_top=args.memory_top,
+                        batch_plugins=args.batch_plugins, max_batch=args.max_batch, blobs=blobs)
 
     if args.dry_run:
-        audit.log("dry_run.validate", {"plan_len": len(plan), "policy_allowlist": sorted(list(policy.allow))})
-        audit.log("run.end", {"done": 0, "status": "NOOP"})
-        audit.close()
-        print(json.dumps({"done": 0, "status": "NOOP", "trace": audit.trace, "audit_file": audit.path}, indent=2))
+        print(json.dumps(_dry_run(audit, plan, policy), indent=2))
         return
 
-    res = orch.run(plan)
+    if args.aio:
+        res = asyncio.run(_arun_main(orch, plan))
+    else:
+        try:
+            res = orch.run(plan)
+        finally:
+            close_plugins()
+    if cache is not None:
+        cache.close()
+    if args.metrics_out:
+        METRICS.write_prometheus(args.metrics_out)
 
     if args.bundle:
         bundle_path = _write_bundle(res["trace"], plan, pol_meta)
@@ -13,8 +13,13 @@ This script:
         "evidence": {"coverage": float, "sources": [...]},
         "reasons": [str, ...]
     }
+- With --serve it stays alive instead and speaks newline-delimited JSON:
+  one request object per stdin line, one response object per stdout line.
+- A batch envelope {"batch": [{"op": ..., "params": {...}}, ...]} runs every
+  item and answers {"ok": true, "batch": [<output>, ...]} in the same order.
 
-It is designed to be called by LegacySubprocess in agentic2_micro_plugin.py.
+It is designed to be called by LegacySubprocess in agentic2_micro_plugin.py
+(mode "oneshot" runs it once per step, mode "pooled" keeps --serve workers).
 """
 
 from __future__ import annotations
@@ -104,40 +109,82 @@ HANDLERS = {
 # ---------------------------------------------------------------------------
 
 
-def main() -> None:
-    try:
-        raw = sys.stdin.read()
-        data = json.loads(raw or "{}")
-    except Exception:
-        out = _error("invalid JSON on stdin")
-        print(json.dumps(out))
-        return
+def handle_batch(items: Any) -> Output:
+    """
+    Run every request of a batch envelope; one output per item, in order.
+    """
+    if not isinstance(items, list):
+        return _error("batch must be a list")
+    outs = [
+        _error("nested batch") if isinstance(item, dict) and "batch" in item else handle_request(item)
+        for item in items
+    ]
+    return {"ok": True, "batch": outs}
+
+
+def handle_request(data: Any) -> Output:
+    """
+    Dispatch one decoded request object (or batch envelope) to its handler.
+    """
+    if not isinstance(data, dict):
+        return _error("request must be an object")
+
+    if "batch" in data:
+        return handle_batch(data["batch"])
 
     op = str(data.get("op") or data.get("operation") or "").strip()
     params = data.get("params") or {}
 
     if not op:
-        print(json.dumps(_error("missing op")))
-        return
+        return _error("missing op")
 
     if not isinstance(params, dict):
-        print(json.dumps(_error("params must be an object")))
-        return
+        return _error("params must be an object")
 
     handler = HANDLERS.get(op)
     if handler is None:
-        print(json.dumps(_error(f"unknown op: {op}")))
-        return
+        return _error(f"unknown op: {op}")
 
     try:
-        out = handler(params)
+        return handler(params)
     except Exception:
         # Fail safe: log details to stderr, return a generic error to the caller.
         sys.stderr.write("legacy_agentic internal error:\n")
         traceback.print_exc(file=sys.stderr)
-        out = _error("internal error")
+        return _error("internal error")
+
+
+def serve() -> None:
+    """
+    Long-lived worker loop: one JSON request per line in, one JSON response per line out.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except Exception:
+            out = _error("invalid JSON on stdin")
+        else:
+            out = handle_request(data)
+        sys.stdout.write(json.dumps(out) + "\n")
+        sys.stdout.flush()
+
+
+def main() -> None:
+    if "--serve" in sys.argv[1:]:
+        serve()
+        return
+
+    try:
+        raw = sys.stdin.read()
+        data = json.loads(raw or "{}")
+    except Exception:
+        out = _error("invalid JSON on stdin")
+        print(json.dumps(out))
+        return
 
-    print(json.dumps(out))
+    print(json.dumps(handle_request(data)))
 
 
 if __name__ == "__main__":
@@ -3,50 +3,56 @@
 Audit-chain maintenance helper for Open Agentic 2.0.
 
 - Scans all audit_*.jsonl files in the repository root
-- Validates the hash chain using Audit.validate_chain
+- Validates the hash chain in a single streaming pass using Audit.verify_chain
+- HMAC audits are validated with the key for their key_id (KEYS_JSON or keys/);
+  they are skipped, never salvaged, when that key is not available
 - If the chain is broken:
   - Moves the original file to audit_corrupted/<name>
   - Writes a <name>_salvaged.jsonl file with the valid prefix only
 """
 
 import pathlib
-from typing import List, Tuple
+import shutil
 
-from agentic2_micro_plugin import Audit
+from agentic2_micro_plugin import Audit, ChainReport, audit_key_id, resolve_key
 
 CORRUPTED_DIR = pathlib.Path("audit_corrupted")
 
 
-def _read_lines(path: pathlib.Path) -> List[str]:
-    return path.read_text().splitlines()
+def _line_at(path: pathlib.Path, offset: int) -> str:
+    with path.open("rb") as f:
+        f.seek(offset)
+        return f.readline().decode("utf-8", "replace").rstrip("\r\n")
 
 
-def _salvage_file(path: pathlib.Path, lines: List[str]) -> None:
+def _copy_prefix(src: pathlib.Path, dest: pathlib.Path, length: int) -> None:
+    with src.open("rb") as fin, dest.open("wb") as fout:
+        remaining = length
+        while remaining > 0:
+            chunk = fin.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            fout.write(chunk)
+            remaining -= len(chunk)
+
+
+def _salvage_file(path: pathlib.Path, report: ChainReport) -> None:
     """
-    Find the first line where the chain breaks, move the original file
-    to audit_corrupted/, and write a _salvaged version with only
+    Use the first break reported by Audit.verify_chain, move the original
+    file to audit_corrupted/, and write a _salvaged version with only
     the valid prefix of lines.
     """
-    good_lines: List[str] = []
-    broken_at: Tuple[int, str] | None = None
-
-    for idx, line in enumerate(lines, start=1):
-        good_lines.append(line)
-        if not Audit.validate_chain(good_lines, key_hex=None):
-            # Last appended line breaks the chain; remove it again.
-            good_lines.pop()
-            broken_at = (idx, line)
-            break
-
-    if broken_at is None:
+    if report["ok"]:
         print(f"Chain appears valid while salvaging, nothing to do: {path.name}")
         return
 
+    line_no = report["break_index"] + 1
+    bad_line = _line_at(path, report["break_offset"])
+
     CORRUPTED_DIR.mkdir(exist_ok=True)
     corrupted_dest = CORRUPTED_DIR / path.name
-    path.replace(corrupted_dest)
+    shutil.move(str(path), str(corrupted_dest))
 
-    line_no, bad_line = broken_at
     print(f"Broken chain detected in {path.name} at line {line_no}")
     print(f"Offending line:")
     print(bad_line)
@@ -54,8 +60,8 @@ def _salvage_file(path: pathlib.Path, lines: List[str]) -> None:
 
     salvaged_name = f"{path.stem}_salvaged{path.suffix}"
     salvaged_path = path.with_name(salvaged_name)
-    salvaged_path.write_text("\n".join(good_lines) + "\n")
-    print(f"Salvaged audit written to {salvaged_path.name}")
+    _copy_prefix(corrupted_dest, salvaged_path, report["head_offset"])
+    print(f"Salvaged audit written to {salvaged_path.name} ({report['events']} events)")
 
 
 def main() -> None:
@@ -70,15 +76,21 @@ def main() -> None:
         return
 
     for path in audits:
-        lines = _read_lines(path)
-        if not lines:
+        if path.stat().st_size == 0:
             print(f"Empty audit file skipped: {path.name}")
             continue
 
-        if Audit.validate_chain(lines, key_hex=None):
+        key_id = audit_key_id(path)
+        key_hex = resolve_key(key_id)
+        if key_id and key_hex is None:
+            print(f"HMAC audit skipped (no key for key_id {key_id}): {path.name}")
+            continue
+
+        report = Audit.verify_chain(path, key_hex=key_hex)
+        if report["ok"]:
             print(f"Chain OK: {path.name}")
         else:
-            _salvage_file(path, lines)
+            _salvage_file(path, report)
 
 
 if __name__ == "__main__":
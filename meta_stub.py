@@ -5,6 +5,8 @@ Meta HTTP stub for Open Agentic 2.0.
 This is a tiny HTTP JSON server used for local testing of the MetaHTTP plugin.
 
 - Listens by default on 127.0.0.1:8081
+- Speaks HTTP/1.1 keep-alive (one thread per connection), so the pooled
+  MetaHTTP client can reuse connections and be benchmarked locally
 - Accepts POST requests with JSON bodies:
     {"op": "<operation>", "params": {...}}
 - Returns JSON:
@@ -14,6 +16,8 @@ This is a tiny HTTP JSON server used for local testing of the MetaHTTP plugin.
         "evidence": {"coverage": float, "sources": [...]},
         "reasons": [str, ...]
     }
+- A batch envelope {"batch": [{"op": ..., "params": {...}}, ...]} is answered
+  with {"ok": true, "batch": [<output>, ...]} (HTTP 200, one output per item)
 
 This is only a demo/stub and not meant to access the open internet.
 """
@@ -21,7 +25,7 @@ This is only a demo/stub and not meant to access the open internet.
 from __future__ import annotations
 
 import json
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Any, Dict, Tuple
 
 
@@ -99,6 +103,33 @@ HANDLERS = {
 }
 
 
+def dispatch(data: Any) -> Tuple[int, Output]:
+    """
+    Run one decoded request object; returns (HTTP status, output).
+    """
+    if not isinstance(data, dict):
+        return 400, _error("request must be an object")
+
+    op = str(data.get("op") or data.get("operation") or "").strip()
+    params = data.get("params") or {}
+
+    if not op:
+        return 400, _error("missing op")
+
+    if not isinstance(params, dict):
+        return 400, _error("params must be an object")
+
+    handler = HANDLERS.get(op)
+    if handler is None:
+        return 400, _error(f"unknown op: {op}")
+
+    try:
+        return 200, handler(params)
+    except Exception:
+        # Fail safe: do not leak stack traces in the response.
+        return 500, _error("internal error")
+
+
 # ---------------------------------------------------------------------------
 # HTTP server
 # ---------------------------------------------------------------------------
@@ -106,6 +137,8 @@ HANDLERS = {
 
 class MetaStubHandler(BaseHTTPRequestHandler):
     server_version = "MetaStub/0.1"
+    # Persistent connections; every response carries Content-Length.
+    protocol_version = "HTTP/1.1"
 
     def _send_json(self, status: int, payload: Output) -> None:
         body = json.dumps(payload).encode("utf-8")
@@ -125,39 +158,36 @@ class MetaStubHandler(BaseHTTPRequestHandler):
             self._send_json(400, _error("invalid JSON body"))
             return
 
-        op = str(data.get("op") or data.get("operation") or "").strip()
-        params = data.get("params") or {}
-
-        if not op:
-            self._send_json(400, _error("missing op"))
-            return
-
-        if not isinstance(params, dict):
-            self._send_json(400, _error("params must be an object"))
-            return
-
-        handler = HANDLERS.get(op)
-        if handler is None:
-            self._send_json(400, _error(f"unknown op: {op}"))
+        if isinstance(data, dict) and "batch" in data:
+            items = data["batch"]
+            if not isinstance(items, list):
+                self._send_json(400, _error("batch must be a list"))
+                return
+            outs = [
+                _error("nested batch") if isinstance(item, dict) and "batch" in item else dispatch(item)[1]
+                for item in items
+            ]
+            self._send_json(200, {"ok": True, "batch": outs})
             return
 
-        try:
-            out = handler(params)
-        except Exception:
-            # Fail safe: do not leak stack traces in the response.
-            self._send_json(500, _error("internal error"))
-            return
-
-        self._send_json(200, out)
+        self._send_json(*dispatch(data))
 
     def log_message(self, format: str, *args: Any) -> None:  # noqa: A003
         # Keep output quiet by default; override if you want verbose logs.
         return
 
 
+def make_server(host: str = "127.0.0.1", port: int = 8081) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) the stub server; port 0 picks a free port.
+    """
+    httpd = ThreadingHTTPServer((host, port), MetaStubHandler)
+    httpd.daemon_threads = True
+    return httpd
+
+
 def run_server(host: str = "127.0.0.1", port: int = 8081) -> Tuple[str, int]:
-    server_address = (host, port)
-    httpd = HTTPServer(server_address, MetaStubHandler)
+    httpd = make_server(host, port)
     print(f"Meta stub listening on http://{host}:{port}")
     httpd.serve_forever()
     return host, port
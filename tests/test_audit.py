@@ -0,0 +1,245 @@
+"""
+Tests for Audit options: durability modes and the chain they produce.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+
+import pytest
+
+import agentic2_micro_plugin as ag
+from agentic2_micro_plugin import Audit
+
+
+def _write(path: pathlib.Path, **kw) -> Audit:
+    a = Audit(path=str(path), **kw)
+    a.trace = "fixed-trace"
+    for i in range(10):
+        a.log("step.start", {"i": i, "task": "echo"})
+    a.log("run.end", {"done": 10, "status": "OK"})
+    a.close()
+    return a
+
+
+def test_durability_modes_produce_identical_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ag.time, "time", lambda: 1700000000.0)
+
+    ref = tmp_path / "per_event.jsonl"
+    a = _write(ref)
+    assert a.guarantee() == {"mode": "per_event", "syncs": 11}
+
+    for mode, kw in [
+        ("group_commit", {"group_n": 4, "group_ms": 60_000}),
+        ("fdatasync", {"preallocate": 4096}),
+    ]:
+        path = tmp_path / f"{mode}.jsonl"
+        _write(path, durability=mode, **kw)
+        assert path.read_bytes() == ref.read_bytes()
+
+    lines = ref.read_text(encoding="utf-8").splitlines()
+    assert Audit.validate_chain(lines) is True
+
+
+def test_group_commit_batches_syncs(tmp_path):
+    a = _write(tmp_path / "a.jsonl", durability="group_commit", group_n=4, group_ms=60_000)
+    # 11 events => 2 full groups + 1 barrier in close()
+    assert a.guarantee()["syncs"] == 3
+    assert a.guarantee()["max_unsynced_events"] == 4
+
+
+@pytest.mark.parametrize("writer", ["inline", "thread"])
+def test_group_commit_syncs_an_idle_audit_after_group_ms(tmp_path, writer):
+    import time
+
+    a = Audit(path=str(tmp_path / "a.jsonl"), durability="group_commit", group_n=100, group_ms=30, writer=writer)
+    a.log("step.start", {"i": 0})
+    deadline = time.monotonic() + 2.0
+    while a.syncs == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert a.syncs == 1  # no further log() call needed
+    a.close()
+    assert a.syncs == 1  # nothing left for the close() barrier
+
+
+def test_validate_chain_ignores_preallocated_tail(tmp_path):
+    path = tmp_path / "a.jsonl"
+    _write(path)
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 64)  # simulated crash before close() truncated the file
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert Audit.validate_chain(lines) is True
+
+
+def test_thread_writer_matches_inline_and_drains_on_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(ag.time, "time", lambda: 1700000000.0)
+    ref = tmp_path / "inline.jsonl"
+    _write(ref)
+
+    path = tmp_path / "thread.jsonl"
+    a = _write(path, writer="thread", queue_size=2, durability="group_commit", group_n=8)
+    assert path.read_bytes() == ref.read_bytes()
+    assert a.guarantee()["writer"] == "thread"
+
+
+def test_thread_writer_drained_when_run_raises(tmp_path, monkeypatch):
+    from agentic2_micro_plugin import Orchestrator, Policy, Verifier
+
+    def boom(args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setitem(ag.TOOLS, "boom", boom)
+    a = Audit(path=str(tmp_path / "a.jsonl"), writer="thread", queue_size=1)
+    orch = Orchestrator(Policy(["boom"]), Verifier(), a)
+    try:
+        orch.run([{"task": "boom"}])
+    except KeyboardInterrupt:
+        pass
+    lines = (tmp_path / "a.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(x)["type"] for x in lines] == ["run.start", "step.start"]
+    assert Audit.validate_chain(lines) is True
+
+
+def test_thread_writer_failure_leaves_chain_state_untouched(tmp_path):
+    a = Audit(path=str(tmp_path / "a.jsonl"), writer="thread", merkle_every=4)
+    a.log("step.start", {"i": 0})
+    a.sync()
+    a._fh.close()  # the next write fails in the writer thread
+    a.log("step.start", {"i": 1})
+    with pytest.raises(RuntimeError):
+        a.sync()
+    state = (a.prev, a._n, a._end, len(a._leaves))
+    with pytest.raises(RuntimeError):
+        a.log("step.start", {"i": 2})
+    assert (a.prev, a._n, a._end, len(a._leaves)) == state
+    a.close()
+
+
+def test_verify_chain_reports_first_break(tmp_path):
+    path = tmp_path / "a.jsonl"
+    _write(path)
+    data = path.read_bytes()
+    lines = data.splitlines(keepends=True)
+    lines[4] = lines[4].replace(b'"i":4', b'"i":9')
+    path.write_bytes(b"".join(lines))
+
+    report = Audit.verify_chain(path)
+    assert report["ok"] is False
+    assert report["events"] == 4
+    assert report["break_index"] == 4
+    assert report["break_offset"] == report["head_offset"] == sum(map(len, lines[:4]))
+    assert report["head"] == json.loads(lines[3])["chain"]
+
+    # Same answer from an in-memory line iterator
+    text = path.read_text(encoding="utf-8").splitlines()
+    assert Audit.verify_chain(iter(text)) == report
+
+
+def test_maintain_audits_salvages_valid_prefix(tmp_path, monkeypatch, capsys):
+    import maintain_audits
+
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "audit_x.jsonl"
+    _write(path)
+    lines = path.read_bytes().splitlines(keepends=True)
+    lines[-1] = lines[-1].replace(b'"OK"', b'"KO"')
+    path.write_bytes(b"".join(lines))
+
+    maintain_audits.main()
+
+    assert "at line 11" in capsys.readouterr().out
+    assert (tmp_path / "audit_corrupted" / "audit_x.jsonl").exists()
+    salvaged = tmp_path / "audit_x_salvaged.jsonl"
+    assert salvaged.read_bytes() == b"".join(lines[:-1])
+    assert Audit.verify_chain(salvaged)["events"] == 10
+
+
+def test_index_checkpoints_verify_range_and_resume(tmp_path):
+    path = tmp_path / "audit_t.jsonl"
+    a = _write(path, index_every=4)
+    cps = Audit.load_index(path)
+    assert [cp["n"] for cp in cps] == [4, 8]
+    assert cps[-1]["chain"] == json.loads(path.read_bytes().splitlines()[7])["chain"]
+
+    tail = Audit.verify_range(path, start=9)
+    assert tail["ok"] and tail["start_event"] == 8 and tail["events"] == 3
+
+    one = Audit.verify_range(path, start=5, stop=6)
+    assert one["ok"] and one["start_event"] == 4 and one["events"] == 2
+
+    # Crash: torn last line. resume() drops it and continues the chain.
+    with open(path, "ab") as f:
+        f.write(b'{"ts":1,"trace":"fixed-trace","ty')
+    b = Audit.resume(path, index_every=4)
+    assert b.trace == a.trace and b.prev == a.prev
+    b.log("run.resume", {})
+    b.close()
+    report = Audit.verify_chain(path)
+    assert report["ok"] and report["events"] == 12
+    assert [cp["n"] for cp in Audit.load_index(path)] == [4, 8, 12]
+
+
+@pytest.mark.parametrize("index_every", [0, 3])
+def test_resume_restores_merkle_state(tmp_path, index_every):
+    key = "11" * 32
+    path = tmp_path / "audit_m.jsonl"
+    a = Audit(path=str(path), key_hex=key, merkle_every=4, index_every=index_every)
+    for i in range(6):  # root over 0..3, leaves 4 and 5 unrooted at the "crash"
+        a.log("step.start", {"i": i})
+    a._fh.close()
+    if a._idx is not None:
+        a._idx.close()
+
+    b = Audit.resume(path, key_hex=key, merkle_every=4, index_every=index_every)
+    assert b._leaf_n == 4 and len(b._leaves) == 2
+    for i in range(6, 9):
+        b.log("step.start", {"i": i})
+    b.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    roots = [json.loads(x)["details"] for x in lines if json.loads(x)["type"] == "merkle.root"]
+    assert [(r["start"], r["count"]) for r in roots] == [(0, 4), (4, 4), (8, 1)]
+    assert Audit.verify_chain(path, key_hex=key)["ok"]
+    assert Audit.verify_merkle(path, key_hex=key, workers=1)["ok"]
+
+
+def test_resume_refuses_broken_chain(tmp_path):
+    path = tmp_path / "audit_t.jsonl"
+    _write(path, index_every=4)
+    lines = path.read_bytes().splitlines(keepends=True)
+    lines[9] = lines[9].replace(b'"i":9', b'"i":1')
+    path.write_bytes(b"".join(lines))
+    with pytest.raises(ValueError):
+        Audit.resume(path)
+
+
+def test_merkle_roots_proofs_and_parallel_verify(tmp_path):
+    key = "11" * 32
+    path = tmp_path / "audit_m.jsonl"
+    _write(path, key_hex=key, merkle_every=4)  # 11 events => roots after 4, 8 and 3 (close)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    roots = [json.loads(x)["details"] for x in lines if json.loads(x)["type"] == "merkle.root"]
+    assert [(r["start"], r["count"]) for r in roots] == [(0, 4), (4, 4), (8, 3)]
+    assert Audit.verify_chain(path, key_hex=key)["ok"]
+
+    for idx in (0, 6, 12):
+        proof = Audit.merkle_proof(path, idx)
+        assert len(proof["path"]) <= 2
+        assert Audit.check_merkle_proof(proof, key_hex=key)
+    with pytest.raises(ValueError):
+        Audit.merkle_proof(path, 4)  # the first merkle.root line
+
+    proof = Audit.merkle_proof(path, 6)
+    assert not Audit.check_merkle_proof(proof, key_hex="22" * 32)
+    proof["event"] = proof["event"].replace('"i":5', '"i":7')
+    assert not Audit.check_merkle_proof(proof, key_hex=key)
+
+    report = Audit.verify_merkle(path, key_hex=key, workers=2)
+    assert report == {"ok": True, "batches": 3, "leaves": 11, "bad": [], "unrooted": 0}
+
+    lines[6] = lines[6].replace('"i":5', '"i":7')
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    report = Audit.verify_merkle(path, key_hex=key, workers=1)
+    assert report["ok"] is False and report["bad"] == [4]
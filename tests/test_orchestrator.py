@@ -0,0 +1,550 @@
+"""
+Tests for Orchestrator execution modes and run-level options.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import pathlib
+import time
+
+import pytest
+
+import agentic2_micro_plugin as ag
+from agentic2_micro_plugin import Audit, Orchestrator, Policy, Verifier
+
+
+def _events(res):
+    lines = pathlib.Path(res["audit_file"]).read_text(encoding="utf-8").splitlines()
+    assert Audit.validate_chain(lines) is True
+    return [json.loads(x) for x in lines]
+
+
+@pytest.fixture
+def slow_tool(monkeypatch):
+    def slow(args):
+        time.sleep(float(args.get("sec", 0.2)))
+        if args.get("fail"):
+            return {"ok": False, "reasons": ["asked to fail"]}
+        return {"ok": True, "result": args.get("msg"), "evidence": {"coverage": 0.9, "sources": ["a", "b"]}}
+
+    monkeypatch.setitem(ag.TOOLS, "slow", slow)
+
+
+def test_dag_runs_independent_steps_concurrently(tmp_path, slow_tool):
+    policy = Policy(["slow", "summarize"], max_steps=8, max_parallel=3)
+    plan = [
+        {"id": "a", "task": "slow", "args": {"msg": "a"}},
+        {"id": "b", "task": "slow", "args": {"msg": "b"}},
+        {"id": "c", "task": "slow", "args": {"msg": "c"}},
+        {"id": "sum", "task": "summarize", "args": {"text": "abc"}, "depends_on": ["a", "b", "c"]},
+    ]
+    t0 = time.perf_counter()
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl"))).run(plan)
+    assert time.perf_counter() - t0 < 0.5
+    assert res["done"] == 4
+
+    evs = _events(res)
+    starts = [e["details"]["id"] for e in evs if e["type"] == "step.start"]
+    assert starts == ["a", "b", "c", "sum"]
+    types = [e["type"] for e in evs]
+    # all three fan-out steps start before any of them completes; summarize starts last
+    assert types[1:4] == ["step.start"] * 3
+    assert types[-4:] == ["step.start", "success", "step.end", "run.end"]
+
+
+def test_dag_skips_failed_dependencies_and_reports_cycles(tmp_path, slow_tool):
+    policy = Policy(["slow"], max_steps=8, budgets={"slow": 2})
+    plan = [
+        {"id": "bad", "task": "slow", "args": {"sec": 0, "fail": True}},
+        {"id": "after", "task": "slow", "args": {"sec": 0}, "depends_on": "bad"},
+        {"id": "x", "task": "slow", "args": {"sec": 0}, "depends_on": ["y"]},
+        {"id": "y", "task": "slow", "args": {"sec": 0}, "depends_on": ["x"]},
+        {"id": "ok1", "task": "slow", "args": {"sec": 0}},
+        {"id": "over", "task": "slow", "args": {"sec": 0}},
+    ]
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl"))).run(plan)
+    assert res["done"] == 1
+
+    evs = _events(res)
+    by_type = {}
+    for e in evs:
+        by_type.setdefault(e["type"], []).append(e["details"])
+    assert [d["id"] for d in by_type["skipped"]] == ["after"]
+    assert {d["id"] for d in by_type["invalid.step"]} == {"x", "y"}
+    assert by_type["fail_closed"] == [{"reason": "budget exceeded", "task": "slow"}]
+
+
+def test_arun_awaits_async_tools_and_adapts_sync_tools(tmp_path, monkeypatch):
+    async def aslow(args):
+        await asyncio.sleep(0.2)
+        return {"ok": True, "result": args["msg"], "evidence": {"coverage": 0.9, "sources": ["a", "b"]}}
+
+    monkeypatch.setitem(ag.TOOLS, "aslow", None)
+    monkeypatch.setitem(ag.ATOOLS, "aslow", None)
+    ag.register_tool("aslow", aslow)
+
+    policy = Policy(["aslow", "echo"], max_steps=8, max_parallel=4)
+    plan = [{"task": "aslow", "args": {"msg": str(i)}} for i in range(4)] + [{"task": "echo", "args": {"msg": "hi"}}]
+    audit = Audit(path=str(tmp_path / "a.jsonl"), writer="thread")
+
+    t0 = time.perf_counter()
+    res = asyncio.run(Orchestrator(policy, Verifier(True, 0.75, 2), audit).arun(plan))
+    assert time.perf_counter() - t0 < 0.5
+    assert res["done"] == 5
+    assert [e["type"] for e in _events(res)].count("success") == 5
+
+    # the sync shim keeps async tools usable from run(), also inside a running event loop
+    assert ag.TOOLS["aslow"]({"msg": "x"})["result"] == "x"
+
+    async def from_loop():
+        return ag.TOOLS["aslow"]({"msg": "y"})
+
+    assert asyncio.run(from_loop())["result"] == "y"
+
+
+def test_run_batch_gives_each_plan_its_own_audit_and_budget(tmp_path, slow_tool):
+    import io
+
+    policy = Policy(["slow"], max_steps=4, budgets={"slow": 1})
+    lines = [
+        json.dumps([{"task": "slow", "args": {"sec": 0.2}}]),
+        json.dumps({"id": "p2", "plan": [{"task": "slow", "args": {"sec": 0.2}}]}),
+        "",
+        "not json",
+        json.dumps([{"task": "slow", "args": {"sec": 0.2}}]),
+    ]
+    counter = iter(range(100))
+
+    def new_audit():
+        return Audit(path=str(tmp_path / f"a{next(counter)}.jsonl"))
+
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    summary = ag.run_batch(lines, policy, Verifier(True, 0.75, 2), new_audit, concurrency=3, out=out)
+    assert time.perf_counter() - t0 < 0.5
+    assert summary["plans"] == 4 and summary["ok"] == 3 and summary["errors"] == 1
+
+    results = {r["n"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert sorted(results) == [0, 1, 3, 4]
+    assert results[1]["id"] == "p2"
+    assert results[3]["status"] == "ERROR"
+    audits = {results[n]["audit_file"] for n in (0, 1, 4)}
+    assert len(audits) == 3
+    for n in (0, 1, 4):
+        assert results[n]["done"] == 1
+        _events(results[n])
+    # the loaded policy itself is not consumed by batch runs
+    assert policy.budgets == {"slow": 1}
+
+
+def test_run_batch_dry_run_executes_nothing(tmp_path, monkeypatch):
+    import io
+
+    calls = []
+    monkeypatch.setitem(ag.TOOLS, "spy", lambda args: calls.append(args) or {"ok": True})
+    counter = iter(range(100))
+    out = io.StringIO()
+    lines = [json.dumps([{"task": "spy", "args": {}}] * 2), "not json"]
+    summary = ag.run_batch(lines, Policy(["spy"]), Verifier(True, 0.75, 2),
+                           lambda: Audit(path=str(tmp_path / f"a{next(counter)}.jsonl")), out=out, dry_run=True)
+    assert calls == [] and summary["noop"] == 1 and summary["errors"] == 1
+    res = json.loads(out.getvalue().splitlines()[0])
+    assert res["status"] == "NOOP"
+    assert [e["type"] for e in _events(res)] == ["dry_run.validate", "run.end"]
+
+
+def test_run_batch_forwards_memory_top(tmp_path, monkeypatch):
+    import io
+
+    monkeypatch.setitem(ag.TOOLS, "spy", lambda args: {"ok": True, "result": 1,
+                                                       "evidence": {"coverage": 0.9, "sources": ["a", "b"]}})
+    counter = iter(range(100))
+    out = io.StringIO()
+    ag.run_batch([json.dumps([{"task": "spy", "args": {}}])] * 2, Policy(["spy"]), Verifier(True, 0.75, 2),
+                 lambda: Audit(path=str(tmp_path / f"a{next(counter)}.jsonl")), out=out, memory=True, memory_top=1)
+    tops = [json.loads(line)["memory"]["top"] for line in out.getvalue().splitlines()]
+    assert [len(t) for t in tops] == [1, 1]
+
+
+def test_result_cache_hits_are_logged_and_still_verified(tmp_path, monkeypatch):
+    calls = []
+
+    def lookup(args):
+        calls.append(args)
+        return {"ok": True, "result": args["q"], "evidence": {"coverage": 0.8, "sources": ["a", "b"]}}
+
+    monkeypatch.setitem(ag.TOOLS, "lookup", None)
+    monkeypatch.setitem(ag.CACHEABLE, "lookup", None)
+    ag.register_tool("lookup", lookup, cacheable=True)
+
+    cache = ag.ResultCache(max_entries=8, ttl=60, path=str(tmp_path / "cache.db"))
+    policy = Policy(["lookup"], max_steps=8)
+    meta = {"policy_sha256": "p1"}
+    plan = [{"task": "lookup", "args": {"q": "x", "n": 1}}, {"task": "lookup", "args": {"n": 1, "q": "x"}}]
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl")), meta, cache).run(plan)
+    assert res["done"] == 2 and len(calls) == 1
+    types = [e["type"] for e in _events(res)]
+    assert types.count("cache.hit") == 1
+    assert types[types.index("cache.hit") - 1] == "step.start"
+    assert types[types.index("cache.hit") + 1] == "success"
+
+    # the sqlite tier is shared; a stricter verifier still rejects the cached result
+    other = ag.ResultCache(path=str(tmp_path / "cache.db"))
+    strict = Orchestrator(policy, Verifier(True, 0.9, 2), Audit(path=str(tmp_path / "b.jsonl")), meta, other)
+    res = strict.run(plan[:1])
+    assert res["done"] == 0 and len(calls) == 1
+    hit = [e["details"] for e in _events(res) if e["type"] == "cache.hit"]
+    assert hit[0]["tier"] == "disk"
+    # a different policy hash is a different key
+    Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "c.jsonl")), {"policy_sha256": "p2"}, other).run(plan[:1])
+    assert len(calls) == 2
+    cache.close()
+    other.close()
+
+
+def test_cache_hits_do_not_spend_rate_tokens(tmp_path, monkeypatch):
+    monkeypatch.setitem(ag.TOOLS, "lookup", None)
+    monkeypatch.setitem(ag.CACHEABLE, "lookup", None)
+    ag.register_tool("lookup", lambda args: {"ok": True, "result": args["q"],
+                                             "evidence": {"coverage": 0.8, "sources": ["a", "b"]}}, cacheable=True)
+    policy = Policy(["lookup"], max_steps=8,
+                    rate_limits={"lookup": {"rate": 0.001, "burst": 1, "on_limit": "fail_closed"}})
+    plan = [{"task": "lookup", "args": {"q": "x"}}] * 3
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl")),
+                       cache=ag.ResultCache()).run(plan)
+    assert res["done"] == 3  # one token for the miss; the two hits never reach the bucket
+
+
+def test_result_cache_lru_and_ttl():
+    cache = ag.ResultCache(max_entries=2, ttl=60)
+    for k in "abc":
+        cache.put(k, {"ok": True, "result": k})
+    assert cache.get("a") is None
+    assert cache.get("c")[0]["result"] == "c"
+    cache.put("d", {"ok": True}, ttl=-1)
+    assert cache.get("d") is None
+
+
+def test_blob_store_keeps_large_results_out_of_the_audit(tmp_path, slow_tool):
+    big = {"rows": ["x" * 100] * 100, "a": 1}
+    assert ag._json_prefix(big) == ag._short(ag._safe_json(big))
+
+    blobs = ag.BlobStore(str(tmp_path / "blobs"), threshold=1024)
+    plan = [{"task": "slow", "args": {"sec": 0, "msg": "small"}}, {"task": "slow", "args": {"sec": 0, "msg": big}}]
+    digests = []
+    for name in ("a", "b"):
+        res = Orchestrator(Policy(["slow"], max_steps=8), Verifier(True, 0.75, 2),
+                           Audit(path=str(tmp_path / f"{name}.jsonl")), blobs=blobs).run(plan)
+        small, large = [e["details"] for e in _events(res) if e["type"] == "success"]
+        assert small["result"] == '"small"' and "result_sha256" not in small
+        assert "result" not in large and large["result_bytes"] == len(ag._safe_json(big))
+        digests.append(large["result_sha256"])
+
+    assert digests[0] == digests[1] and (blobs.stored, blobs.deduped) == (1, 1)  # deduplicated across runs
+    assert blobs.get(digests[0]) == big
+    assert sorted(p.name for p in (tmp_path / "blobs").iterdir()) == [digests[0]]  # no temp files left
+    pathlib.Path(blobs.path(digests[0])).write_text("{}", encoding="utf-8")
+    with pytest.raises(ValueError):
+        blobs.get(digests[0])
+
+
+def test_blob_store_syncs_new_blobs_and_reads_back_non_json(tmp_path, monkeypatch):
+    synced = []
+    fsync = ag.os.fsync
+    monkeypatch.setattr(ag.os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+    blobs = ag.BlobStore(str(tmp_path / "blobs"), threshold=16)
+
+    odd = set(range(100))  # not JSON: stored as its str() in a JSON string
+    digest, size, _ = blobs.put(odd)
+    assert blobs.get(digest) == str(odd)
+    assert len(synced) == 2  # the blob file and its directory, before the digest is handed out
+    blobs.put(odd)
+    assert len(synced) == 2 and blobs.deduped == 1
+
+
+def test_step_timing_and_metrics_export(tmp_path, slow_tool):
+    metrics = ag.Metrics()
+    policy = Policy(["slow"], max_steps=8)
+    plan = [{"task": "slow", "args": {"sec": 0.05}}, {"task": "slow", "args": {"sec": 0, "fail": True}}]
+    audit = Audit(path=str(tmp_path / "a.jsonl"))
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), audit, metrics=metrics).run(plan)
+    assert res["timing"]["tool_ms"] >= 50 and res["timing"]["run_ms"] >= res["timing"]["tool_ms"]
+
+    evs = _events(res)
+    success = next(e["details"] for e in evs if e["type"] == "success")
+    abstain = next(e["details"] for e in evs if e["type"] == "abstain")
+    assert set(success["timing"]) == {"tool_ms", "verify_ms", "audit_ms", "step_ms"}
+    assert success["timing"]["tool_ms"] >= 50
+    assert abstain["timing"]["tool_ms"] < 50
+
+    snap = metrics.snapshot()
+    assert snap["tasks"]["slow"]["steps"] == 2 and snap["tasks"]["slow"]["abstain_rate"] == 0.5
+    tool = next(h for h in snap["histograms"] if h["name"] == "agentic_step_phase_ms" and h["labels"]["phase"] == "tool")
+    assert tool["count"] == 2 and tool["p50"] <= tool["p99"] <= tool["max_ms"]
+
+    out = tmp_path / "metrics.prom"
+    metrics.write_prometheus(str(out))
+    text = out.read_text(encoding="utf-8")
+    assert "# TYPE agentic_step_phase_ms histogram" in text
+    assert 'agentic_step_phase_ms_bucket{phase="tool",task="slow",le="+Inf"} 2' in text
+    assert 'agentic_steps_total{outcome="abstain",task="slow"} 1' in text
+
+
+def test_hooks_fire_in_order_and_profiler_dumps_pstats(tmp_path, slow_tool):
+    import pstats
+
+    calls = []
+
+    class Recorder(ag.Hook):
+        def on_run_start(self, orch, plan):
+            calls.append(("run_start", len(plan)))
+
+        def on_step_start(self, orch, st):
+            calls.append(("step_start", st["task"]))
+
+        def on_tool_return(self, orch, st, out, err):
+            calls.append(("tool_return", out["ok"]))
+
+        def on_verify(self, orch, st, out):
+            calls.append(("verify", out["ok"]))
+
+        def on_step_end(self, orch, st, outcome):
+            calls.append(("step_end", outcome))
+
+        def on_run_end(self, orch, result):
+            calls.append(("run_end", result["done"]))
+
+    prof = ag.ProfilerHook(["summarize"], str(tmp_path / "prof"))
+    policy = Policy(["slow", "summarize"], max_steps=8)
+    plan = [{"task": "slow", "args": {"sec": 0}}, {"task": "summarize", "args": {"text": "a b c"}}]
+    audit = Audit(path=str(tmp_path / "a.jsonl"))
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), audit, hooks=[Recorder(), prof]).run(plan)
+
+    assert calls[0] == ("run_start", 2) and calls[-1] == ("run_end", 2)
+    assert calls[1:5] == [("step_start", "slow"), ("tool_return", True), ("verify", True), ("step_end", "success")]
+    assert len(res["profiles"]) == 1 and res["profiles"][0].endswith("_summarize.pstats")
+    stats = pstats.Stats(res["profiles"][0])
+    assert any(fn[2] == "t_summarize" for fn in stats.stats)
+
+
+def test_profiler_lock_is_released_when_on_tool_return_is_skipped(tmp_path, slow_tool, monkeypatch):
+    def interrupt(args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setitem(ag.TOOLS, "interrupt", interrupt)
+    prof = ag.ProfilerHook(["interrupt", "slow"], str(tmp_path / "prof"))
+    with pytest.raises(KeyboardInterrupt):
+        Orchestrator(Policy(["interrupt"]), Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl")),
+                     hooks=[prof]).run([{"task": "interrupt", "args": {}}])
+    assert not ag.ProfilerHook._active.locked() and not prof._profiles
+
+    # an abandoned step never gets on_tool_return; on_step_end cleans up instead
+    Orchestrator(Policy(["slow"], max_sec=0.1), Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "b.jsonl")),
+                 hooks=[prof]).run([{"task": "slow", "args": {"sec": 0.3}}])
+    assert not ag.ProfilerHook._active.locked() and not prof._profiles
+    time.sleep(0.3)
+
+
+def test_span_recorder_writes_chrome_trace_with_track_per_concurrent_step(tmp_path, slow_tool):
+    policy = Policy(["slow"], max_steps=8, max_parallel=2)
+    plan = [{"id": "a", "task": "slow", "args": {"sec": 0.05}}, {"id": "b", "task": "slow", "args": {"sec": 0.05}}]
+    audit = Audit(path=str(tmp_path / "a.jsonl"))
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), audit, span_dir=str(tmp_path)).run(plan)
+    assert res["trace_file"] == str(tmp_path / f"trace_{res['trace']}.json")
+
+    doc = json.loads(pathlib.Path(res["trace_file"]).read_text(encoding="utf-8"))
+    assert doc["otherData"]["trace"] == res["trace"]
+    spans = [e for e in doc["traceEvents"] if e["ph"] == "X"]
+    names = {e["name"] for e in spans}
+    assert {"run", "step slow", "tool slow", "verify", "audit.write", "audit.fsync"} <= names
+    steps = [e for e in spans if e["name"] == "step slow"]
+    assert len({e["tid"] for e in steps}) == 2
+    run = next(e for e in spans if e["name"] == "run")
+    assert all(run["ts"] <= e["ts"] and e["ts"] + e["dur"] <= run["ts"] + run["dur"] + 1 for e in spans)
+    assert ag._SPANS.get() is None
+
+
+def test_span_tracks_for_concurrent_async_steps(tmp_path, monkeypatch):
+    async def aslow(args):
+        await asyncio.sleep(0.05)
+        return {"ok": True, "result": 1, "evidence": {"coverage": 0.9, "sources": ["a", "b"]}}
+
+    monkeypatch.setitem(ag.TOOLS, "aslow", None)
+    monkeypatch.setitem(ag.ATOOLS, "aslow", None)
+    ag.register_tool("aslow", aslow)
+
+    policy = Policy(["aslow"], max_steps=8, max_parallel=3)
+    orch = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl")), span_dir=str(tmp_path))
+    res = asyncio.run(orch.arun([{"task": "aslow"} for _ in range(3)]))
+    doc = json.loads(pathlib.Path(res["trace_file"]).read_text(encoding="utf-8"))
+    tools = [e for e in doc["traceEvents"] if e["ph"] == "X" and e["name"] == "tool aslow"]
+    assert len(tools) == 3 and len({e["tid"] for e in tools}) == 3
+    labels = {e["args"]["name"] for e in doc["traceEvents"] if e["ph"] == "M"}
+    assert {"step 0", "step 1", "step 2"} <= labels
+
+
+def test_memory_mode_reports_step_peaks_and_top_sites(tmp_path, monkeypatch):
+    import tracemalloc
+
+    keep = []
+
+    def hog(args):
+        blob = bytearray(args["n"])  # transient peak
+        keep.append(b"x" * (args["n"] // 4))  # retained
+        del blob
+        return {"ok": True, "result": 1, "evidence": {"coverage": 0.9, "sources": ["a", "b"]},
+                "meta": {"response_bytes": 123}}
+
+    monkeypatch.setitem(ag.TOOLS, "hog", hog)
+    policy = Policy(["hog"], max_steps=4)
+    audit = Audit(path=str(tmp_path / "a.jsonl"))
+    orch = Orchestrator(policy, Verifier(True, 0.75, 2), audit, memory=True, memory_top=3)
+    res = orch.run([{"task": "hog", "args": {"n": 4_000_000}}])
+    assert not tracemalloc.is_tracing()
+
+    evs = _events(res)
+    mem = next(e["details"]["memory"] for e in evs if e["type"] == "success")
+    assert mem["peak_bytes"] >= 4_000_000
+    assert 1_000_000 <= mem["net_bytes"] < 4_000_000
+    assert mem["response_bytes"] == 123 and "overlap" not in mem
+
+    end = evs[-1]["details"]["memory"]
+    assert res["memory"] == end
+    assert end["max_step_peak_bytes"] == mem["peak_bytes"] and end["response_bytes"] == 123
+    assert len(end["top"]) == 3 and end["top"][0]["size_bytes"] >= 1_000_000
+    assert "test_orchestrator.py" in end["top"][0]["site"]
+
+
+def test_run_deadline_cuts_off_in_flight_steps(tmp_path, slow_tool, monkeypatch):
+    import sys
+
+    hang = tmp_path / "hang.py"
+    hang.write_text("import time; time.sleep(60)\n", encoding="utf-8")
+    for reg in (ag.PLUGINS, ag.TOOLS, ag.ATOOLS):
+        monkeypatch.setitem(reg, "hangp", None)
+    plugin = ag.AsyncLegacySubprocess("hangp", [sys.executable, str(hang)], timeout=30.0)
+    monkeypatch.setitem(ag.PLUGINS, "hangp", plugin)
+    ag._register_plugin_tool("hangp")
+
+    policy = Policy(["slow", "hangp"], max_steps=8, max_sec=0.3)
+    plan = [{"task": "slow", "args": {"sec": 0.1}}, {"task": "slow", "args": {"sec": 5}}, {"task": "slow", "args": {"sec": 0}}]
+    t0 = time.perf_counter()
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "a.jsonl"))).run(plan)
+    assert time.perf_counter() - t0 < 1.0
+    assert res["done"] == 1
+    evs = _events(res)
+    closed = [e["details"] for e in evs if e["type"] == "fail_closed"]
+    assert closed == [{"reason": "time budget", "task": "slow", "in_flight": True}]
+    assert [e["type"] for e in evs].count("step.start") == 2
+
+    # plugin timeout becomes min(configured, remaining), sync and async
+    plan = [{"task": "hangp", "args": {"op": "x"}}]
+    for n, runner in enumerate((lambda o: o.run(plan), lambda o: asyncio.run(o.arun(plan)))):
+        orch = Orchestrator(policy.copy(), Verifier(True, 0.75, 2), Audit(path=str(tmp_path / f"b{n}.jsonl")))
+        t0 = time.perf_counter()
+        res = runner(orch)
+        assert time.perf_counter() - t0 < 1.5
+        assert [e["details"] for e in _events(res) if e["type"] == "fail_closed"] == [
+            {"reason": "time budget", "task": "hangp", "in_flight": True}]
+    assert ag._DEADLINE.get() is None
+
+
+def test_abandoned_steps_reuse_pool_threads_and_stay_silent(tmp_path, slow_tool):
+    class Recorder(ag.Hook):
+        def __init__(self):
+            self.events = []
+
+        def on_tool_return(self, orch, st, out, err):
+            self.events.append(("tool_return", st["args"].get("sec")))
+
+        def on_verify(self, orch, st, out):
+            self.events.append(("verify", st["args"].get("sec")))
+
+        def on_run_end(self, orch, result):
+            self.events.append(("run_end", None))
+
+    plan = [{"task": "slow", "args": {"sec": 0}}, {"task": "slow", "args": {"sec": 0.3}}]
+    threads = ag._TOOL_POOL.threads
+    for n, runner in enumerate((lambda o: o.run(plan), lambda o: asyncio.run(o.arun(plan)))):
+        hook = Recorder()
+        orch = Orchestrator(Policy(["slow"], max_steps=8, max_sec=0.15), Verifier(True, 0.75, 2),
+                            Audit(path=str(tmp_path / f"a{n}.jsonl")), hooks=[hook], memory=True)
+        res = runner(orch)
+        assert res["done"] == 1
+        time.sleep(0.3)  # the abandoned tool finishes after the run ended
+        assert hook.events == [("tool_return", 0), ("verify", 0), ("run_end", None)]
+        assert ag._TM_STATE["inflight"] == 0
+    assert ag._TOOL_POOL.threads - threads <= 2  # threads are reused, not one per step
+
+
+def test_rate_limits_wait_fail_closed_and_share(tmp_path, slow_tool, monkeypatch):
+    monkeypatch.setattr(ag, "_RATE_BUCKETS", {})
+    plan = [{"task": "slow", "args": {"sec": 0, "msg": n}} for n in range(4)]
+
+    waiting = Policy(["slow"], max_steps=8, rate_limits={"slow": {"rate": 20, "burst": 2}})
+    t0 = time.perf_counter()
+    res = Orchestrator(waiting, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "w.jsonl"))).run(plan)
+    assert res["done"] == 4 and time.perf_counter() - t0 >= 0.09
+    waits = [e["details"]["timing"].get("rate_wait_ms", 0) for e in _events(res) if e["type"] == "success"]
+    assert waits[:2] == [0, 0] and all(0 < w <= 60 for w in waits[2:])  # 20/s after a burst of 2
+
+    # copies (batch mode, concurrent orchestrators) share the bucket; fail_closed does not wait
+    strict = Policy(["slow"], max_steps=8, rate_limits={"slow": {"rate": 1, "burst": 2, "on_limit": "fail_closed"}})
+    res = Orchestrator(strict.copy(), Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "f.jsonl"))).run(plan[:1])
+    assert res["done"] == 1
+    res = Orchestrator(strict.copy(), Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "g.jsonl"))).run(plan)
+    assert res["done"] == 1
+    assert [e["details"] for e in _events(res) if e["type"] == "fail_closed"][0] == {"reason": "rate limit", "task": "slow"}
+
+    # host-wide: separate buckets on one sqlite file draw from the same tokens
+    db = str(tmp_path / "rate.db")
+    a, b = ag.SqliteTokenBucket(db, "meta", 1, 3), ag.SqliteTokenBucket(db, "meta", 1, 3)
+    assert [a.take(0), b.take(0), a.take(0), b.take(0)] == [0.0, 0.0, 0.0, None]
+
+
+def test_batch_plugins_groups_steps_into_round_trips(tmp_path, monkeypatch):
+    class Counting(ag.AsyncPlugin):
+        def __init__(self):
+            super().__init__("cnt")
+            self.trips = []
+
+        def run(self, op, params):
+            return self.run_batch([(op, params)])[0]
+
+        def run_batch(self, calls):
+            self.trips.append(len(calls))
+            return [self._normalize({"ok": True, "result": p.get("n"), "evidence": {"coverage": 0.9, "sources": ["a", "b"]}})
+                    for _, p in calls]
+
+        async def arun_batch(self, calls):
+            return self.run_batch(calls)
+
+    plugin = Counting()
+    for reg in (ag.PLUGINS, ag.TOOLS, ag.ATOOLS, ag.BATCH_TOOLS, ag.ABATCH_TOOLS):
+        monkeypatch.setitem(reg, "cnt", None)
+    monkeypatch.setitem(ag.PLUGINS, "cnt", plugin)
+    ag._register_plugin_tool("cnt")
+
+    plan = [{"task": "cnt", "args": {"op": "q", "n": n}} for n in range(5)]
+    plan.insert(3, {"task": "echo", "args": {"msg": "between"}})
+    policy = Policy(["cnt", "echo"], max_steps=16)
+    res = Orchestrator(policy, Verifier(True, 0.75, 2), Audit(path=str(tmp_path / "s.jsonl")),
+                       batch_plugins=True, max_batch=2).run(plan)
+    assert res["done"] == 6 and plugin.trips == [2, 1, 2]
+    evs = _events(res)
+    assert [e["details"]["result"] for e in evs if e["type"] == "success"] == ["0", "1", "2", '"between"', "3", "4"]
+    tool_ms = [e["details"]["timing"]["tool_ms"] for e in evs if e["type"] == "success"]
+    assert tool_ms[0] == tool_ms[1]  # one shared round trip
+
+    # DAG: ready steps share one slot and one round trip, sync and async
+    policy = Policy(["cnt"], max_steps=16, max_parallel=2)
+    plan = [{"task": "cnt", "args": {"op": "q", "n": n}} for n in range(8)]
+    for n, runner in enumerate((lambda o: o.run(plan), lambda o: asyncio.run(o.arun(plan)))):
+        plugin.trips.clear()
+        orch = Orchestrator(policy.copy(), Verifier(True, 0.75, 2), Audit(path=str(tmp_path / f"d{n}.jsonl")),
+                            batch_plugins=True)
+        res = runner(orch)
+        assert res["done"] == 8 and plugin.trips == [8]
+        assert sorted(e["details"]["id"] for e in _events(res) if e["type"] == "step.end") == sorted(str(i) for i in range(8))
@@ -0,0 +1,535 @@
+"""
+Tests for the plugin adapters against the local legacy_agentic.py and meta_stub.py.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import agentic2_micro_plugin as ag
+import meta_stub
+from agentic2_micro_plugin import AsyncLegacySubprocess, AsyncMetaHTTP, AsyncPlugin, LegacySubprocess, MetaHTTP
+
+LEGACY = [sys.executable, "legacy_agentic.py"]
+
+
+def test_legacy_pooled_reuses_and_recycles_workers():
+    p = LegacySubprocess("legacy", LEGACY, timeout=10.0, mode="pooled", pool_size=1, max_requests=2)
+    try:
+        for i in range(3):
+            out = p.run("echo", {"msg": f"hi {i}"})
+            assert out["ok"] and out["result"] == f"hi {i}"
+            assert out["evidence"]["sources"] == ["legacy", "echo"]
+            assert out["meta"]["response_bytes"] > 0
+        assert p.spawned == 2  # recycled after 2 requests
+        assert p.run("nope", {})["reasons"] == ["unknown op: nope"]
+    finally:
+        p.close()
+
+
+def test_legacy_pooled_timeout_and_crash_respawn(tmp_path):
+    script = tmp_path / "w.py"
+    script.write_text(
+        "import sys, json, time\n"
+        "for line in sys.stdin:\n"
+        "    op = json.loads(line)['op']\n"
+        "    if op == 'hang': time.sleep(60)\n"
+        "    if op == 'crash': sys.exit(3)\n"
+        "    print(json.dumps({'ok': True, 'result': op}), flush=True)\n",
+        encoding="utf-8",
+    )
+    p = LegacySubprocess("w", [sys.executable, str(script)], timeout=0.5, mode="pooled", pool_size=1)
+    try:
+        assert p.run("hang", {})["reasons"] == ["timeout"]
+        assert p.run("crash", {})["reasons"] == ["worker_exit:3"]
+        out = p.run("fine", {})
+        assert out["ok"] and out["result"] == "fine" and out["evidence"]["sources"] == ["w"]
+        assert p.spawned == 3
+    finally:
+        p.close()
+
+
+def test_legacy_pooled_kills_worker_after_bad_output(tmp_path):
+    script = tmp_path / "g.py"
+    script.write_text(
+        "import sys, json\n"
+        "for line in sys.stdin:\n"
+        "    op = json.loads(line)['op']\n"
+        "    if op == 'garbage': print('debug: oops', flush=True)\n"
+        "    if op == 'list': print('[1]', flush=True)\n"
+        "    print(json.dumps({'ok': True, 'result': op}), flush=True)\n",
+        encoding="utf-8",
+    )
+    p = LegacySubprocess("g", [sys.executable, str(script)], timeout=5.0, mode="pooled", pool_size=1)
+    try:
+        assert p.run("garbage", {})["reasons"][0] == "bad_json:JSONDecodeError"
+        assert p.run("fine", {})["result"] == "fine"  # not the stale line from the previous request
+        assert p.run("list", {})["reasons"][0] == "bad_json:not_object"
+        assert p.run("again", {})["result"] == "again"
+        assert p.spawned == 3
+    finally:
+        p.close()
+
+
+@pytest.fixture
+def meta_server():
+    httpd = meta_stub.make_server("127.0.0.1", 0)
+    t = threading.Thread(target=httpd.serve_forever, daemon=True)
+    t.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_meta_http_reuses_keepalive_connection(meta_server):
+    m = MetaHTTP("meta", meta_server, timeout=5.0, max_connections=2)
+    try:
+        for i in range(5):
+            out = m.run("echo", {"msg": f"m{i}"})
+            assert out["ok"] and out["result"] == f"m{i}"
+        assert m.run("nope", {})["reasons"] == ["http_4xx:400"]
+        assert m.pool.created == 1
+    finally:
+        m.close()
+
+
+def test_meta_http_evicts_idle_and_dead_connections(meta_server):
+    m = MetaHTTP("meta", meta_server, timeout=5.0, idle_timeout=0.0)
+    try:
+        assert m.run("health", {})["ok"]
+        assert m.run("health", {})["ok"]
+        assert m.pool.created == 2  # idle_timeout=0 => no reuse
+    finally:
+        m.close()
+    dead = MetaHTTP("meta", "http://127.0.0.1:9", timeout=1.0)
+    assert dead.run("health", {})["reasons"] == ["network_error"]
+
+
+def test_meta_http_replaces_keepalive_connection_closed_by_server(monkeypatch):
+    class ClosesAfterReply(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # advertises keep-alive, then hangs up anyway
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({"ok": True, "result": "x"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ClosesAfterReply)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        # health check: the idle socket is readable (EOF), so it is evicted before reuse
+        m = MetaHTTP("meta", url, timeout=5.0)
+        assert m.run("x", {})["ok"]
+        time.sleep(0.1)
+        assert m.pool._idle and m.run("x", {})["ok"]
+        assert m.pool.created == 2
+        m.close()
+
+        # stale socket that passes the health check: one retry on a fresh connection
+        m = MetaHTTP("meta", url, timeout=5.0)
+        monkeypatch.setattr(ag._HTTPPool, "_alive", staticmethod(lambda conn: conn.sock is not None))
+        assert m.run("x", {})["ok"]
+        time.sleep(0.1)
+        assert m.run("x", {})["ok"]
+        assert m.pool.created == 2
+        m.close()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_meta_http_hedges_slow_request(meta_server):
+    m = MetaHTTP("meta", meta_server, timeout=5.0, hedge=True, hedge_min_samples=1, hedge_min_ms=20.0)
+    try:
+        assert "hedged" not in m.run("health", {}).get("meta", {})  # primes the latency window
+        post, calls = m.pool.post, []
+
+        def slow_first(body, hdrs, timeout):
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+            return post(body, hdrs, timeout)
+
+        m.pool.post = slow_first
+        t0 = time.monotonic()
+        out = m.run("echo", {"msg": "h"})
+        assert out["ok"] and out["result"] == "h"
+        assert out["meta"]["hedged"] and out["meta"]["hedge_won"] is True
+        assert time.monotonic() - t0 < 0.4 and len(calls) == 2
+    finally:
+        m.close()
+
+
+def test_meta_http_circuit_breaker_opens_and_half_opens(monkeypatch):
+    monkeypatch.setattr(ag, "_BREAKERS", {})
+    m = MetaHTTP("meta", "http://127.0.0.1:9", timeout=1.0, circuit_threshold=2, circuit_cooldown=0.2)
+    assert [m.run("health", {})["reasons"] for _ in range(3)] == [["network_error"], ["network_error"], ["circuit_open"]]
+    assert m.breaker.state == "open"
+    time.sleep(0.25)
+    assert m.run("health", {})["reasons"] == ["network_error"]  # half_open probe fails
+    assert m.breaker.state == "open" and m.run("health", {})["reasons"] == ["circuit_open"]
+    m.breaker.record(True)
+    assert m.breaker.state == "closed"
+
+
+def test_circuit_probe_is_released_when_the_run_deadline_ends_it(monkeypatch):
+    monkeypatch.setattr(ag, "_BREAKERS", {})
+    m = MetaHTTP("meta", "http://127.0.0.1:9", timeout=5.0, circuit_threshold=1, circuit_cooldown=0.0)
+    m.breaker.record(False)  # open; cooldown 0 => the next call is the half_open probe
+
+    def hang(body, hdrs, timeout):
+        raise socket.timeout()
+
+    m.pool.post = hang
+    tok = ag._DEADLINE.set(time.monotonic() + 0.1)
+    try:
+        assert m.run("health", {})["reasons"] == ["deadline_exceeded"]
+    finally:
+        ag._DEADLINE.reset(tok)
+    assert m.breaker.state == "half_open" and m.breaker.available()  # no verdict, probe slot free again
+    assert m.run("health", {})["reasons"] == ["network_error"]  # a real failure re-opens it
+    assert m.breaker.state == "open"
+
+
+def test_meta_http_balances_ejects_and_probes(meta_server, monkeypatch):
+    monkeypatch.setattr(ag, "_BREAKERS", {})
+    other = meta_stub.make_server("127.0.0.1", 0)
+    threading.Thread(target=other.serve_forever, daemon=True).start()
+    second = f"http://127.0.0.1:{other.server_address[1]}"
+    dead = "http://127.0.0.1:9"
+    try:
+        rr = MetaHTTP("meta", [meta_server, second], timeout=5.0)
+        picked = [rr.run("echo", {"msg": "x"})["evidence"]["endpoint"] for _ in range(4)]
+        assert picked == [meta_server, second, meta_server, second]
+        rr.close()
+
+        for balance in ag.LB_STRATEGIES:
+            m = MetaHTTP("meta", [dead, meta_server], timeout=1.0, balance=balance, circuit_threshold=1)
+            outs = [m.run("echo", {"msg": "x"}) for _ in range(4)]
+            assert sum(not o["ok"] for o in outs) <= 1  # dead endpoint ejected after one error
+            assert all(o["evidence"]["endpoint"] == meta_server for o in outs if o["ok"])
+            m.close()
+            ag._BREAKERS.clear()
+
+        p = MetaHTTP("meta", [meta_server, second], timeout=1.0, circuit_cooldown=60.0, health_interval=0.05)
+        for _ in range(3):
+            p.endpoints[1].breaker.record(False)
+        assert p.endpoints[1].breaker.state == "open"
+        time.sleep(0.3)
+        assert p.endpoints[1].breaker.state == "closed"  # health probe re-admitted it
+        p.close()
+    finally:
+        other.shutdown()
+        other.server_close()
+
+
+def test_batch_envelope_one_round_trip(meta_server):
+    calls = [("echo", {"msg": "a"}), ("echo", {}), ("nope", {})]
+    legacy = LegacySubprocess("legacy", LEGACY, timeout=10.0, mode="pooled", pool_size=1)
+    meta = MetaHTTP("meta", meta_server, timeout=5.0)
+    try:
+        for plugin in (legacy, meta):
+            outs = plugin.run_batch(calls)
+            assert [o["ok"] for o in outs] == [True, False, False]
+            assert outs[0]["result"] == "a" and outs[1]["reasons"] == ["empty msg"]
+            assert all(o["meta"]["batched"] == 3 for o in outs)
+        assert legacy.spawned == 1 and meta.pool.created == 1
+        assert outs[0]["evidence"]["endpoint"] == meta_server
+    finally:
+        legacy.close()
+        meta.close()
+
+
+def test_async_plugins_arun(meta_server):
+    async def go():
+        legacy = AsyncLegacySubprocess("legacy", LEGACY, timeout=10.0)
+        meta = AsyncMetaHTTP("meta", meta_server, timeout=5.0)
+        try:
+            outs = await asyncio.gather(
+                legacy.arun("echo", {"msg": "l"}),
+                *(meta.arun("echo", {"msg": f"m{i}"}) for i in range(3)),
+            )
+            again = await meta.arun("health", {})
+            bad = await meta.arun("nope", {})
+            return outs, again, bad, meta.pool.created
+        finally:
+            await meta.aclose()
+
+    outs, again, bad, created = asyncio.run(go())
+    assert [o["result"] for o in outs] == ["l", "m0", "m1", "m2"]
+    assert all(o["meta"]["response_bytes"] > 0 for o in outs)
+    assert again["ok"] and bad["reasons"] == ["http_4xx:400"]
+    assert created == 3  # three concurrent requests, then keep-alive reuse
+
+
+def test_async_legacy_timeout_kills_process(tmp_path):
+    script = tmp_path / "hang.py"
+    script.write_text("import time; time.sleep(60)\n", encoding="utf-8")
+    p = AsyncLegacySubprocess("h", [sys.executable, str(script)], timeout=0.3)
+    assert asyncio.run(p.arun("x", {}))["reasons"] == ["timeout"]
+
+
+def test_oversized_plugin_responses_fail_closed(tmp_path):
+    script = tmp_path / "big.py"
+    script.write_text(
+        "import json, sys\n"
+        "for line in iter(sys.stdin.readline, ''):\n"
+        "    n = json.loads(line)['params']['n']\n"
+        "    sys.stderr.write('e' * 10**6)\n"
+        "    print(json.dumps({'ok': True, 'result': 'x' * n}), flush=True)\n"
+        "    if '--serve' not in sys.argv:\n"
+        "        sys.exit(3 if n == 1 else 0)\n",
+        encoding="utf-8",
+    )
+    cmd = [sys.executable, str(script)]
+    kw = dict(timeout=10.0, max_response_bytes=10_000, max_stderr_bytes=100)
+
+    p = LegacySubprocess("big", cmd, **kw)
+    assert p.run("x", {"n": 200_000})["reasons"] == ["response_too_large"]
+    assert p.run("x", {"n": 100})["ok"]
+    failed = p.run("x", {"n": 1})  # nonzero exit: stderr is capped, not buffered whole
+    assert failed["reasons"][0] == "nonzero_exit:3" and len(failed["reasons"][1]) <= 101
+
+    pooled = LegacySubprocess("bigp", cmd, mode="pooled", pool_size=1, **kw)
+    try:
+        assert pooled.run("x", {"n": 200_000})["reasons"] == ["response_too_large"]
+        assert pooled.run("x", {"n": 100})["ok"]
+        assert pooled.spawned == 2  # the out-of-sync worker was killed
+    finally:
+        pooled.close()
+
+    ap = AsyncLegacySubprocess("abig", cmd, **kw)
+    assert asyncio.run(ap.arun("x", {"n": 200_000}))["reasons"] == ["response_too_large"]
+    assert asyncio.run(ap.arun("x", {"n": 100}))["ok"]
+
+
+def test_meta_http_caps_response_body():
+    class Big(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({"ok": True, "result": "x" * 50_000}).encode()
+            self.send_response(200)
+            if self.path == "/sized":
+                self.send_header("Content-Length", str(len(body)))
+            else:  # no length: body ends at EOF, so the cap applies while streaming
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Big)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    async def arun(m):
+        try:
+            return await m.arun("x", {})
+        finally:
+            await m.aclose()
+
+    try:
+        for path in ("/sized", "/stream"):
+            m = MetaHTTP("big", base + path, max_response_bytes=10_000)
+            assert m.run("x", {})["reasons"] == ["response_too_large"]
+            m.close()
+            am = AsyncMetaHTTP("abig", base + path, max_response_bytes=10_000)
+            assert asyncio.run(arun(am))["reasons"] == ["response_too_large"]
+        assert MetaHTTP("ok", base + "/stream").run("x", {})["ok"]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+class _SlowPlugin(AsyncPlugin):
+    def __init__(self, name):
+        super().__init__(name)
+        self.calls = 0
+
+    def run(self, op, params):
+        self.calls += 1
+        time.sleep(0.2)
+        return self._normalize({"ok": True, "result": {"op": op, **params}})
+
+    async def arun(self, op, params):
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        return self._normalize({"ok": True, "result": {"op": op, **params}})
+
+
+def test_singleflight_coalesces_concurrent_identical_calls(monkeypatch):
+    plugin = _SlowPlugin("slowp")
+    for reg in (ag.PLUGINS, ag.TOOLS, ag.ATOOLS):
+        monkeypatch.setitem(reg, "slowp", None)
+    monkeypatch.setitem(ag.PLUGINS, "slowp", plugin)
+    ag._register_plugin_tool("slowp", coalesce=True)
+
+    outs = []
+    threads = [threading.Thread(target=lambda: outs.append(ag.TOOLS["slowp"]({"op": "q", "params": {"x": 1}})))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert plugin.calls == 1
+    assert sorted(bool(o.get("meta", {}).get("coalesced")) for o in outs) == [False, True, True, True]
+    assert all(o["result"] == {"op": "q", "x": 1} for o in outs)
+
+    async def burst():
+        return await asyncio.gather(*(ag.ATOOLS["slowp"]({"op": "q", "params": {"x": n % 2}}) for n in range(4)))
+
+    outs = asyncio.run(burst())
+    assert plugin.calls == 3
+    assert [o["result"]["x"] for o in outs] == [0, 1, 0, 1]
+    # finished calls are not cached
+    ag.TOOLS["slowp"]({"op": "q", "params": {"x": 1}})
+    assert plugin.calls == 4
+
+
+class _DeadlinePlugin(AsyncPlugin):
+    """Takes 0.4 s; a call bounded by the run deadline gives up early with deadline_exceeded."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.calls = 0
+
+    def run(self, op, params):
+        self.calls += 1
+        timeout, bounded = ag._deadline_timeout(5.0)
+        time.sleep(min(0.4, timeout))
+        if bounded and timeout < 0.4:
+            return {"ok": False, "reasons": ["deadline_exceeded"]}
+        return self._normalize({"ok": True, "result": op})
+
+    async def arun(self, op, params):
+        self.calls += 1
+        await asyncio.sleep(0.4)  # cancelled by the run deadline
+        return self._normalize({"ok": True, "result": op})
+
+
+def _two_runs(tmp_path, name, runner):
+    """Run A (max_sec=0.2) leads a coalesced call; run B (max_sec=5) joins it shortly after."""
+    plan = [{"task": name, "args": {"op": "q"}}, {"task": name, "args": {"op": "r"}}]
+    results = {}
+
+    def go(tag, max_sec, delay):
+        time.sleep(delay)
+        orch = ag.Orchestrator(ag.Policy([name], max_steps=4, max_sec=max_sec), ag.Verifier(True, 0.75, 1),
+                               ag.Audit(path=str(tmp_path / f"{tag}.jsonl")))
+        results[tag] = runner(orch, plan)
+
+    threads = [threading.Thread(target=go, args=("a", 0.2, 0.0)), threading.Thread(target=go, args=("b", 5.0, 0.05))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_singleflight_follower_keeps_its_own_deadline(tmp_path, monkeypatch):
+    plugin = _DeadlinePlugin("dlp")
+    for reg in (ag.PLUGINS, ag.TOOLS, ag.ATOOLS):
+        monkeypatch.setitem(reg, "dlp", None)
+    monkeypatch.setitem(ag.PLUGINS, "dlp", plugin)
+    ag._register_plugin_tool("dlp", coalesce=True)
+
+    res = _two_runs(tmp_path, "dlp", lambda orch, plan: orch.run(plan))
+    assert res["a"]["done"] == 0
+    assert res["b"]["done"] == 2  # retried as leader instead of copying A's deadline_exceeded
+    lines = (tmp_path / "b.jsonl").read_text(encoding="utf-8")
+    assert '"fail_closed"' not in lines
+
+
+def test_singleflight_follower_survives_cancelled_leader(tmp_path, monkeypatch):
+    plugin = _DeadlinePlugin("dlpa")
+    for reg in (ag.PLUGINS, ag.TOOLS, ag.ATOOLS):
+        monkeypatch.setitem(reg, "dlpa", None)
+    monkeypatch.setitem(ag.PLUGINS, "dlpa", plugin)
+    ag._register_plugin_tool("dlpa", coalesce=True)
+    plan = [{"task": "dlpa", "args": {"op": "q"}}]
+
+    async def run(tag, max_sec, delay):
+        await asyncio.sleep(delay)
+        orch = ag.Orchestrator(ag.Policy(["dlpa"], max_steps=4, max_sec=max_sec), ag.Verifier(True, 0.75, 1),
+                               ag.Audit(path=str(tmp_path / f"{tag}.jsonl")))
+        return await orch.arun(plan)
+
+    async def both():  # one event loop, so B coalesces onto A's call
+        return await asyncio.gather(run("a", 0.2, 0.0), run("b", 5.0, 0.05))
+
+    a, b = asyncio.run(both())
+    assert a["done"] == 0
+    assert b["done"] == 1 and plugin.calls == 2  # B re-ran the call after A's leader was cancelled
+
+
+def test_adaptive_limiter_queues_sheds_and_adapts(monkeypatch):
+    plugin = _SlowPlugin("limp")
+    for reg in (ag.PLUGINS, ag.TOOLS, ag.ATOOLS, ag.LIMITERS):
+        monkeypatch.setitem(reg, "limp", None)
+    monkeypatch.setitem(ag.PLUGINS, "limp", plugin)
+    lim = ag._AdaptiveLimiter("limp", initial=1, max_limit=4, max_queue=1, queue_timeout=2.0)
+    monkeypatch.setitem(ag.LIMITERS, "limp", lim)
+    ag._register_plugin_tool("limp")
+
+    outs = []
+    threads = [threading.Thread(target=lambda n=n: outs.append(ag.TOOLS["limp"]({"op": "q", "params": {"n": n}})))
+               for n in range(3)]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    for t in threads:
+        t.join()
+    assert sorted(o["reasons"][0] if not o["ok"] else "ok" for o in outs) == ["ok", "ok", "shed"]
+    assert [o["meta"]["queued_ms"] > 100 for o in outs if o["ok"] and "meta" in o] == [True]
+    assert lim.rejected == 1 and lim.inflight == 0
+
+    async def burst():
+        return await asyncio.gather(*(ag.ATOOLS["limp"]({"op": "q", "params": {"n": n}}) for n in range(3)))
+
+    assert int(lim.limit) == 2  # latency stayed flat: additive increase
+    outs = asyncio.run(burst())
+    assert all(o["ok"] for o in outs) and lim.inflight == 0
+    assert sum("queued_ms" in o.get("meta", {}) for o in outs) == 1
+
+    for _ in range(3):
+        lim.acquire()
+    limit = lim.limit
+    for _ in range(3):
+        lim.release(10.0, False)  # timeouts shrink the limit, once per latency window
+    assert lim.limit == pytest.approx(limit * 0.9) and lim.inflight == 0
+    time.sleep(max(lim.ewma, 10.0) / 1000 + 0.01)
+    lim.acquire()
+    lim.release(10.0, False)  # next window: another multiplicative decrease
+    assert lim.limit == pytest.approx(limit * 0.81)
+    gauges = {g["name"]: g["value"] for g in ag.METRICS.snapshot()["gauges"] if g["labels"] == {"plugin": "limp"}}
+    assert gauges["agentic_plugin_concurrency_limit"] == int(lim.limit) and gauges["agentic_plugin_queue_depth"] == 0
+
+
+def test_limiter_signal_ignores_client_errors():
+    sig = ag._AdaptiveLimiter.signal
+    m = MetaHTTP("meta", "http://127.0.0.1:9")
+    try:
+        assert m._parse(404, b"")["reasons"] == ["http_4xx:404"]
+        assert sig(m._parse(404, b"")) is True  # caller's fault, not an overloaded backend
+        assert sig(m._parse(429, b"")) is False and sig(m._parse(503, b"")) is False
+    finally:
+        m.close()
@@ -0,0 +1,51 @@
+"""
+Tests for verify_audits.py: parallel verification with per-key HMAC resolution.
+"""
+
+from __future__ import annotations
+
+import json
+
+import verify_audits
+from agentic2_micro_plugin import Audit, key_id_for
+
+KEY = "ab" * 32
+
+
+def _audit(path, key_hex=None, n=5):
+    a = Audit(path=str(path), key_hex=key_hex)
+    for i in range(n):
+        a.log("step.start", {"i": i})
+    a.close()
+
+
+def test_verify_many_plain_hmac_broken_and_skipped(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("KEYS_JSON", raising=False)
+    _audit(tmp_path / "audit_plain.jsonl")
+    _audit(tmp_path / "audit_hmac.jsonl", key_hex=KEY)
+    _audit(tmp_path / "audit_nokey.jsonl", key_hex="cd" * 32)
+    _audit(tmp_path / "audit_broken.jsonl", n=3)
+    broken = tmp_path / "audit_broken.jsonl"
+    broken.write_text(broken.read_text(encoding="utf-8").replace('"i":1', '"i":2'), encoding="utf-8")
+
+    (tmp_path / "keys").mkdir()
+    (tmp_path / "keys" / f"{key_id_for(KEY)}.key").write_text(KEY + "\n", encoding="utf-8")
+
+    rc = verify_audits.main(["--workers", "2"])
+    report = json.loads(capsys.readouterr().out)
+
+    assert rc == 1
+    assert (report["files"], report["ok"], report["broken"], report["skipped_no_key"]) == (4, 2, 1, 1)
+    by_name = {r["file"]: r for r in report["results"]}
+    assert by_name["audit_hmac.jsonl"]["status"] == "ok"
+    assert by_name["audit_hmac.jsonl"]["events"] == 5
+    assert by_name["audit_broken.jsonl"]["break_index"] == 1
+    assert report["events_per_sec"] > 0 and report["mb_per_sec"] >= 0
+
+
+def test_keys_json_env_is_used(tmp_path, monkeypatch):
+    path = tmp_path / "audit_hmac.jsonl"
+    _audit(path, key_hex=KEY)
+    monkeypatch.setenv("KEYS_JSON", json.dumps({key_id_for(KEY): KEY}))
+    assert verify_audits.verify_file(str(path), keys_dir=str(tmp_path / "nokeys"))["status"] == "ok"
@@ -8,11 +8,11 @@ These helpers are intentionally conservative:
 
 from __future__ import annotations
 
-import json
-import os
 import pathlib
 from typing import Dict, Iterable, List, Optional, Set, Tuple
 
+from agentic2_micro_plugin import audit_key_id, keys_from_env, resolve_key
+
 from .utils_audit import iter_audit_paths, read_lines, first_key_id
 
 
@@ -55,21 +55,7 @@ def parse_keys_json_env() -> Dict[str, str]:
 
     Returns an empty dict if the variable is not set or invalid.
     """
-    raw = os.environ.get("KEYS_JSON")
-    if not raw:
-        return {}
-    try:
-        data = json.loads(raw)
-    except Exception:
-        return {}
-    if not isinstance(data, dict):
-        return {}
-    # Keep only string-to-string mappings
-    return {
-        str(k): str(v)
-        for k, v in data.items()
-        if isinstance(k, str) and isinstance(v, str)
-    }
+    return keys_from_env()
 
 
 def keys_dir_candidates(base: str = "keys") -> Iterable[Tuple[str, pathlib.Path]]:
@@ -84,3 +70,11 @@ def keys_dir_candidates(base: str = "keys") -> Iterable[Tuple[str, pathlib.Path]
         key_id = p.stem
         out.append((key_id, p))
     return out
+
+
+def key_for_audit(path: pathlib.Path, base: str = "keys") -> Optional[str]:
+    """
+    Return the hex key for the audit's key_id (KEYS_JSON first, then <base>/<key_id>.key),
+    or None for plain SHA audits and for HMAC audits whose key is not available.
+    """
+    return resolve_key(audit_key_id(path), base=base)
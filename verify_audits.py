@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Parallel audit-chain verification for Open Agentic 2.0.
+
+- Verifies many audit_*.jsonl files at once on a ProcessPoolExecutor
+- Resolves each file's HMAC key from its key_id via KEYS_JSON or keys/<key_id>.key
+- Verifies plain SHA-256 and HMAC chains; HMAC audits without a key are reported as skipped
+- Prints a JSON report with per-file results and throughput (events/sec, MB/sec)
+- Exits with status 1 if any chain is broken
+
+Usage:
+    python verify_audits.py                       # audit_*.jsonl in the current directory
+    python verify_audits.py 'audits/**/*.jsonl' --workers 16 --out report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from agentic2_micro_plugin import KEYS_DIR, Audit, audit_key_id, resolve_key
+
+
+def verify_file(path: str, keys_dir: str = KEYS_DIR) -> Dict[str, Any]:
+    """
+    Verify one audit file. Runs inside a worker process.
+    """
+    t0 = time.perf_counter()
+    out: Dict[str, Any] = {"file": path, "key_id": None, "status": "ok", "events": 0}
+    try:
+        out["bytes"] = os.path.getsize(path)
+        key_id = audit_key_id(path)
+        out["key_id"] = key_id
+        key_hex = resolve_key(key_id, base=keys_dir)
+        if key_id and key_hex is None:
+            out["status"] = "skipped_no_key"
+        else:
+            report = Audit.verify_chain(path, key_hex=key_hex)
+            out["events"] = report["events"]
+            if not report["ok"]:
+                out.update({"status": "broken", "break_index": report["break_index"],
+                            "break_offset": report["break_offset"]})
+    except OSError as e:
+        out.update({"status": "error", "error": f"{type(e).__name__}: {e}", "bytes": 0})
+    out["seconds"] = round(time.perf_counter() - t0, 6)
+    return out
+
+
+def _verify_one(args: tuple) -> Dict[str, Any]:
+    return verify_file(*args)
+
+
+def verify_many(paths: List[str], workers: Optional[int] = None, keys_dir: str = KEYS_DIR) -> Dict[str, Any]:
+    """
+    Verify all paths and return the aggregated report.
+    """
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    jobs = [(p, keys_dir) for p in paths]
+    if workers > 1 and len(paths) > 1:
+        chunksize = max(1, len(paths) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_verify_one, jobs, chunksize=chunksize))
+    else:
+        results = [_verify_one(j) for j in jobs]
+    wall = time.perf_counter() - t0
+
+    counts = {"ok": 0, "broken": 0, "skipped_no_key": 0, "error": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    events = sum(r["events"] for r in results)
+    size = sum(r["bytes"] for r in results)
+    return {
+        "files": len(results),
+        **counts,
+        "events": events,
+        "bytes": size,
+        "workers": workers,
+        "seconds": round(wall, 6),
+        "events_per_sec": round(events / wall, 1) if wall > 0 else None,
+        "mb_per_sec": round(size / wall / 1e6, 3) if wall > 0 else None,
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Verify audit hash chains in parallel.")
+    ap.add_argument("patterns", nargs="*", default=["audit_*.jsonl"], help="glob patterns (default: audit_*.jsonl)")
+    ap.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("--keys-dir", default=KEYS_DIR, help="directory with <key_id>.key files")
+    ap.add_argument("--out", default=None, help="write the JSON report here instead of stdout")
+    args = ap.parse_args(argv)
+
+    paths = sorted({p for pat in args.patterns for p in glob.glob(pat, recursive=True)})
+    report = verify_many(paths, workers=args.workers, keys_dir=args.keys_dir)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report["broken"] or report["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())